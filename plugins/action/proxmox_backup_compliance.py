@@ -0,0 +1,12 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.modules import proxmox_backup_compliance
+from ansible_collections.mcfitz2.proxmox_backup.plugins.plugin_utils.controller import ProxmoxActionBase
+
+
+class ActionModule(ProxmoxActionBase):
+    MODULE = proxmox_backup_compliance
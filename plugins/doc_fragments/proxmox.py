@@ -0,0 +1,207 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+
+class ModuleDocFragment(object):
+
+    DOCUMENTATION = r'''
+options:
+    api_host:
+        description:
+        - Specify the target host of the Proxmox VE cluster.
+        type: str
+        required: true
+    api_port:
+        description:
+        - Specify the target port of the Proxmox VE cluster.
+        - Uses the E(PROXMOX_PORT) environment variable if not specified.
+        type: int
+        required: false
+        default: 8006
+    api_user:
+        description:
+        - Specify the user to authenticate with.
+        type: str
+        required: true
+    api_password:
+        description:
+        - Specify the password to authenticate with.
+        - You can use E(PROXMOX_PASSWORD) environment variable.
+        - One of O(api_password) or O(api_token_id) is required.
+        type: str
+        required: false
+    api_token_id:
+        description:
+        - Specify the token ID (without the C(user@realm!) prefix) to authenticate with an API token.
+        - API tokens do not need a login, so no ticket is requested or cached.
+        type: str
+        required: false
+    api_token_secret:
+        description:
+        - Specify the secret of the API token given in O(api_token_id).
+        type: str
+        required: false
+    verify_ssl:
+        description:
+        - If V(false), SSL certificates will not be validated.
+        - This should only be used on personally controlled sites using self-signed certificates.
+        type: bool
+        default: true
+    run_on_controller:
+        description:
+        - If V(true), the action plugin runs the module inside the Ansible worker process on the controller
+          instead of transferring it to the target host, so the controller must be able to reach O(api_host).
+        - This skips starting a new Python interpreter and re-importing Ansible and proxmoxer for every task,
+          and keeps the HTTPS keep-alive connection to the API open across loop items.
+        type: bool
+        required: false
+        default: false
+    ticket_cache:
+        description:
+        - If V(true), the authentication ticket and CSRF token obtained with O(api_password) are cached
+          on disk and reused by later tasks for the same host and user instead of logging in again.
+        - Cached tickets are renewed before they expire and evicted when Proxmox rejects them.
+        - Cache files are only readable by the user running the module (mode C(0600)).
+        type: bool
+        required: false
+        default: false
+    ticket_cache_dir:
+        description:
+        - Directory for the ticket cache.
+        - Defaults to C(mcfitz2.proxmox_backup) under E(XDG_CACHE_HOME) or C(~/.cache).
+        type: path
+        required: false
+    api_client:
+        description:
+        - HTTP client used to talk to the API.
+        - V(proxmoxer) uses the proxmoxer library and requests.
+        - V(direct) uses a small client built into the collection on the Python standard library, with the same
+          authentication, ticket cache, timeouts, retries and circuit breaker. It does not need proxmoxer, and it
+          saves the time to import requests, which is most of the start-up time of a short task.
+        type: str
+        required: false
+        default: proxmoxer
+        choices: [proxmoxer, direct]
+    api_timeouts:
+        description:
+        - Connect timeout and read timeouts in seconds per kind of API call.
+        - Read timeouts that are not set use the timeout of the module, or 5 seconds.
+        type: dict
+        required: false
+        suboptions:
+            connect:
+                description: Timeout for establishing the connection to O(api_host).
+                type: float
+                default: 5.0
+            poll:
+                description: Read timeout of task status and log polls.
+                type: float
+                default: 10.0
+            listing:
+                description: Read timeout of storage content listings.
+                type: float
+            write:
+                description: Read timeout of requests that are not GETs, for example the ones starting tasks.
+                type: float
+            default:
+                description: Read timeout of all other requests.
+                type: float
+    api_retries:
+        description:
+        - Number of times a GET request is sent again after a connection error, a timeout or a
+          C(500), C(502), C(503), C(504), C(595) or C(596) response, waiting longer before every retry.
+        - Requests that change something, like starting a backup, are never sent again.
+        type: int
+        required: false
+        default: 3
+    api_retry_backoff:
+        description: Seconds to wait before the first retry, doubled for every further retry up to 10 seconds.
+        type: float
+        required: false
+        default: 0.5
+    api_circuit_breaker_threshold:
+        description:
+        - Number of consecutive failed requests after which requests to O(api_host) fail at once, without
+          being sent, for O(api_circuit_breaker_reset) seconds.
+        - V(0) disables the circuit breaker.
+        type: int
+        required: false
+        default: 5
+    api_circuit_breaker_reset:
+        description:
+        - Seconds after which a single request is sent again to a host whose circuit breaker opened.
+          Further requests are sent once it succeeds.
+        type: float
+        required: false
+        default: 30.0
+'''
+
+    TASK_WAIT = r'''
+options:
+    wait_timeout:
+        description:
+        - Maximum number of seconds to wait for the task when O(wait=true).
+        - The task keeps running on Proxmox when the timeout expires.
+        - Wait forever if not specified.
+        type: int
+        required: false
+    poll_interval:
+        description:
+        - Initial number of seconds between task status polls when O(wait=true).
+        - The interval grows exponentially (with jitter) up to O(max_poll_interval).
+        type: float
+        required: false
+        default: 1.0
+    max_poll_interval:
+        description:
+        - Upper bound in seconds for the interval between task status polls.
+        type: float
+        required: false
+        default: 30.0
+'''
+
+    METRICS = r'''
+options:
+    collect_metrics:
+        description:
+        - If V(true), return RV(metrics) with the API requests made per endpoint (count, errors, latency
+          percentiles and bytes received), the requests retried and the time spent in each phase of the module.
+        type: bool
+        required: false
+        default: false
+    metrics_file:
+        description:
+        - File to write the metrics to when O(collect_metrics=true), to aggregate them across runs.
+        - With O(metrics_format=json) one JSON line is appended per run; with O(metrics_format=openmetrics)
+          the file is replaced, for example for the textfile collector of the Prometheus node exporter.
+        type: path
+        required: false
+    metrics_format:
+        description: Format of O(metrics_file).
+        type: str
+        required: false
+        default: json
+        choices: [json, openmetrics]
+'''
+
+    PROGRESS = r'''
+options:
+    min_throughput:
+        description:
+        - Minimum throughput in MiB/s of the task when O(wait=true).
+        - When the progress lines of the task log show that less was read on average over the last
+          O(throughput_window) seconds, the task is stopped and the module fails, instead of waiting
+          for a stuck task.
+        - Only checked once the task logged progress, and again from the start of every guest of a
+          backup job. Tasks that log no progress, such as container backups and restores, are not checked.
+        type: float
+        required: false
+    throughput_window:
+        description: Seconds over which the throughput is averaged for O(min_throughput).
+        type: int
+        required: false
+        default: 300
+'''
@@ -0,0 +1,292 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+name: proxmox_backup
+
+short_description: Proxmox VE guests with their backup facts
+
+version_added: "0.1.0"
+
+description:
+    - Add every VM and container of a Proxmox VE cluster as a host, with facts about its backups.
+    - All storages holding backups are listed in one cluster-wide scan, listing each shared storage only once,
+      instead of once per guest.
+    - Uses a YAML configuration file ending with C(proxmox_backup.yml) or C(proxmox_backup.yaml).
+    - With O(cache=true) the scan is stored in the inventory cache and reused until O(cache_timeout) expires,
+      so consecutive playbook runs make no API calls. RV(proxmox_backup.age_seconds) is still computed
+      at every run.
+
+options:
+    plugin:
+        description: Token that ensures this is a source file for the plugin.
+        required: true
+        choices: ['mcfitz2.proxmox_backup.proxmox_backup']
+    api_host:
+        description: Specify the target host of the Proxmox VE cluster.
+        type: str
+        required: true
+        env:
+            - name: PROXMOX_HOST
+    api_port:
+        description: Specify the target port of the Proxmox VE cluster.
+        type: int
+        default: 8006
+        env:
+            - name: PROXMOX_PORT
+    api_user:
+        description: Specify the user to authenticate with.
+        type: str
+        required: true
+        env:
+            - name: PROXMOX_USER
+    api_password:
+        description:
+        - Specify the password to authenticate with.
+        - One of O(api_password) or O(api_token_id) is required.
+        type: str
+        env:
+            - name: PROXMOX_PASSWORD
+    api_token_id:
+        description: Specify the token ID (without the C(user@realm!) prefix) to authenticate with an API token.
+        type: str
+        env:
+            - name: PROXMOX_TOKEN_ID
+    api_token_secret:
+        description: Specify the secret of the API token given in O(api_token_id).
+        type: str
+        env:
+            - name: PROXMOX_TOKEN_SECRET
+    verify_ssl:
+        description: If V(false), SSL certificates will not be validated.
+        type: bool
+        default: true
+    ticket_cache:
+        description: If V(true), the authentication ticket is cached on disk and reused, like in the modules.
+        type: bool
+        default: false
+    ticket_cache_dir:
+        description:
+        - Directory for the ticket cache.
+        - Defaults to C(mcfitz2.proxmox_backup) under E(XDG_CACHE_HOME) or C(~/.cache).
+        type: path
+    api_timeouts:
+        description:
+        - Connect timeout and read timeouts per kind of API call in seconds, like in the modules.
+        - Keys are C(connect), C(poll), C(listing), C(write) and C(default); read timeouts not given
+          use O(timeout).
+        type: dict
+    api_retries:
+        description: Number of times a GET request is sent again after a connection error or a 5xx response.
+        type: int
+        default: 3
+    api_retry_backoff:
+        description: Seconds to wait before the first retry, doubled for every further retry.
+        type: float
+        default: 0.5
+    api_circuit_breaker_threshold:
+        description:
+        - Number of consecutive failed requests after which no more requests are sent to O(api_host)
+          for O(api_circuit_breaker_reset) seconds. V(0) disables the circuit breaker.
+        type: int
+        default: 5
+    api_circuit_breaker_reset:
+        description: Seconds after which a request is sent again to a host whose circuit breaker opened.
+        type: float
+        default: 30.0
+    node:
+        description: Only scan these nodes, and only add the guests currently on them.
+        type: list
+        elements: str
+    storage:
+        description: Storage identifier e.g. "local" or "all"
+        type: str
+        default: 'all'
+    hostname:
+        description:
+        - Name of the hosts, either the guest name or its VMID.
+        - Guests without a name are always added by VMID.
+        type: str
+        choices: ['name', 'vmid']
+        default: 'name'
+    max_workers:
+        description: Maximum number of storage content listings that run in parallel.
+        type: int
+        default: 4
+    timeout:
+        description: Timeout in seconds for each API request.
+        type: int
+        default: 30
+
+extends_documentation_fragment:
+    - constructed
+    - inventory_cache
+
+requirements: [ "proxmoxer >= 2.0, < 3.0" ]
+
+author:
+    - Micah Fitzgerald (@mcfitz2)
+'''
+
+EXAMPLES = r'''
+---
+# proxmox_backup.yml
+plugin: mcfitz2.proxmox_backup.proxmox_backup
+api_host: node1
+api_user: root@pam
+api_token_id: inventory
+# api_token_secret is read from PROXMOX_TOKEN_SECRET
+cache: true
+cache_plugin: ansible.builtin.jsonfile
+cache_connection: ~/.cache/ansible-inventory
+cache_timeout: 900
+groups:
+  backup_missing: proxmox_backup.backup_count == 0
+  backup_stale: proxmox_backup.age_seconds is not none and proxmox_backup.age_seconds > 86400
+keyed_groups:
+  - key: proxmox_node
+    prefix: node
+'''
+
+RETURN = r'''
+proxmox_vmid:
+    description: VMID of the guest.
+    type: int
+proxmox_node:
+    description: Node the guest was on at the time of the scan.
+    type: str
+proxmox_type:
+    description: Type of the guest, V(qemu) or V(lxc).
+    type: str
+proxmox_status:
+    description: Status of the guest at the time of the scan.
+    type: str
+proxmox_backup:
+    description: Facts about the backups of the guest.
+    type: dict
+    contains:
+        latest_backup:
+            description: Volume ID of the newest backup, V(null) without backups.
+            type: str
+        latest_ctime:
+            description: Creation time of the newest backup, in seconds since the epoch.
+            type: int
+        backup_count:
+            description: Number of backups.
+            type: int
+        total_size:
+            description: Total size of the backups in bytes.
+            type: int
+        age_seconds:
+            description: Seconds since the newest backup was created, V(null) without backups.
+            type: int
+'''
+
+import time
+
+from ansible.errors import AnsibleError
+from ansible.module_utils.common.text.converters import to_native
+from ansible.plugins.inventory import BaseInventoryPlugin, Cacheable, Constructable
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.listing import (
+    BackupStats,
+    discover_cluster_storages,
+    list_backups,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.proxmox import (
+    HAS_PROXMOXER,
+    PROXMOXER_IMP_ERR,
+    build_client,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.plugin_utils.controller import (
+    ControllerModule,
+    ModuleExit,
+)
+
+CONNECTION_OPTIONS = ('api_host', 'api_port', 'api_user', 'api_password', 'api_token_id', 'api_token_secret',
+                      'verify_ssl', 'ticket_cache', 'ticket_cache_dir', 'api_timeouts', 'api_retries',
+                      'api_retry_backoff', 'api_circuit_breaker_threshold', 'api_circuit_breaker_reset')
+
+
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
+
+    NAME = 'mcfitz2.proxmox_backup.proxmox_backup'
+
+    def verify_file(self, path):
+        return (super(InventoryModule, self).verify_file(path)
+                and path.endswith(('proxmox_backup.yml', 'proxmox_backup.yaml')))
+
+    def connect(self):
+        if not HAS_PROXMOXER:
+            raise AnsibleError(f"The proxmoxer Python library is required: {PROXMOXER_IMP_ERR}")
+        if not self.get_option('api_password') and not self.get_option('api_token_id'):
+            raise AnsibleError("One of api_password or api_token_id is required")
+        params = dict((option, self.get_option(option)) for option in CONNECTION_OPTIONS)
+        try:
+            return build_client(ControllerModule(params), timeout=self.get_option('timeout'))
+        except ModuleExit as e:
+            raise AnsibleError(e.result['msg'])
+
+    def scan(self):
+        """Return the guests of the cluster with the stats of their backups, and the storage errors."""
+        proxmox = self.connect()
+        nodes = self.get_option('node')
+        try:
+            resources = proxmox.cluster.resources.get()
+            guests = [r for r in resources
+                      if r.get('type') in ('qemu', 'lxc') and (not nodes or r.get('node') in nodes)]
+            targets, errors = discover_cluster_storages(proxmox, nodes, self.get_option('storage'), resources)
+            stats, list_errors = list_backups(proxmox, targets, max_workers=self.get_option('max_workers'),
+                                              selected=BackupStats())
+        except Exception as e:
+            raise AnsibleError(f"A Proxmox error occurred: {to_native(e)}", orig_exc=e)
+        errors.update(list_errors)
+        hosts = []
+        for guest in guests:
+            hosts.append(dict(vmid=guest['vmid'], name=guest.get('name'), node=guest.get('node'),
+                              type=guest.get('type'), status=guest.get('status'),
+                              backup=stats.get(guest['vmid'], dict(backup_count=0, total_size=0,
+                                                                   latest_backup=None, latest_ctime=None))))
+        return dict(hosts=hosts, errors=errors)
+
+    def populate(self, results):
+        now = time.time()
+        strict = self.get_option('strict')
+        for key, error in sorted(results['errors'].items()):
+            self.display.warning(f"Unable to list {key}: {error}")
+        for host in results['hosts']:
+            name = host['name'] if self.get_option('hostname') == 'name' and host['name'] else str(host['vmid'])
+            self.inventory.add_host(name)
+            backup = dict(host['backup'])
+            ctime = backup['latest_ctime']
+            backup['age_seconds'] = None if ctime is None else int(now - ctime)
+            hostvars = dict(proxmox_vmid=host['vmid'], proxmox_node=host['node'], proxmox_type=host['type'],
+                            proxmox_status=host['status'], proxmox_backup=backup)
+            for var, value in hostvars.items():
+                self.inventory.set_variable(name, var, value)
+            self._set_composite_vars(self.get_option('compose'), hostvars, name, strict=strict)
+            self._add_host_to_composed_groups(self.get_option('groups'), hostvars, name, strict=strict)
+            self._add_host_to_keyed_groups(self.get_option('keyed_groups'), hostvars, name, strict=strict)
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path)
+        self._read_config_data(path)
+
+        cache_key = self.get_cache_key(path)
+        use_cache = self.get_option('cache') and cache
+        update_cache = self.get_option('cache') and not cache
+        results = None
+        if use_cache:
+            try:
+                results = self._cache[cache_key]
+            except KeyError:
+                update_cache = True
+        if results is None:
+            results = self.scan()
+        if update_cache:
+            self._cache[cache_key] = results
+        self.populate(results)
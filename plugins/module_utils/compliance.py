@@ -0,0 +1,105 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.guests import guest_tags
+
+SEVERITIES = ('critical', 'warning', 'info')
+POLICY_FIELDS = ('rpo', 'min_copies', 'required_storages', 'severity')
+
+
+def rule_name(rule):
+    if rule.get('name'):
+        return rule['name']
+    if rule.get('vmid'):
+        return 'vmid:' + ','.join(str(vmid) for vmid in rule['vmid'])
+    if rule.get('tag'):
+        return 'tag:' + rule['tag']
+    return 'pool:' + rule['pool']
+
+
+class CompliancePolicy:
+    """Resolve the policy of a guest from a default policy and rules selecting guests by VMID, tag or pool.
+
+    A rule for the VMID of a guest wins over a rule for one of its tags, which
+    wins over a rule for its pool; between rules of the same kind the first one
+    listed wins.  Fields a rule leaves unset are taken from the default.  All
+    lookups are dictionary lookups, so resolving a guest does not depend on
+    the number of rules.
+    """
+
+    def __init__(self, default, rules=()):
+        self.default = dict(default, rule='default')
+        self.by_vmid = {}
+        self.by_tag = {}
+        self.by_pool = {}
+        for order, rule in enumerate(rules):
+            policy = dict(self.default)
+            policy.update((field, rule[field]) for field in POLICY_FIELDS if rule.get(field) is not None)
+            policy['rule'] = rule_name(rule)
+            for vmid in rule.get('vmid') or ():
+                self.by_vmid.setdefault(vmid, policy)
+            if rule.get('tag'):
+                self.by_tag.setdefault(rule['tag'], (order, policy))
+            if rule.get('pool'):
+                self.by_pool.setdefault(rule['pool'], policy)
+
+    def resolve(self, guest):
+        policy = self.by_vmid.get(guest['vmid'])
+        if policy is not None:
+            return policy
+        if self.by_tag:
+            tagged = [self.by_tag[tag] for tag in guest_tags(guest) if tag in self.by_tag]
+            if tagged:
+                return min(tagged, key=lambda entry: entry[0])[1]
+        return self.by_pool.get(guest.get('pool'), self.default)
+
+
+def check_guest(guest, stats, policy, now):
+    """Return the violations of ``policy`` by ``guest``, given the BackupStats entry of its VMID (or None)."""
+    violations = []
+
+    def violation(check, message):
+        violations.append(dict(vmid=guest['vmid'], name=guest.get('name'), node=guest.get('node'),
+                               pool=guest.get('pool') or None, rule=policy['rule'], severity=policy['severity'],
+                               check=check, message=message, latest_backup=latest_backup, age_seconds=age))
+
+    latest = stats and stats['latest_ctime']
+    latest_backup = stats and stats['latest_backup']
+    age = None if latest is None else int(now - latest)
+    rpo = policy['rpo']
+    if age is None:
+        violation('rpo', "No backup found")
+    elif age > rpo:
+        violation('rpo', f"Newest backup is {age}s old, the RPO is {rpo}s")
+    count = stats['backup_count'] if stats else 0
+    if policy['min_copies'] and count < policy['min_copies']:
+        violation('min_copies', f"{count} backup(s) found, at least {policy['min_copies']} required")
+    storages = stats['storages'] if stats else {}
+    for storage in policy['required_storages'] or ():
+        ctime = storages.get(storage)
+        if ctime is None:
+            violation('required_storage', f"No backup on storage {storage}")
+        elif now - ctime > rpo:
+            violation('required_storage', f"Newest backup on storage {storage} is {int(now - ctime)}s old, "
+                                          f"the RPO is {rpo}s")
+    return violations
+
+
+def evaluate(guests, stats, policy, now):
+    """Check every guest against ``policy`` in one pass over ``guests``.
+
+    ``stats`` maps VMIDs to their BackupStats entries (with ``storages``).
+    Returns the violations grouped by severity and the number of compliant guests.
+    """
+    violations = dict((severity, []) for severity in SEVERITIES)
+    compliant = 0
+    for guest in guests:
+        found = check_guest(guest, stats.get(guest['vmid']), policy.resolve(guest), now)
+        if not found:
+            compliant += 1
+        for v in found:
+            violations[v['severity']].append(v)
+    return violations, compliant
@@ -0,0 +1,268 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import json
+import posixpath
+import select
+import ssl
+import threading
+import time
+from http.client import HTTPException, HTTPSConnection, responses
+from urllib.parse import quote, urlencode
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.metrics import endpoint
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.resilience import (
+    CONNECTION_ERROR_STATUS,
+    DEFAULT_TIMEOUTS,
+    RETRY_STATUSES,
+    AuthenticationError,
+    ResourceException,
+    call_type,
+    circuit_breaker,
+    retry_delay,
+)
+
+API_ROOT = '/api2/json'
+# Tickets older than this are renewed with the ticket itself before the next request, like proxmoxer does.
+TICKET_RENEW_AGE = 3600
+# Characters left as they are in request paths, like requests does; volume IDs keep their slashes and colons.
+PATH_SAFE = "/:@!$&'()*+,;="
+
+
+class APIPath:
+    """A path of the API, extended by attribute access and calls like the resources of proxmoxer.
+
+    ``proxmox.nodes(node).tasks(upid).status.get()`` builds the path
+    ``nodes/{node}/tasks/{upid}/status`` and sends a GET through the
+    DirectClient, so modules work the same with either client.
+    """
+
+    def __init__(self, client, path=''):
+        self._client = client
+        self._path = path
+
+    def __repr__(self):
+        return f"APIPath ({self._path or '/'})"
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return APIPath(self._client, posixpath.join(self._path, name))
+
+    def __call__(self, resource_id=None):
+        if resource_id in (None, ''):
+            return self
+        if isinstance(resource_id, (bytes, str)):
+            resource_id = resource_id.split('/')
+        elif not isinstance(resource_id, (tuple, list)):
+            resource_id = [str(resource_id)]
+        return APIPath(self._client, posixpath.join(self._path, *[str(s) for s in resource_id]))
+
+    def get(self, *args, **params):
+        return self._client.request('GET', self(args)._path, params)
+
+    def post(self, *args, **data):
+        return self._client.request('POST', self(args)._path, data)
+
+    def put(self, *args, **data):
+        return self._client.request('PUT', self(args)._path, data)
+
+    def delete(self, *args, **params):
+        return self._client.request('DELETE', self(args)._path, params)
+
+    def create(self, *args, **data):
+        return self.post(*args, **data)
+
+    def set(self, *args, **data):
+        return self.put(*args, **data)
+
+
+class DirectClient:
+    """Proxmox VE API client on http.client, without proxmoxer and requests.
+
+    Importing requests takes longer than running a short module against the
+    API, so this client only uses the standard library.  It authenticates with
+    an API token, or logs in with the password and keeps the ticket, reusing
+    the one in ``tickets`` (a TicketCache) when given.  Idle keep-alive
+    connections are pooled, so threads fanning out requests each use their
+    own.  GETs are retried, calls time out and hosts are cut off by the
+    circuit breaker like with ResilientSender.  ``observers`` are called with
+    the endpoint, latency, body size, status and retry flag of every response,
+    the way Metrics records them from the requests session.
+    """
+
+    def __init__(self, params, tickets=None, timeout=5, sleep=time.sleep, clock=time.monotonic):
+        self.host = params['api_host']
+        self.port = params['api_port']
+        self.user = params['api_user']
+        self.password = params['api_password']
+        self.timeout = timeout
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **dict((k, v) for k, v in (params['api_timeouts'] or {}).items()
+                                                      if v is not None))
+        self.retries = params['api_retries']
+        self.backoff = params['api_retry_backoff']
+        self.breaker_threshold = params['api_circuit_breaker_threshold']
+        self.breaker_reset = params['api_circuit_breaker_reset']
+        self.context = ssl.create_default_context()
+        if not params['verify_ssl']:
+            self.context.check_hostname = False
+            self.context.verify_mode = ssl.CERT_NONE
+        self.sleep = sleep
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.idle = []
+        self.observers = []
+        self.tickets = tickets
+        self.ticket = None
+        self.csrf_token = None
+        self.issued = None
+        self.authorization = None
+        if params['api_token_id']:
+            self.authorization = f"PVEAPIToken={self.user}!{params['api_token_id']}={params['api_token_secret']}"
+            return
+        entry = tickets.load() if tickets is not None else None
+        if entry:
+            self.ticket = entry['ticket']
+            self.csrf_token = entry['csrf_token']
+            self.issued = clock() - (time.time() - entry['issued'])
+        else:
+            self.login(self.password)
+
+    def checkout(self):
+        """Return an idle connection still open, or a new one."""
+        with self.lock:
+            while self.idle:
+                conn = self.idle.pop()
+                # an idle socket is only readable once the server closed it
+                if not select.select([conn.sock], [], [], 0)[0]:
+                    return conn
+                conn.close()
+        return HTTPSConnection(self.host, self.port, timeout=self.timeouts['connect'], context=self.context)
+
+    def checkin(self, conn):
+        with self.lock:
+            self.idle.append(conn)
+
+    def exchange(self, method, url, body, headers, timeout):
+        """Send one request and return its status, reason and body."""
+        conn = self.checkout()
+        try:
+            if conn.sock is None:
+                conn.connect()
+            conn.sock.settimeout(timeout)
+            conn.request(method, url, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        except Exception:
+            conn.close()
+            raise
+        if response.will_close:
+            conn.close()
+        else:
+            self.checkin(conn)
+        return response.status, response.reason, data
+
+    def send(self, method, url, body=None, headers=None, observe=True):
+        """Send a request with the retries, timeouts and circuit breaker of the client options."""
+        breaker = None
+        if self.breaker_threshold > 0:
+            breaker = circuit_breaker(f"{self.host}:{self.port}", self.breaker_threshold, self.breaker_reset)
+        timeout = self.timeouts[call_type(method, url)] or self.timeout
+        attempts = 1 + max(0, self.retries) if method == 'GET' else 1
+        for attempt in range(attempts):
+            if attempt:
+                self.sleep(retry_delay(self.backoff, attempt))
+            if breaker is not None:
+                breaker.allow()
+            started = self.clock()
+            try:
+                status, reason, data = self.exchange(method, url, body, headers or {}, timeout)
+            except (OSError, HTTPException) as e:
+                if breaker is not None:
+                    breaker.failure()
+                if attempt + 1 == attempts:
+                    raise ResourceException(CONNECTION_ERROR_STATUS, type(e).__name__, str(e)) from e
+                continue
+            if observe:
+                for observer in self.observers:
+                    observer(endpoint(method, url), self.clock() - started, len(data), status, attempt > 0)
+            if status not in RETRY_STATUSES:
+                if breaker is not None:
+                    breaker.success()
+                return status, reason, data
+            if breaker is not None:
+                breaker.failure()
+            if attempt + 1 == attempts:
+                return status, reason, data
+
+    def login(self, password):
+        body = urlencode(dict(username=self.user, password=password))
+        status, reason, data = self.send('POST', f"{API_ROOT}/access/ticket", body,
+                                         {'Content-Type': 'application/x-www-form-urlencoded'}, observe=False)
+        if status != 200:
+            raise AuthenticationError(f"Couldn't authenticate user: {self.user} to {API_ROOT}/access/ticket")
+        ticket = json.loads(data.decode('utf-8'))['data']
+        self.ticket = ticket['ticket']
+        self.csrf_token = ticket['CSRFPreventionToken']
+        self.issued = self.clock()
+        if self.tickets is not None:
+            self.tickets.store(self.ticket, self.csrf_token)
+
+    def renew(self):
+        """Renew an old ticket with the ticket itself, or log in again when Proxmox rejects it."""
+        try:
+            self.login(self.ticket)
+        except AuthenticationError:
+            self.relogin()
+
+    def relogin(self):
+        if self.tickets is not None:
+            self.tickets.evict()
+        self.login(self.password)
+
+    def headers(self, method):
+        if self.authorization is not None:
+            return {'Authorization': self.authorization}
+        headers = {'Cookie': f"PVEAuthCookie={self.ticket}"}
+        if method != 'GET':
+            headers['CSRFPreventionToken'] = self.csrf_token
+        return headers
+
+    def request(self, method, path, params):
+        """Send ``method`` to ``path`` and return the C(data) of the response, like proxmoxer."""
+        params = dict((k, v) for k, v in params.items() if v is not None)
+        url = quote(f"{API_ROOT}/{path}", safe=PATH_SAFE)
+        body = None
+        if method in ('POST', 'PUT'):
+            body = urlencode(params, doseq=True)
+        elif params:
+            url += '?' + urlencode(params, doseq=True)
+        if self.authorization is None and self.clock() - self.issued >= TICKET_RENEW_AGE:
+            self.renew()
+        headers = self.headers(method)
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        status, reason, data = self.send(method, url, body, headers)
+        if status == 401 and self.authorization is None:
+            # the ticket expired or was revoked
+            self.relogin()
+            headers.update(self.headers(method))
+            status, reason, data = self.send(method, url, body, headers)
+        if status >= 400:
+            try:
+                errors = json.loads(data.decode('utf-8')).get('errors')
+            except (UnicodeDecodeError, ValueError):
+                errors = {'errors': data}
+            raise ResourceException(status, responses.get(status, reason), reason, errors=errors)
+        try:
+            return json.loads(data.decode('utf-8'))['data']
+        except (UnicodeDecodeError, ValueError):
+            return {'errors': data}
+
+
+def direct_client(params, tickets=None, **kwargs):
+    """Return the root APIPath of a DirectClient for the connection options ``params``."""
+    return APIPath(DirectClient(params, tickets, **kwargs))
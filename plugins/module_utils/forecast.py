@@ -0,0 +1,184 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import time
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.listing import (
+    fan_out,
+    storage_key,
+    target_key,
+)
+
+DAY = 86400
+
+
+class SizeTrend:
+    """Least-squares line of backup size over creation time, updated one backup at a time.
+
+    Welford's online covariance keeps it exact enough with epoch timestamps
+    and needs no list of the backups.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean_t = 0.0
+        self.mean_s = 0.0
+        self.m2_t = 0.0
+        self.c_ts = 0.0
+        self.total = 0
+        self.first = None
+        self.latest = None
+        self.latest_size = None
+
+    def add(self, ctime, size):
+        self.count += 1
+        dt = ctime - self.mean_t
+        self.mean_t += dt / self.count
+        self.mean_s += (size - self.mean_s) / self.count
+        self.m2_t += dt * (ctime - self.mean_t)
+        self.c_ts += dt * (size - self.mean_s)
+        self.total += size
+        if self.first is None or ctime < self.first:
+            self.first = ctime
+        if self.latest is None or ctime >= self.latest:
+            self.latest = ctime
+            self.latest_size = size
+
+    def slope(self):
+        """Bytes per day a backup grows by, 0 until there are backups at two different times."""
+        return self.c_ts / self.m2_t * DAY if self.m2_t > 0 else 0.0
+
+    def interval(self):
+        """Mean seconds between two backups, or None with a single backup."""
+        return (self.latest - self.first) / (self.count - 1) if self.count > 1 else None
+
+    def summary(self):
+        interval = self.interval()
+        return dict(backup_count=self.count, total_size=self.total, latest_size=self.latest_size,
+                    latest_ctime=self.latest, size_growth=round(self.slope(), 1),
+                    backup_interval=None if interval is None else round(interval, 1),
+                    daily_bytes=round(self.latest_size * DAY / interval, 1) if interval else None)
+
+
+class CapacityForecast:
+    """Aggregate a stream of backups into size trends per storage and VMID, and forecast storage usage.
+
+    A drop-in for NewestBackups in list_backups() that only returns the newest
+    backup; the forecast is read with forecast() afterwards.  Every storage
+    and VMID pair keeps a SizeTrend, and every storage the bytes of the
+    backups created on each of the last ``window`` days, so memory depends on
+    the number of guests and the window, not on the number of backups.
+    Storages are keyed like target_key(): by name when shared, as
+    ``node/storage`` otherwise.
+
+    Pruning removes old backups as new ones are written, so once retention
+    keeps a steady number of backups per guest, usage grows by the growth of
+    the backup size times the number of backups kept.  That is the
+    ``growth_rate`` days to full are forecast with; ``ingest_rate`` is what
+    new backups add per day before anything is pruned.
+    """
+
+    def __init__(self, targets, window=30, now=None):
+        self.targets = dict((target_key(t), t) for t in targets)
+        self.shared = set(t.storage for t in targets if t.shared)
+        self.window = window
+        self.now = time.time() if now is None else now
+        self.start = self.now - window * DAY
+        self.trends = {}
+        self.days = {}
+        self.latest = None
+
+    def key(self, backup):
+        storage = backup['volid'].split(':', 1)[0]
+        return storage if storage in self.shared else storage_key(backup.get('node'), storage)
+
+    def add(self, backup):
+        key = self.key(backup)
+        ctime = backup.get('ctime') or 0
+        size = backup.get('size') or 0
+        trend = self.trends.get((key, backup.get('vmid')))
+        if trend is None:
+            trend = self.trends[key, backup.get('vmid')] = SizeTrend()
+        trend.add(ctime, size)
+        if ctime >= self.start:
+            day = self.days.setdefault(key, {}).setdefault(int(ctime // DAY), [0, 0])
+            day[0] += 1
+            day[1] += size
+        if self.latest is None or ctime > (self.latest.get('ctime') or 0):
+            self.latest = backup
+
+    def extend(self, backups):
+        for backup in backups:
+            self.add(backup)
+        return self
+
+    def result(self):
+        """Return the newest backup in a list, like NewestBackups(1, per_vmid=False)."""
+        return [] if self.latest is None else [self.latest]
+
+    def forecast(self, capacity=None):
+        """Return the forecast per storage and per VMID, and the storage with the most headroom.
+
+        ``capacity`` maps storage keys to their status, see storage_capacity().
+        """
+        capacity = capacity or {}
+        storages = {}
+        for key, target in self.targets.items():
+            status = capacity.get(key) or {}
+            storages[key] = dict(storage=target.storage, node=None if target.shared else target.node,
+                                 shared=target.shared, total=status.get('total'), used=status.get('used'),
+                                 avail=status.get('avail'), backup_count=0, backup_bytes=0, growth_rate=0.0)
+        guests = {}
+        for (key, vmid), trend in sorted(self.trends.items(), key=lambda item: (str(item[0][1]), item[0][0])):
+            storage = storages[key]
+            storage['backup_count'] += trend.count
+            storage['backup_bytes'] += trend.total
+            storage['growth_rate'] += trend.count * trend.slope()
+            guest = guests.setdefault(vmid, dict(backup_count=0, total_size=0, storages={}))
+            guest['backup_count'] += trend.count
+            guest['total_size'] += trend.total
+            guest['storages'][key] = trend.summary()
+        for key, storage in storages.items():
+            days = sorted(self.days.get(key, {}).items())
+            storage['series'] = [dict(date=time.strftime('%Y-%m-%d', time.gmtime(day * DAY)), count=count,
+                                      bytes=size) for day, (count, size) in days]
+            ingest = sum(size for dummy, (count, size) in days) / self.window if self.window else 0.0
+            storage.update(ingest_rate=round(ingest, 1), growth_rate=round(storage['growth_rate'], 1),
+                           days_to_full=days_left(storage['avail'], storage['growth_rate']),
+                           days_to_full_without_pruning=days_left(storage['avail'], ingest))
+        return dict(storages=storages, guests=guests, most_headroom=most_headroom(storages),
+                    window=self.window, generated_at=int(self.now))
+
+
+def days_left(avail, rate):
+    if avail is None or rate <= 0:
+        return None
+    return round(avail / rate, 1)
+
+
+def most_headroom(storages):
+    """Return the key of the storage that fills up last, the one with most free space among those not filling up."""
+    known = [(key, s) for key, s in storages.items() if s['avail'] is not None]
+    if not known:
+        return None
+    return max(known, key=lambda item: (item[1]['days_to_full'] is None, item[1]['days_to_full'] or 0,
+                                        item[1]['avail']))[0]
+
+
+def storage_capacity(proxmox, targets, max_workers=4):
+    """Return the C(status) of every StorageTarget keyed like target_key(), and a map of ``node/storage`` to error."""
+    capacity = {}
+    errors = {}
+
+    def status(target):
+        return proxmox.nodes(target.node).storage(target.storage).status.get()
+
+    for target, result, error in fan_out(status, targets, max_workers):
+        if error is not None:
+            errors[storage_key(target.node, target.storage)] = str(error)
+        else:
+            capacity[target_key(target)] = result
+    return capacity, errors
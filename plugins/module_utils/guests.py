@@ -0,0 +1,121 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import json
+import time
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.proxmox import (
+    cache_file,
+    write_private_json,
+)
+
+# Guest lists fetched by this process, keyed by cache file.
+_GUESTS = {}
+
+
+def cluster_guests(proxmox):
+    """Return every VM and container of the cluster from /cluster/resources."""
+    return [r for r in proxmox.cluster.resources.get(type='vm') if r.get('type') in ('qemu', 'lxc')]
+
+
+class GuestCache:
+    """The cluster guest list, cached for ``ttl`` seconds in this process and on disk.
+
+    Loop items and later tasks of a play (for the same host, port and user)
+    reuse the list instead of each calling /cluster/resources.  A ``ttl`` of 0
+    disables the cache.
+    """
+
+    def __init__(self, cache_dir, host, port, user, ttl):
+        self.path = cache_file(cache_dir, 'guests', host, port, user)
+        self.ttl = ttl
+
+    def load(self):
+        entry = _GUESTS.get(self.path)
+        if entry is None:
+            try:
+                with open(self.path) as f:
+                    entry = json.load(f)
+            except (IOError, OSError, ValueError):
+                return None
+        if time.time() - entry.get('fetched', 0) >= self.ttl:
+            return None
+        return entry['guests']
+
+    def store(self, guests):
+        entry = dict(guests=guests, fetched=time.time())
+        _GUESTS[self.path] = entry
+        try:
+            write_private_json(self.path, entry)
+        except (IOError, OSError):
+            pass
+
+    def guests(self, proxmox, refresh=False):
+        """Return the guest list and whether it was just fetched."""
+        guests = None if refresh or not self.ttl else self.load()
+        if guests is not None:
+            return guests, False
+        guests = cluster_guests(proxmox)
+        if self.ttl:
+            self.store(guests)
+        return guests, True
+
+
+def find_guest(proxmox, vmid, cache=None):
+    """Return the /cluster/resources entry (with ``type`` and ``node``) of ``vmid``, or None.
+
+    A guest missing from a cached list is looked up again in a fresh one, in
+    case it was created since.
+    """
+    guests, fresh = cache.guests(proxmox) if cache else (cluster_guests(proxmox), True)
+    found = [g for g in guests if g['vmid'] == vmid]
+    if not found and not fresh:
+        found = [g for g in cache.guests(proxmox, refresh=True)[0] if g['vmid'] == vmid]
+    return found[0] if found else None
+
+
+def backup_guest_type(volid):
+    """Return the guest type (``qemu`` or ``lxc``) a backup was made from, or None if unknown."""
+    name = volid.split(':', 1)[-1]
+    if 'vzdump-qemu-' in name or name.startswith('backup/vm/') or name.startswith('vm/'):
+        return 'qemu'
+    if 'vzdump-lxc-' in name or name.startswith('backup/ct/') or name.startswith('ct/'):
+        return 'lxc'
+    return None
+
+
+def guest_tags(guest):
+    return set(t for t in guest.get('tags', '').replace(',', ';').split(';') if t)
+
+
+def select_guests(guests, vmids=None, node=None, pool=None, tags=None, all_guests=False, exclude=None):
+    """Return a map of VMID to node for the guests matched by the given selectors.
+
+    A guest is selected if it is listed in ``vmids``, is a member of ``pool``,
+    carries any of ``tags`` or, with ``all_guests``, simply exists.  When
+    ``node`` is given only guests currently on that node are considered.
+    Guests in ``exclude`` are never selected.
+    """
+    vmids = set(vmids or [])
+    tags = set(tags or [])
+    exclude = set(exclude or [])
+    selected = {}
+    for guest in guests:
+        vmid = guest['vmid']
+        if vmid in exclude or (node and guest.get('node') != node):
+            continue
+        if (all_guests or vmid in vmids or (pool and guest.get('pool') == pool)
+                or (tags and tags & guest_tags(guest))):
+            selected[vmid] = guest['node']
+    return selected
+
+
+def group_by_node(selected):
+    """Group a VMID to node map into sorted VMID lists per node."""
+    groups = {}
+    for vmid, node in selected.items():
+        groups.setdefault(node, []).append(vmid)
+    return dict((node, sorted(vmids)) for node, vmids in groups.items())
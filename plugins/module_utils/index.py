@@ -0,0 +1,165 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import hashlib
+import json
+import os
+import time
+import traceback
+
+SQLITE_IMP_ERR = None
+try:
+    import sqlite3
+    HAS_SQLITE = True
+except ImportError:
+    HAS_SQLITE = False
+    SQLITE_IMP_ERR = traceback.format_exc()
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.listing import (
+    NewestBackups,
+    fan_out,
+    storage_content,
+    storage_key,
+    target_key,
+)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS backups (
+    storage TEXT NOT NULL,
+    volid TEXT NOT NULL,
+    vmid INTEGER,
+    ctime INTEGER,
+    size INTEGER,
+    node TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (storage, volid)
+);
+CREATE INDEX IF NOT EXISTS backups_vmid_ctime ON backups (vmid, ctime);
+CREATE TABLE IF NOT EXISTS listings (
+    storage TEXT NOT NULL,
+    vmid INTEGER NOT NULL,
+    used INTEGER,
+    refreshed REAL NOT NULL,
+    PRIMARY KEY (storage, vmid)
+);
+'''
+
+
+class BackupIndexError(Exception):
+    """The backup index could not be opened."""
+
+
+class BackupIndex:
+    """SQLite index of storage backup listings, kept on the controller between runs.
+
+    Every listing is recorded in ``listings`` with the storage usage seen at
+    discovery time; ``vmid`` 0 stands for a listing of all guests.  A listing
+    is reused while it is younger than ``max_age`` and the storage usage has not
+    changed since, otherwise the storage is listed again and its rows replaced.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # the -wal and -shm files of WAL mode hold the listings too; SQLite creates
+        # them with the mode of the database, and with the umask while it is new
+        umask = os.umask(0o077)
+        try:
+            self.db = sqlite3.connect(path, timeout=30)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.executescript(SCHEMA)
+        finally:
+            os.umask(umask)
+        for name in (path, f"{path}-wal", f"{path}-shm"):
+            if os.path.exists(name):
+                os.chmod(name, 0o600)
+
+    def close(self):
+        self.db.close()
+
+    def is_fresh(self, target, vmid=None, max_age=600, now=None):
+        now = time.time() if now is None else now
+        rows = self.db.execute('SELECT used, refreshed FROM listings WHERE storage = ? AND vmid IN (0, ?)',
+                               (target_key(target), vmid or 0)).fetchall()
+        return any(now - refreshed < max_age and (target.used is None or used == target.used)
+                   for used, refreshed in rows)
+
+    def replace(self, target, content, vmid=None, now=None):
+        """Replace the rows of ``target`` (only those of ``vmid`` when given) with ``content``."""
+        now = time.time() if now is None else now
+        key = target_key(target)
+        with self.db:
+            if vmid:
+                self.db.execute('DELETE FROM backups WHERE storage = ? AND vmid = ?', (key, vmid))
+            else:
+                self.db.execute('DELETE FROM backups WHERE storage = ?', (key,))
+                self.db.execute('DELETE FROM listings WHERE storage = ?', (key,))
+            self.db.executemany(
+                'INSERT OR REPLACE INTO backups (storage, volid, vmid, ctime, size, node, data) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ((key, b['volid'], b.get('vmid'), b.get('ctime'), b.get('size'), target.node, json.dumps(b))
+                 for b in content if not vmid or b.get('vmid') == vmid))
+            self.db.execute('INSERT OR REPLACE INTO listings (storage, vmid, used, refreshed) VALUES (?, ?, ?, ?)',
+                            (key, vmid or 0, target.used, now))
+
+    def query(self, targets, vmid=None, since=None, until=None):
+        """Yield the indexed backups of ``targets``, newest first, filtered by VMID and ctime range."""
+        keys = sorted(set(target_key(t) for t in targets))
+        if not keys:
+            return
+        sql = f"SELECT node, data FROM backups WHERE storage IN ({', '.join('?' * len(keys))})"
+        args = list(keys)
+        if vmid:
+            sql += ' AND vmid = ?'
+            args.append(vmid)
+        if since is not None:
+            sql += ' AND ctime >= ?'
+            args.append(since)
+        if until is not None:
+            sql += ' AND ctime < ?'
+            args.append(until)
+        for node, data in self.db.execute(sql + ' ORDER BY ctime DESC', args):
+            backup = json.loads(data)
+            backup['node'] = node
+            yield backup
+
+
+def index_path(cache_dir, host, port, user):
+    """Return the path of the index of a host, port and user, whose ACL decides what the listings hold."""
+    key = hashlib.sha256(f"{user}@{host}:{port}".encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f"index-{key}.sqlite")
+
+
+def open_index(cache_dir, host, port, user):
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, mode=0o700)
+        return BackupIndex(index_path(cache_dir, host, port, user))
+    except (OSError, sqlite3.Error) as e:
+        raise BackupIndexError(f"Unable to open the backup index in {cache_dir}: {str(e)}")
+
+
+def indexed_backups(proxmox, index, targets, vmid=None, max_workers=4, max_age=600, since=None, selected=None):
+    """List the backups on ``targets`` through ``index``, only listing the storages whose index is stale.
+
+    Backups are read from the index from ``since`` on and streamed into
+    ``selected`` like in list_backups().  Returns the selected backups newest
+    first, a map of ``node/storage`` to error message for the storages that
+    could not be listed, and counts of the storages answered from the index
+    (``hits``) and listed again (``refreshed``).
+    """
+    now = time.time()
+    stale = [t for t in targets if not index.is_fresh(t, vmid, max_age, now)]
+    errors = {}
+    for target, content, error in fan_out(lambda t: storage_content(proxmox, t, vmid), stale, max_workers):
+        if error is not None:
+            errors[storage_key(target.node, target.storage)] = str(error)
+        else:
+            index.replace(target, content, vmid, now)
+    failed = set(errors)
+    listed = [t for t in targets if storage_key(t.node, t.storage) not in failed]
+    stats = dict(hits=len(targets) - len(stale), refreshed=len(stale) - len(errors))
+    selected = NewestBackups() if selected is None else selected
+    return selected.extend(index.query(listed, vmid, since)).result(), errors, stats
@@ -0,0 +1,248 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import heapq
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# A storage to list through ``node``.  ``used`` is the storage usage in bytes
+# reported during discovery, or None when it is unknown.
+StorageTarget = namedtuple('StorageTarget', ['node', 'storage', 'shared', 'used'])
+# Guests of a node looked up one by one by latest_backups(); more are found with one listing.
+FILTERED_LOOKUP_LIMIT = 20
+
+
+def fan_out(func, items, max_workers):
+    """Call ``func`` on every item using at most ``max_workers`` threads.
+
+    Yields ``(item, result, error)`` tuples in completion order.  Exceptions are
+    captured per item so one failing call does not abort the others.
+    """
+    items = list(items)
+    if not items:
+        return
+    if max_workers <= 1 or len(items) == 1:
+        for item in items:
+            try:
+                yield item, func(item), None
+            except Exception as e:
+                yield item, None, e
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        futures = dict((executor.submit(func, item), item) for item in items)
+        for future in as_completed(futures):
+            error = future.exception()
+            yield futures[future], None if error else future.result(), error
+
+
+def storage_key(node, storage):
+    return f"{node}/{storage}"
+
+
+def target_key(target):
+    """Key of ``target``; shared storages do not depend on the node they are listed through."""
+    return target.storage if target.shared else storage_key(target.node, target.storage)
+
+
+def discover_storages(proxmox, nodes, storage='all', max_workers=4):
+    """Return the StorageTargets to list and a map of per-node errors."""
+    if storage != 'all':
+        return [StorageTarget(node, storage, False, None) for node in nodes], {}
+
+    def node_storages(node):
+        return [(s['storage'], bool(s.get('shared')), s.get('used'))
+                for s in proxmox.nodes(node).storage.get(content='backup')]
+
+    targets = []
+    errors = {}
+    for node, storages, error in fan_out(node_storages, nodes, max_workers):
+        if error is not None:
+            errors[node] = str(error)
+        else:
+            targets.extend(StorageTarget(node, stor, shared, used) for stor, shared, used in storages)
+    targets.sort()
+    return targets, errors
+
+
+def discover_cluster_storages(proxmox, nodes=None, storage='all', resources=None):
+    """Return the StorageTargets to list from a single /cluster/resources call.
+
+    Only online nodes (restricted to ``nodes`` when given) and available storages
+    with backup content are used.  A shared storage is listed once, through the
+    first node that can reach it, instead of once per node.  ``resources`` is an
+    already fetched, unfiltered /cluster/resources list to use instead of
+    calling the API.
+    """
+    if resources is None:
+        resources = proxmox.cluster.resources.get()
+    online = set(r['node'] for r in resources
+                 if r.get('type') == 'node' and r.get('status') == 'online')
+    if nodes:
+        online &= set(nodes)
+    targets = set()
+    shared = {}
+    used = {}
+    for r in resources:
+        if r.get('type') != 'storage' or r.get('node') not in online:
+            continue
+        if r.get('status') != 'available' or 'backup' not in r.get('content', '').split(','):
+            continue
+        if storage != 'all' and r['storage'] != storage:
+            continue
+        used[r['node'], r['storage']] = r.get('disk')
+        if r.get('shared'):
+            shared[r['storage']] = min(shared.get(r['storage'], r['node']), r['node'])
+        else:
+            targets.add(StorageTarget(r['node'], r['storage'], False, r.get('disk')))
+    targets.update(StorageTarget(node, stor, True, used[node, stor]) for stor, node in shared.items())
+    return sorted(targets), {}
+
+
+def storage_content(proxmox, target, vmid=None):
+    """List the backups on ``target``, filtered by ``vmid`` on the server when given."""
+    if vmid:
+        return proxmox.nodes(target.node).storage(target.storage).content.get(content='backup', vmid=vmid)
+    return proxmox.nodes(target.node).storage(target.storage).content.get(content='backup')
+
+
+def latest_backups(proxmox, storage, groups, since=None, max_workers=4, per_vmid_threshold=FILTERED_LOOKUP_LIMIT):
+    """Return the newest backup on ``storage`` of every VMID in ``groups`` (node to VMIDs) and the lookup errors.
+
+    Up to ``per_vmid_threshold`` guests of a node are looked up with one
+    server-side filtered listing each; for more guests the storage is listed
+    once through that node instead.  Backups older than ``since`` are ignored.
+    Errors are keyed by VMID for filtered lookups and by node for listings.
+    """
+    lookups = []
+    for node, vmids in sorted(groups.items()):
+        if len(vmids) <= per_vmid_threshold:
+            lookups.extend((node, vmid) for vmid in vmids)
+        else:
+            lookups.append((node, None))
+    wanted = set(vmid for vmids in groups.values() for vmid in vmids)
+    newest = {}
+    errors = {}
+
+    def lookup(item):
+        node, vmid = item
+        return storage_content(proxmox, StorageTarget(node, storage, False, None), vmid)
+
+    for (node, vmid), content, error in fan_out(lookup, lookups, max_workers):
+        if error is not None:
+            errors[node if vmid is None else vmid] = str(error)
+            continue
+        for backup in content:
+            ctime = backup.get('ctime') or 0
+            if backup.get('vmid') not in wanted or (vmid and backup.get('vmid') != vmid):
+                continue
+            if since is not None and ctime < since:
+                continue
+            if ctime > (newest.get(backup['vmid']) or {}).get('ctime', -1):
+                newest[backup['vmid']] = backup
+    return newest, errors
+
+
+class NewestBackups:
+    """Keep the ``limit`` newest backups of every VMID from a stream of backups.
+
+    Each VMID gets a min-heap bounded to ``limit`` entries, so memory depends on
+    the number of guests and ``limit`` rather than on the number of backups.
+    With ``per_vmid=False`` a single heap holds the newest backups overall; with
+    ``limit=None`` every backup is kept.
+    """
+
+    def __init__(self, limit=None, per_vmid=True):
+        self.limit = limit
+        self.per_vmid = per_vmid
+        self.groups = {}
+        self.seen = 0
+
+    def add(self, backup):
+        self.seen += 1
+        # the sequence number keeps entries with the same ctime from comparing the dicts
+        entry = (backup.get('ctime') or 0, self.seen, backup)
+        heap = self.groups.setdefault(backup.get('vmid') if self.per_vmid else None, [])
+        if self.limit is None or len(heap) < self.limit:
+            heapq.heappush(heap, entry)
+        elif entry[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, entry)
+
+    def extend(self, backups):
+        for backup in backups:
+            self.add(backup)
+        return self
+
+    def result(self):
+        """Return the kept backups, newest first."""
+        entries = [entry for heap in self.groups.values() for entry in heap]
+        entries.sort(key=lambda entry: entry[:2], reverse=True)
+        return [entry[2] for entry in entries]
+
+
+class BackupStats:
+    """Aggregate a stream of backups into per-VMID counts, total size and newest backup.
+
+    A drop-in for NewestBackups in list_backups() when only a summary per guest
+    is needed; memory depends on the number of guests only.  With
+    ``per_storage`` the creation time of the newest backup on every storage is
+    kept as well, under ``storages``.
+    """
+
+    def __init__(self, per_storage=False):
+        self.per_storage = per_storage
+        self.stats = {}
+
+    def add(self, backup):
+        stats = self.stats.get(backup.get('vmid'))
+        if stats is None:
+            stats = self.stats[backup.get('vmid')] = dict(backup_count=0, total_size=0, latest_backup=None,
+                                                          latest_ctime=None)
+            if self.per_storage:
+                stats['storages'] = {}
+        stats['backup_count'] += 1
+        stats['total_size'] += backup.get('size') or 0
+        ctime = backup.get('ctime') or 0
+        if stats['latest_ctime'] is None or ctime > stats['latest_ctime']:
+            stats.update(latest_backup=backup['volid'], latest_ctime=ctime)
+        if self.per_storage:
+            storage = backup['volid'].split(':', 1)[0]
+            if ctime > stats['storages'].get(storage, -1):
+                stats['storages'][storage] = ctime
+
+    def result(self):
+        """Return the stats keyed by VMID."""
+        return self.stats
+
+
+def list_backups(proxmox, targets, vmid=None, max_workers=4, since=None, selected=None):
+    """List the backups on every StorageTarget in parallel.
+
+    Backups are deduplicated by volid (and node, for storages that are not
+    shared), so a shared storage reachable through several targets only
+    contributes each backup once.  Backups older than ``since`` are skipped and
+    the others are streamed into ``selected`` (a NewestBackups keeping every
+    backup by default).  Returns the selected backups, newest first, and a map
+    of ``node/storage`` to error message for the storages that could not be
+    listed.
+    """
+    selected = NewestBackups() if selected is None else selected
+    seen = set()
+    errors = {}
+    for target, content, error in fan_out(lambda t: storage_content(proxmox, t, vmid), targets, max_workers):
+        if error is not None:
+            errors[storage_key(target.node, target.storage)] = str(error)
+            continue
+        for backup in content:
+            if (vmid and vmid != backup.get('vmid')):
+                continue
+            if since is not None and (backup.get('ctime') or 0) < since:
+                continue
+            key = backup['volid'] if target.shared else (target.node, backup['volid'])
+            if key not in seen:
+                seen.add(key)
+                backup['node'] = target.node
+                selected.add(backup)
+    return selected.result(), errors
@@ -0,0 +1,88 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import errno
+import fcntl
+import os
+import re
+import time
+
+
+class GuestLockTimeout(Exception):
+    """A guest lock was still held by another process when the lock timeout expired."""
+
+    def __init__(self, vmid, timeout):
+        self.vmid = vmid
+        self.timeout = timeout
+        super(GuestLockTimeout, self).__init__(f"Timed out after {timeout}s waiting for the lock of VM {vmid}")
+
+
+def cluster_name(proxmox, default):
+    """Return the name of the cluster, the node name of a standalone node, or ``default``."""
+    status = proxmox.cluster.status.get()
+    for entry in status:
+        if entry.get('type') == 'cluster':
+            return entry['name']
+    for entry in status:
+        if entry.get('type') == 'node' and entry.get('local'):
+            return entry['name']
+    return default
+
+
+class GuestLocks:
+    """Exclusive locks on guests shared by the processes of one host, one file per cluster and VMID.
+
+    Forks running the same play take the lock of every guest they are about to
+    back up, so only one of them submits a job for a guest while the others
+    wait and then find that job running.  Locks are taken in VMID order, which
+    cannot deadlock, and are ``flock`` locks released by the system if the
+    process dies.  The files live on the host running the module, so runs on
+    different managed hosts only exclude each other when they all run on the
+    controller.
+    """
+
+    def __init__(self, lock_dir, cluster, timeout=300, poll_interval=0.1, clock=time.monotonic, sleep=time.sleep):
+        self.lock_dir = lock_dir
+        self.cluster = re.sub(r'[^A-Za-z0-9_.-]', '_', cluster)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.sleep = sleep
+        self.held = {}
+        self.waited = 0.0
+
+    def path(self, vmid):
+        return os.path.join(self.lock_dir, f"{self.cluster}-{vmid}.lock")
+
+    def acquire(self, vmids):
+        os.makedirs(self.lock_dir, mode=0o700, exist_ok=True)
+        started = self.clock()
+        for vmid in sorted(set(vmids) - set(self.held)):
+            fd = os.open(self.path(vmid), os.O_RDWR | os.O_CREAT, 0o600)
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except OSError as e:
+                    if e.errno not in (errno.EAGAIN, errno.EACCES):
+                        os.close(fd)
+                        raise
+                if self.clock() - started >= self.timeout:
+                    os.close(fd)
+                    raise GuestLockTimeout(vmid, self.timeout)
+                self.sleep(self.poll_interval)
+            self.held[vmid] = fd
+        self.waited += self.clock() - started
+
+    def release(self, vmids):
+        for vmid in vmids:
+            fd = self.held.pop(vmid, None)
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def release_all(self):
+        self.release(list(self.held))
@@ -0,0 +1,231 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from urllib.parse import unquote, urlsplit
+
+# Path segments following these ones are names or IDs, reported as placeholders
+# so requests to the same endpoint are counted together.
+PLACEHOLDERS = {
+    'nodes': '{node}',
+    'storage': '{storage}',
+    'content': '{volume}',
+    'qemu': '{vmid}',
+    'lxc': '{vmid}',
+    'tasks': '{upid}',
+    'pools': '{pool}',
+}
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def metrics_argument_spec():
+    return dict(
+        collect_metrics=dict(type='bool', default=False, required=False),
+        metrics_file=dict(type='path', default=None, required=False),
+        metrics_format=dict(type='str', default='json', choices=['json', 'openmetrics'], required=False),
+    )
+
+
+def endpoint(method, url):
+    """Return ``METHOD path`` for a request, with names and IDs in the path replaced by placeholders."""
+    segments = unquote(urlsplit(url).path).split('/api2/json/', 1)[-1].strip('/').split('/')
+    for i in range(1, len(segments)):
+        placeholder = PLACEHOLDERS.get(segments[i - 1])
+        if placeholder == '{volume}':
+            # volume IDs may contain slashes
+            segments[i:] = [placeholder]
+            break
+        if placeholder is not None:
+            segments[i] = placeholder
+    return f"{method} {'/'.join(segments)}"
+
+
+def quantile(values, q):
+    """Return the ``q`` quantile of sorted ``values`` using the nearest-rank method."""
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+class Metrics:
+    """API request and phase timings of one module run.
+
+    Once attached to a client, every response is recorded with its endpoint,
+    latency, body size and whether it retried a request, from a requests
+    session hook for proxmoxer or as an observer of a DirectClient.
+    ``phase(name)`` times a part of the run; phases nest and the time of an
+    inner phase is not counted in the outer one.  A disabled instance records
+    nothing, so modules can use it unconditionally.
+    """
+
+    def __init__(self, enabled=True, clock=time.monotonic):
+        self.enabled = enabled
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.sizes = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.retries = 0
+        self.phases = defaultdict(float)
+        self.stack = []
+        self.session = None
+        self.started = clock()
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        now = self.clock()
+        if self.stack:
+            outer = self.stack[-1]
+            self.phases[outer[0]] += now - outer[1]
+        self.stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = self.clock()
+            name, start = self.stack.pop()
+            self.phases[name] += now - start
+            if self.stack:
+                self.stack[-1][1] = now
+
+    def attach(self, proxmox):
+        """Record the requests made through ``proxmox``, a ProxmoxAPI or the root of a DirectClient."""
+        if not self.enabled or self.session is not None:
+            return
+        client = getattr(proxmox, '_client', None)
+        if client is not None:
+            self.session = client
+            client.observers.append(self.record)
+            return
+        self.session = proxmox._store['session']
+        self.session.hooks['response'].append(self.on_response)
+
+    def detach(self):
+        if self.session is None:
+            return
+        observers = getattr(self.session, 'observers', None)
+        if observers is not None:
+            if self.record in observers:
+                observers.remove(self.record)
+        elif self.on_response in self.session.hooks['response']:
+            self.session.hooks['response'].remove(self.on_response)
+        self.session = None
+
+    def on_response(self, response, **kwargs):
+        self.record(endpoint(response.request.method, response.request.url), response.elapsed.total_seconds(),
+                    len(response.content or b''), response.status_code,
+                    getattr(response.request, 'ticket_retried', False)
+                    or getattr(response.request, 'retry_attempt', 0) > 0)
+        return response
+
+    def record(self, name, seconds, size=0, status=200, retry=False):
+        with self.lock:
+            self.latencies[name].append(seconds)
+            self.sizes[name] += size
+            if status >= 400:
+                self.errors[name] += 1
+            if retry:
+                self.retries += 1
+
+    def summary(self):
+        endpoints = {}
+        for name, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            endpoints[name] = dict(count=len(latencies), errors=self.errors[name], bytes=self.sizes[name],
+                                   total_seconds=round(sum(latencies), 6), max_seconds=round(latencies[-1], 6),
+                                   **dict((f"p{int(q * 100)}_seconds", round(quantile(latencies, q), 6))
+                                          for q in QUANTILES))
+        return dict(requests=sum(e['count'] for e in endpoints.values()),
+                    bytes_received=sum(e['bytes'] for e in endpoints.values()),
+                    retries=self.retries, endpoints=endpoints,
+                    phases=dict((name, round(seconds, 6)) for name, seconds in self.phases.items()),
+                    wall_time=round(self.clock() - self.started, 6))
+
+    def json_line(self, module_name, summary):
+        return json.dumps(dict(summary, module=module_name, time=time.time()), sort_keys=True) + '\n'
+
+    def openmetrics(self, module_name, summary):
+        label = f'module="{module_name}"'
+        lines = ['# TYPE proxmox_backup_api_requests counter']
+        lines += [f'proxmox_backup_api_requests_total{{{label},endpoint="{name}"}} {e["count"]}'
+                  for name, e in summary['endpoints'].items()]
+        lines.append('# TYPE proxmox_backup_api_request_errors counter')
+        lines += [f'proxmox_backup_api_request_errors_total{{{label},endpoint="{name}"}} {e["errors"]}'
+                  for name, e in summary['endpoints'].items()]
+        lines.append('# TYPE proxmox_backup_api_response_bytes counter')
+        lines += [f'proxmox_backup_api_response_bytes_total{{{label},endpoint="{name}"}} {e["bytes"]}'
+                  for name, e in summary['endpoints'].items()]
+        lines += ['# TYPE proxmox_backup_api_request_seconds summary', '# UNIT proxmox_backup_api_request_seconds seconds']
+        for name, e in summary['endpoints'].items():
+            for q in QUANTILES:
+                lines.append(f'proxmox_backup_api_request_seconds{{{label},endpoint="{name}",quantile="{q}"}} '
+                             f'{e[f"p{int(q * 100)}_seconds"]}')
+            lines.append(f'proxmox_backup_api_request_seconds_sum{{{label},endpoint="{name}"}} {e["total_seconds"]}')
+            lines.append(f'proxmox_backup_api_request_seconds_count{{{label},endpoint="{name}"}} {e["count"]}')
+        lines += ['# TYPE proxmox_backup_api_retries counter',
+                  f'proxmox_backup_api_retries_total{{{label}}} {summary["retries"]}',
+                  '# TYPE proxmox_backup_phase_seconds gauge', '# UNIT proxmox_backup_phase_seconds seconds']
+        lines += [f'proxmox_backup_phase_seconds{{{label},phase="{name}"}} {seconds}'
+                  for name, seconds in sorted(summary['phases'].items())]
+        lines += ['# TYPE proxmox_backup_wall_time_seconds gauge', '# UNIT proxmox_backup_wall_time_seconds seconds',
+                  f'proxmox_backup_wall_time_seconds{{{label}}} {summary["wall_time"]}', '# EOF']
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, fmt, module_name, summary):
+        """Append ``summary`` to ``path`` as a JSON line, or replace ``path`` with it in OpenMetrics format."""
+        if fmt == 'json':
+            with open(path, 'a') as f:
+                f.write(self.json_line(module_name, summary))
+            return
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(self.openmetrics(module_name, summary))
+        os.rename(tmp, path)
+
+
+def module_metrics(module, module_name):
+    """Return the Metrics of a module run, added to its result as ``metrics`` when O(collect_metrics=true).
+
+    The module's ``exit_json`` and ``fail_json`` are wrapped so every result
+    carries the metrics and, with O(metrics_file), the metrics are written
+    once the module exits.
+    """
+    params = module.params
+    metrics = Metrics(enabled=params['collect_metrics'])
+    if not metrics.enabled:
+        return metrics
+    exit_json = module.exit_json
+    fail_json = module.fail_json
+
+    def report(kwargs):
+        # the controller-side fail_json goes through exit_json, only report once
+        if 'metrics' in kwargs:
+            return
+        metrics.detach()
+        kwargs['metrics'] = summary = metrics.summary()
+        if params['metrics_file']:
+            try:
+                metrics.write(params['metrics_file'], params['metrics_format'], module_name, summary)
+            except (IOError, OSError) as e:
+                module.warn(f"Unable to write metrics to {params['metrics_file']}: {str(e)}")
+
+    def exit_with_metrics(**kwargs):
+        report(kwargs)
+        exit_json(**kwargs)
+
+    def fail_with_metrics(msg, **kwargs):
+        report(kwargs)
+        fail_json(msg=msg, **kwargs)
+
+    module.exit_json = exit_with_metrics
+    module.fail_json = fail_with_metrics
+    return metrics
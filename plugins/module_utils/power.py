@@ -0,0 +1,172 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import time
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.tasks import (
+    TaskWatcher,
+    backoff_intervals,
+)
+
+
+class GuestStop:
+    """Progress of stopping one guest."""
+
+    def __init__(self, vmid, node, kind):
+        self.vmid = vmid
+        self.node = node
+        self.kind = kind
+        self.method = None
+        self.watcher = None
+        self.started = None
+        self.sent = None
+        self.finished = None
+        self.stopped = False
+        self.escalated = False
+        self.error = None
+
+    def result(self):
+        return dict(vmid=self.vmid, node=self.node, stopped=self.stopped, method=self.method,
+                    escalated=self.escalated, error=self.error,
+                    duration=None if self.finished is None else round(self.finished - self.started, 3))
+
+
+class StopEngine:
+    """Stop many guests at once and confirm each one is stopped.
+
+    A shutdown (or a stop with ``hard_stop``) is sent to every guest up front
+    and the resulting tasks are polled together, sleeping one shared backoff
+    interval per round.  With ``escalate``, a guest whose shutdown failed or is
+    still running after ``shutdown_timeout`` seconds gets its shutdown task
+    aborted and a stop sent instead.  A guest only counts as stopped once its
+    current status says so.  Guests still running after ``timeout`` seconds
+    are reported as failed.
+    """
+
+    def __init__(self, proxmox, hard_stop=False, escalate=False, shutdown_timeout=None, timeout=None,
+                 poll_interval=1.0, max_poll_interval=30.0, clock=time.monotonic, sleep=time.sleep):
+        self.proxmox = proxmox
+        self.hard_stop = hard_stop
+        self.escalate = escalate
+        self.shutdown_timeout = shutdown_timeout
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.clock = clock
+        self.sleep = sleep
+        self.guests = []
+
+    def add(self, vmid, node, kind):
+        self.guests.append(GuestStop(vmid, node, kind))
+
+    def guest_api(self, guest):
+        return getattr(self.proxmox.nodes(guest.node), guest.kind)(guest.vmid)
+
+    def is_stopped(self, guest):
+        return self.guest_api(guest).status.current.get().get('status') == 'stopped'
+
+    def done(self, guest, error=None):
+        guest.finished = self.clock()
+        guest.watcher = None
+        guest.error = error
+        guest.stopped = error is None
+
+    def send(self, guest, method):
+        guest.method = method
+        guest.sent = self.clock()
+        try:
+            upid = getattr(self.guest_api(guest).status, method).post()
+        except Exception as e:
+            self.check(guest, str(e))
+            return
+        guest.watcher = TaskWatcher(self.proxmox, guest.node, upid, clock=self.clock, sleep=self.sleep)
+
+    def check(self, guest, error):
+        """Settle a guest whose last request failed: it may have been stopped already, or need a stop."""
+        try:
+            if self.is_stopped(guest):
+                self.done(guest)
+                return
+        except Exception as e:
+            error = str(e)
+        if guest.method == 'shutdown' and self.escalate:
+            self.escalate_guest(guest)
+        else:
+            self.done(guest, error)
+
+    def escalate_guest(self, guest):
+        guest.escalated = True
+        if guest.watcher is not None:
+            try:
+                self.proxmox.nodes(guest.node).tasks(guest.watcher.upid).delete()
+            except Exception:
+                pass
+            guest.watcher = None
+        self.send(guest, 'stop')
+
+    def poll(self, guest):
+        try:
+            if not guest.watcher.poll():
+                if (guest.method == 'shutdown' and self.escalate and self.shutdown_timeout is not None
+                        and self.clock() - guest.sent >= self.shutdown_timeout):
+                    self.escalate_guest(guest)
+                return
+        except Exception as e:
+            self.check(guest, str(e))
+            return
+        if guest.watcher.succeeded():
+            self.check(guest, f"VM {guest.vmid} is still running after {guest.method}")
+        else:
+            self.check(guest, f"{guest.method} failed: {guest.watcher.status.get('exitstatus')}")
+
+    def running(self):
+        return [g for g in self.guests if g.finished is None]
+
+    def next_deadline(self):
+        """Seconds until the next shutdown times out, or None."""
+        if not self.escalate or self.shutdown_timeout is None:
+            return None
+        deadlines = [g.sent + self.shutdown_timeout - self.clock() for g in self.running() if g.method == 'shutdown']
+        return max(0, min(deadlines)) if deadlines else None
+
+    def run(self):
+        """Stop every guest and return one result dict per guest."""
+        started = self.clock()
+        for guest in self.guests:
+            guest.started = started
+            self.send(guest, 'stop' if self.hard_stop else 'shutdown')
+        intervals = backoff_intervals(self.poll_interval, self.max_poll_interval)
+        while self.running():
+            for guest in self.running():
+                if guest.watcher is not None:
+                    escalated = guest.escalated
+                    self.poll(guest)
+                    if guest.escalated != escalated:
+                        intervals = backoff_intervals(self.poll_interval, self.max_poll_interval)
+            running = self.running()
+            if not running:
+                break
+            elapsed = self.clock() - started
+            if self.timeout is not None and elapsed >= self.timeout:
+                for guest in running:
+                    self.done(guest, f"Timed out after {self.timeout}s waiting for VM {guest.vmid} to stop")
+                break
+            delay = next(intervals)
+            deadline = self.next_deadline()
+            if deadline is not None:
+                delay = min(delay, deadline)
+            if self.timeout is not None:
+                delay = min(delay, self.timeout - elapsed)
+            self.sleep(max(0, delay))
+        return [guest.result() for guest in self.guests]
+
+
+def stop_engine(proxmox, params, **kwargs):
+    """Build a StopEngine from the module's stop and task wait options."""
+    return StopEngine(proxmox, hard_stop=params['hard_stop'], escalate=params['try_hard_stop'],
+                      shutdown_timeout=params['shutdown_timeout'], timeout=params['wait_timeout'],
+                      poll_interval=params['poll_interval'], max_poll_interval=params['max_poll_interval'],
+                      **kwargs)
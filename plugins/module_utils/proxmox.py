@@ -0,0 +1,158 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+import traceback
+
+from ansible.module_utils.basic import env_fallback, missing_required_lib
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.direct_client import direct_client
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.resilience import (  # noqa: F401
+    HAS_PROXMOXER,
+    PROXMOXER_IMP_ERR,
+    PROXMOXER_REQUIREMENT,
+    PROXMOXER_VERSION,
+    ResourceException,
+    http_argument_spec,
+    proxmoxer_supported,
+)
+
+# Proxmox VE tickets are valid for two hours.
+TICKET_LIFETIME = 7200
+# Cached tickets closer than this to expiry are not reused.
+TICKET_EXPIRY_MARGIN = 300
+
+# API clients (and with them their keep-alive HTTP sessions) already built in this
+# process, keyed by connection options.  A module process only builds one, but
+# loop items and tasks run by the controller-side action plugins reuse them.
+_CLIENTS = {}
+
+
+def proxmox_auth_argument_spec():
+    return dict(
+        api_host=dict(type='str', required=True),
+        api_user=dict(type='str', required=True),
+        api_password=dict(type='str', required=False, no_log=True,
+                          fallback=(env_fallback, ['PROXMOX_PASSWORD'])),
+        api_token_id=dict(type='str', required=False),
+        api_token_secret=dict(type='str', required=False, no_log=True),
+        api_port=dict(type='int', required=False, default=8006,
+                      fallback=(env_fallback, ['PROXMOX_PORT'])),
+        verify_ssl=dict(type='bool', default=True),
+        run_on_controller=dict(type='bool', default=False, required=False),
+        ticket_cache=dict(type='bool', default=False, required=False),
+        ticket_cache_dir=dict(type='path', default=None, required=False),
+        api_client=dict(type='str', default='proxmoxer', choices=['proxmoxer', 'direct'], required=False),
+        **http_argument_spec()
+    )
+
+
+PROXMOX_AUTH_REQUIRED_ONE_OF = [('api_password', 'api_token_id')]
+PROXMOX_AUTH_REQUIRED_TOGETHER = [('api_token_id', 'api_token_secret')]
+
+
+def default_cache_dir():
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+                        'mcfitz2.proxmox_backup')
+
+
+def cache_file(cache_dir, prefix, host, port, user):
+    """Return the path of a per host, port and user cache file in ``cache_dir``."""
+    key = hashlib.sha256(f"{user}@{host}:{port}".encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f"{prefix}-{key}.json")
+
+
+def write_private_json(path, data):
+    """Atomically write ``data`` as JSON to ``path``, readable only by the current user."""
+    cache_dir = os.path.dirname(path)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, mode=0o700)
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, prefix='.' + os.path.basename(path))
+    try:
+        os.chmod(tmp, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+
+class TicketCache:
+    """On-disk cache of a single authentication ticket, keyed by host, port and user."""
+
+    def __init__(self, cache_dir, host, port, user):
+        self.path = cache_file(cache_dir, 'ticket', host, port, user)
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if time.time() - entry.get('issued', 0) >= TICKET_LIFETIME - TICKET_EXPIRY_MARGIN:
+            return None
+        return entry
+
+    def store(self, ticket, csrf_token):
+        write_private_json(self.path, dict(ticket=ticket, csrf_token=csrf_token, issued=time.time()))
+
+    def evict(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def client_key(params, kwargs):
+    secret = params['api_token_secret'] or params['api_password'] or ''
+    return (params['api_client'], params['api_host'], params['api_port'], params['api_user'], params['api_token_id'],
+            hashlib.sha256(secret.encode('utf-8')).hexdigest(), params['verify_ssl'],
+            params['ticket_cache'], params['ticket_cache_dir'], tuple(sorted(kwargs.items())),
+            tuple(sorted((params['api_timeouts'] or {}).items())), params['api_retries'],
+            params['api_retry_backoff'], params['api_circuit_breaker_threshold'],
+            params['api_circuit_breaker_reset'])
+
+
+def connect(module, **kwargs):
+    """Return an API client for the module's connection options.
+
+    This is a ProxmoxAPI, or with O(api_client=direct) the root of a
+    DirectClient, which has the same interface.  API tokens are used when
+    given; otherwise the password logs in, reusing a cached ticket when
+    O(ticket_cache=true).  Extra keyword arguments are passed on to the client.
+    Clients are reused for identical options within a process.
+    """
+    key = client_key(module.params, kwargs)
+    if key not in _CLIENTS:
+        _CLIENTS[key] = build_client(module, **kwargs)
+    return _CLIENTS[key]
+
+
+def build_client(module, **kwargs):
+    params = module.params
+    direct = params.get('api_client') == 'direct'
+    if not direct and not HAS_PROXMOXER:
+        module.fail_json(msg=missing_required_lib(PROXMOXER_REQUIREMENT), exception=PROXMOXER_IMP_ERR)
+    if not direct and not proxmoxer_supported(PROXMOXER_VERSION):
+        module.fail_json(msg=f"proxmoxer {PROXMOXER_VERSION} is not supported, install {PROXMOXER_REQUIREMENT} "
+                             "or use api_client=direct")
+    tickets = None
+    if params['ticket_cache'] and not params['api_token_id']:
+        tickets = TicketCache(params['ticket_cache_dir'] or default_cache_dir(), params['api_host'],
+                              params['api_port'], params['api_user'])
+    try:
+        if direct:
+            return direct_client(params, tickets, **kwargs)
+        # the proxmoxer client imports requests, which takes longer than most module runs, so only load it here
+        from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.proxmoxer_client import proxmoxer_client
+        return proxmoxer_client(params, tickets, **kwargs)
+    except Exception as e:
+        module.fail_json(msg=f"Unable to connect to the Proxmox API: {str(e)}",
+                         exception=traceback.format_exc())
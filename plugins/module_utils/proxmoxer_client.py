@@ -0,0 +1,113 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import time
+
+from proxmoxer import AuthenticationError, ProxmoxAPI
+from proxmoxer.backends.https import ProxmoxHTTPAuth, ProxmoxHTTPAuthBase
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.resilience import make_resilient
+
+
+class CachedTicketAuth(ProxmoxHTTPAuth):
+    """Ticket authentication that reuses and refreshes a ticket from a TicketCache.
+
+    A full login with the password only happens when no usable ticket is cached
+    or when Proxmox rejects the cached one; renewals before expiry use the
+    ticket itself, which avoids the PAM/LDAP round-trip.
+    """
+
+    def __init__(self, cache, username, password, base_url, **kwargs):
+        ProxmoxHTTPAuthBase.__init__(self, **kwargs)
+        self.cache = cache
+        self.username = username
+        self.password = password
+        self.base_url = base_url
+        self.pve_auth_ticket = ""
+        entry = cache.load()
+        if entry:
+            self.pve_auth_ticket = entry['ticket']
+            self.csrf_prevention_token = entry['csrf_token']
+            self.birth_time = time.monotonic() - (time.time() - entry['issued'])
+        else:
+            self._get_new_tokens(password=password)
+
+    def _get_new_tokens(self, password=None, otp=None):
+        try:
+            super(CachedTicketAuth, self)._get_new_tokens(password=password, otp=otp)
+        except AuthenticationError:
+            if password is not None:
+                raise
+            # the cached ticket could not be renewed, log in again
+            self.cache.evict()
+            super(CachedTicketAuth, self)._get_new_tokens(password=self.password)
+        self.cache.store(self.pve_auth_ticket, self.csrf_prevention_token)
+
+    def __call__(self, req):
+        req = super(CachedTicketAuth, self).__call__(req)
+        req.register_hook('response', self.handle_401)
+        return req
+
+    def handle_401(self, response, **kwargs):
+        if response.status_code != 401 or getattr(response.request, 'ticket_retried', False):
+            return response
+        self.cache.evict()
+        self._get_new_tokens(password=self.password)
+
+        response.content  # consume the body so the connection can be reused
+        response.close()
+        request = response.request.copy()
+        request.ticket_retried = True
+        request.headers.pop('Cookie', None)
+        request.prepare_cookies(self.get_cookies())
+        if request.method != 'GET':
+            request.headers['CSRFPreventionToken'] = self.csrf_prevention_token
+        retry = response.connection.send(request, **kwargs)
+        retry.history.append(response)
+        retry.request = request
+        return retry
+
+
+def proxmoxer_client(params, tickets=None, **kwargs):
+    """Return a ProxmoxAPI for the connection options ``params``, sending through a ResilientSender.
+
+    With a TicketCache in ``tickets``, the password only logs in when no usable
+    ticket is cached.  Extra keyword arguments are passed on to ProxmoxAPI.
+    """
+    host = params['api_host']
+    port = params['api_port']
+    user = params['api_user']
+    if params['api_token_id']:
+        proxmox = ProxmoxAPI(host, port=port, user=user,
+                             token_name=params['api_token_id'],
+                             token_value=params['api_token_secret'],
+                             verify_ssl=params['verify_ssl'], **kwargs)
+    elif tickets is None:
+        proxmox = ProxmoxAPI(host, port=port, user=user,
+                             password=params['api_password'],
+                             verify_ssl=params['verify_ssl'], **kwargs)
+    else:
+        proxmox = ticket_cache_client(params, tickets, host, port, user, **kwargs)
+    make_resilient(proxmox, params)
+    return proxmox
+
+
+def ticket_cache_client(params, tickets, host, port, user, **kwargs):
+    """Build a client authenticating with a cached ticket, logging in only when needed.
+
+    proxmoxer cannot be built from an existing ticket, so create it with token
+    auth (which does not log in) and swap the cached ticket auth in.  That
+    relies on the private attributes of proxmoxer 2.x, see PROXMOXER_VERSIONS.
+    """
+    proxmox = ProxmoxAPI(host, port=port, user=user, token_name='ticket', token_value='',
+                         verify_ssl=params['verify_ssl'], **kwargs)
+    auth = CachedTicketAuth(tickets, user, params['api_password'],
+                            base_url=proxmox._backend.get_base_url(),
+                            verify_ssl=params['verify_ssl'],
+                            timeout=kwargs.get('timeout', 5))
+    proxmox._backend.auth = auth
+    proxmox._store['session'].auth = auth
+    return proxmox
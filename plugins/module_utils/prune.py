@@ -0,0 +1,136 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import time
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.listing import (
+    fan_out,
+    storage_content,
+    storage_key,
+    target_key,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.tasks import task_watcher
+
+# Keep options in the order Proxmox applies them, with the strftime format
+# naming the period a backup falls in (None: every backup is its own period).
+PRUNE_RULES = (
+    ('keep_last', None),
+    ('keep_hourly', '%Y/%m/%d/%H'),
+    ('keep_daily', '%Y/%m/%d'),
+    ('keep_weekly', '%G/%V'),
+    ('keep_monthly', '%Y/%m'),
+    ('keep_yearly', '%Y'),
+)
+
+
+def prune_marks(backups, keep):
+    """Mark every backup of one guest on one storage as ``keep``, ``remove`` or ``protected``.
+
+    ``backups`` must be sorted newest first and ``keep`` maps the keep options
+    of PRUNE_RULES to counts.  Like Proxmox, each rule keeps the newest backup
+    of its ``count`` most recent periods that are not already covered by a
+    backup kept by an earlier rule; protected backups are never removed and do
+    not count.  Returns the marks in the order of ``backups``.
+    """
+    marks = [('protected' if b.get('protected') else None) for b in backups]
+    times = [time.localtime(b.get('ctime') or 0) for b in backups]
+    for option, fmt in PRUNE_RULES:
+        count = keep.get(option)
+        if not count:
+            continue
+        periods = [i if fmt is None else time.strftime(fmt, t) for i, t in enumerate(times)]
+        covered = set(periods[i] for i, mark in enumerate(marks) if mark == 'keep')
+        kept = set()
+        for i, mark in enumerate(marks):
+            if mark is not None or periods[i] in covered:
+                continue
+            if periods[i] in kept:
+                marks[i] = 'remove'
+                continue
+            if len(kept) >= count:
+                break
+            kept.add(periods[i])
+            marks[i] = 'keep'
+    return [mark or 'remove' for mark in marks]
+
+
+class PrunePlan:
+    """Group streamed backups per storage and guest and split them into kept and removed ones.
+
+    Only the fields needed to plan and report are held per backup, so tens
+    of thousands of backups fit comfortably in memory.
+    """
+
+    FIELDS = ('volid', 'vmid', 'ctime', 'size', 'protected')
+
+    def __init__(self, keep, vmid=None):
+        self.keep = keep
+        self.vmid = vmid
+        self.groups = {}
+
+    def add(self, target, backups):
+        key = target_key(target)
+        for backup in backups:
+            if self.vmid and backup.get('vmid') != self.vmid:
+                continue
+            entry = dict((field, backup.get(field)) for field in self.FIELDS)
+            entry.update(node=target.node, storage=target.storage)
+            # a shared storage listed through several nodes only counts each backup once
+            self.groups.setdefault((key, entry['vmid']), {}).setdefault(entry['volid'], entry)
+
+    def plan(self):
+        """Return the kept and the removed backups, each newest first."""
+        kept = []
+        removed = []
+        for group in self.groups.values():
+            backups = sorted(group.values(), key=lambda b: b['ctime'] or 0, reverse=True)
+            for backup, mark in zip(backups, prune_marks(backups, self.keep)):
+                (removed if mark == 'remove' else kept).append(backup)
+        kept.sort(key=lambda b: b['ctime'] or 0, reverse=True)
+        removed.sort(key=lambda b: b['ctime'] or 0, reverse=True)
+        return kept, removed
+
+
+def plan_prune(proxmox, targets, keep, vmid=None, max_workers=4):
+    """List ``targets`` in parallel into a PrunePlan; returns the plan and the listing errors."""
+    plan = PrunePlan(keep, vmid)
+    errors = {}
+    for target, content, error in fan_out(lambda t: storage_content(proxmox, t, vmid), targets, max_workers):
+        if error is not None:
+            errors[storage_key(target.node, target.storage)] = str(error)
+        else:
+            plan.add(target, content)
+    return plan, errors
+
+
+def delete_backups(proxmox, backups, params, batch_size=20, max_workers=4):
+    """Delete ``backups`` in batches of ``batch_size``, running up to ``max_workers`` batches at once.
+
+    The backups of a batch are deleted one after the other, waiting for the
+    delete task when the storage runs one.  Returns a map of volid to error
+    message for the backups that could not be deleted.
+    """
+    size = max(1, batch_size)
+    batches = [backups[i:i + size] for i in range(0, len(backups), size)]
+
+    def delete_batch(batch):
+        errors = {}
+        for backup in batch:
+            try:
+                upid = proxmox.nodes(backup['node']).storage(backup['storage']).content(backup['volid']).delete()
+                if upid:
+                    task_watcher(proxmox, backup['node'], upid, params).wait()
+            except Exception as e:
+                errors[backup['volid']] = str(e)
+        return errors
+
+    errors = {}
+    for batch, batch_errors, error in fan_out(delete_batch, batches, max_workers):
+        if error is not None:
+            errors.update((backup['volid'], str(error)) for backup in batch)
+        else:
+            errors.update(batch_errors)
+    return errors
@@ -0,0 +1,252 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import random
+import re
+import threading
+import time
+import traceback
+from http.client import HTTPException
+from urllib.parse import urlsplit
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.metrics import endpoint
+
+# ProxmoxAPI cannot be given a requests session or auth, so the proxmoxer client
+# reaches into its private attributes (see make_resilient() and
+# ticket_cache_client()); these are the releases whose internals it was written for.
+PROXMOXER_REQUIREMENT = 'proxmoxer >= 2.0, < 3.0'
+PROXMOXER_VERSIONS = ((2, 0), (3, 0))
+
+PROXMOXER_IMP_ERR = None
+PROXMOXER_VERSION = None
+try:
+    # proxmoxer.core holds the exceptions without loading the HTTPS backend, and with it requests
+    from proxmoxer import __version__ as PROXMOXER_VERSION
+    from proxmoxer.core import AuthenticationError, ResourceException
+    HAS_PROXMOXER = True
+except ImportError:
+    HAS_PROXMOXER = False
+    PROXMOXER_IMP_ERR = traceback.format_exc()
+
+    class ResourceException(Exception):
+        """The API error of proxmoxer, for the direct client when proxmoxer is not installed."""
+
+        def __init__(self, status_code, status_message, content, errors=None):
+            self.status_code = status_code
+            self.status_message = status_message
+            self.content = content
+            self.errors = errors
+            if errors is not None:
+                content += f" - {errors}"
+            message = f"{status_code} {status_message}: {content}".strip()
+            super(ResourceException, self).__init__(message)
+
+    class AuthenticationError(Exception):
+        pass
+
+# Responses worth sending a GET again for: pveproxy answers 500/503 under load
+# and 595/596 when it cannot reach pvedaemon or another node.
+RETRY_STATUSES = frozenset((500, 502, 503, 504, 595, 596))
+# Status of the ResourceException raised when no response was received, like
+# pveproxy reports connection errors.
+CONNECTION_ERROR_STATUS = 595
+# Upper bound in seconds of the delay between two attempts of a request.
+MAX_RETRY_DELAY = 10.0
+# Read timeouts per call type.  None uses the timeout the client was built with.
+DEFAULT_TIMEOUTS = dict(connect=5.0, poll=10.0, listing=None, write=None, default=None)
+
+# Circuit breakers of the hosts contacted by this process, shared by all clients.
+_BREAKERS = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+class CircuitOpenError(ResourceException):
+    """Requests to a host are refused after too many consecutive failures.
+
+    It is a ResourceException so modules report it like any other API error.
+    """
+
+    def __init__(self, host, retry_in):
+        self.host = host
+        self.retry_in = retry_in
+        super(CircuitOpenError, self).__init__(
+            CONNECTION_ERROR_STATUS, 'Circuit Open',
+            f"too many failed requests to {host}, not retrying before {retry_in:.0f}s")
+
+
+def http_argument_spec():
+    return dict(
+        api_timeouts=dict(type='dict', required=False, apply_defaults=True, options=dict(
+            connect=dict(type='float', default=DEFAULT_TIMEOUTS['connect']),
+            poll=dict(type='float', default=DEFAULT_TIMEOUTS['poll']),
+            listing=dict(type='float'),
+            write=dict(type='float'),
+            default=dict(type='float'),
+        )),
+        api_retries=dict(type='int', default=3, required=False),
+        api_retry_backoff=dict(type='float', default=0.5, required=False),
+        api_circuit_breaker_threshold=dict(type='int', default=5, required=False),
+        api_circuit_breaker_reset=dict(type='float', default=30.0, required=False),
+    )
+
+
+def retry_delay(backoff, attempt, jitter=0.1):
+    """Seconds to wait before ``attempt`` (starting at 1): ``backoff`` doubled per attempt, with jitter."""
+    delay = min(backoff * 2 ** (attempt - 1), MAX_RETRY_DELAY)
+    return max(0, delay + random.uniform(-delay * jitter, delay * jitter))
+
+
+def call_type(method, url):
+    """Classify a request as ``poll``, ``listing``, ``write`` or ``default`` to pick its read timeout."""
+    if method != 'GET':
+        return 'write'
+    name = endpoint(method, url)
+    if name.startswith('GET nodes/{node}/tasks/{upid}/'):
+        return 'poll'
+    if name.endswith('/content'):
+        return 'listing'
+    return 'default'
+
+
+def is_transient(error):
+    """Whether ``error`` is a connection problem or server overload worth trying again later.
+
+    The connection errors and timeouts of requests are OSErrors like the socket
+    errors the direct client gets.
+    """
+    if isinstance(error, ResourceException):
+        return error.status_code in RETRY_STATUSES
+    return isinstance(error, (OSError, HTTPException))
+
+
+class CircuitBreaker:
+    """Stop sending requests to a host that keeps failing.
+
+    After ``threshold`` consecutive connection errors or retryable statuses the
+    circuit opens and requests fail at once with CircuitOpenError.  Once
+    ``reset_timeout`` seconds have passed a single request is let through; the
+    circuit closes again if it succeeds and stays open otherwise.
+    """
+
+    def __init__(self, host, threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.host = host
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened = None
+        self.probing = False
+
+    def allow(self):
+        with self.lock:
+            if self.opened is None:
+                return
+            retry_in = self.opened + self.reset_timeout - self.clock()
+            if retry_in > 0 or self.probing:
+                raise CircuitOpenError(self.host, max(0, retry_in))
+            self.probing = True
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+            self.probing = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures >= self.threshold:
+                self.opened = self.clock()
+
+
+def circuit_breaker(host, threshold, reset_timeout):
+    with _BREAKERS_LOCK:
+        if host not in _BREAKERS:
+            _BREAKERS[host] = CircuitBreaker(host, threshold, reset_timeout)
+        return _BREAKERS[host]
+
+
+class ResilientSender:
+    """Wrap ``Session.send`` with per call type timeouts, GET retries and a per-host circuit breaker.
+
+    Only GETs are sent again, after a connection error, a timeout or one of
+    RETRY_STATUSES, waiting an exponentially growing delay with jitter between
+    attempts.  Requests that start tasks are never repeated.  Every attempt
+    after the first is marked with ``retry_attempt`` so Metrics counts it as a
+    retry.  A connection error or timeout on the last attempt is raised as a
+    ResourceException with status 595, so modules report it like API errors.
+    """
+
+    def __init__(self, send, timeouts=None, retries=3, backoff=0.5, breaker_threshold=5, breaker_reset=30.0,
+                 sleep=time.sleep):
+        # requests is only loaded along with the proxmoxer client this wraps
+        from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+
+        self.transport_errors = (RequestsConnectionError, Timeout)
+        self.send = send
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **dict((k, v) for k, v in (timeouts or {}).items() if v is not None))
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.sleep = sleep
+
+    def timeout(self, kind, timeout):
+        if isinstance(timeout, tuple):
+            return timeout
+        return (self.timeouts['connect'], self.timeouts[kind] or timeout)
+
+    def __call__(self, request, **kwargs):
+        breaker = None
+        if self.breaker_threshold > 0:
+            breaker = circuit_breaker(urlsplit(request.url).netloc, self.breaker_threshold, self.breaker_reset)
+        kwargs['timeout'] = self.timeout(call_type(request.method, request.url), kwargs.get('timeout'))
+        attempts = 1 + max(0, self.retries) if request.method == 'GET' else 1
+        for attempt in range(attempts):
+            if attempt:
+                self.sleep(retry_delay(self.backoff, attempt))
+                request = request.copy()
+                request.retry_attempt = attempt
+            if breaker is not None:
+                breaker.allow()
+            try:
+                response = self.send(request, **kwargs)
+            except self.transport_errors as e:
+                if breaker is not None:
+                    breaker.failure()
+                if attempt + 1 == attempts:
+                    raise ResourceException(CONNECTION_ERROR_STATUS, type(e).__name__, str(e)) from e
+                continue
+            if response.status_code not in RETRY_STATUSES:
+                if breaker is not None:
+                    breaker.success()
+                return response
+            if breaker is not None:
+                breaker.failure()
+            if attempt + 1 == attempts:
+                return response
+            response.close()
+
+
+def proxmoxer_supported(version):
+    """Whether proxmoxer ``version`` is in PROXMOXER_VERSIONS."""
+    parts = tuple(int(part) for part in re.findall(r'\d+', version or '')[:2])
+    return PROXMOXER_VERSIONS[0] <= parts < PROXMOXER_VERSIONS[1]
+
+
+def make_resilient(proxmox, params):
+    """Send the requests of ``proxmox`` through a ResilientSender configured from the module's options."""
+    session = proxmox._store['session']
+    if isinstance(session.send, ResilientSender):
+        return
+    session.send = ResilientSender(session.send,
+                                   timeouts=params['api_timeouts'],
+                                   retries=params['api_retries'],
+                                   backoff=params['api_retry_backoff'],
+                                   breaker_threshold=params['api_circuit_breaker_threshold'],
+                                   breaker_reset=params['api_circuit_breaker_reset'])
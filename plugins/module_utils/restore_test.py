@@ -0,0 +1,222 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import re
+import time
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.metrics import quantile
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.resilience import ResourceException
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.scheduler import JobError
+
+NET_RE = re.compile(r'^net\d+$')
+# Free VMIDs tried after the one /cluster/nextid returned is already reserved by this run.
+MAX_VMID_PROBES = 100
+
+
+def allocate_vmid(proxmox, reserved):
+    """Return a free VMID from /cluster/nextid that is not in ``reserved``, and add it there.
+
+    Scratch guests only exist once their restore task created them, so the
+    VMIDs handed out earlier in the run are skipped by asking /cluster/nextid
+    whether the following ones are free.  It answers 400 for a VMID in use;
+    any other error is raised.
+    """
+    vmid = int(proxmox.cluster.nextid.get())
+    if vmid in reserved:
+        for candidate in range(max(reserved) + 1, max(reserved) + 1 + MAX_VMID_PROBES):
+            try:
+                vmid = int(proxmox.cluster.nextid.get(vmid=candidate))
+                break
+            except ResourceException as e:
+                if e.status_code != 400:
+                    raise
+        else:
+            raise JobError(f"No free VMID found after {MAX_VMID_PROBES} attempts")
+    reserved.add(vmid)
+    return vmid
+
+
+def agent_enabled(value):
+    """Whether the C(agent) option of a VM configuration enables the guest agent."""
+    first = str(value or '0').split(',')[0]
+    return first in ('1', 'enabled=1')
+
+
+def unplugged(config):
+    """Return the network interfaces of ``config`` with ``link_down=1`` added to the plugged ones."""
+    return dict((key, f"{value},link_down=1") for key, value in config.items()
+                if NET_RE.match(key) and 'link_down=1' not in str(value).split(','))
+
+
+class RestoreTest:
+    """Boot a guest restored to a scratch VMID with its network unplugged, time the boot, and destroy it.
+
+    It is driven by poll() like a TaskWatcher, with the UPID of the restore
+    task, so TaskPoller and run_jobs() run many tests side by side under the
+    restore concurrency limits and a test holds its slots until the guest is
+    gone.  Once the restore task succeeded every network interface gets
+    ``link_down=1`` and the guest is started; it counts as booted when its
+    guest agent answers a ping, or for containers and VMs without the agent
+    enabled, when its status is running.  The guest is then stopped and
+    destroyed, also after a failure unless ``keep_failed``.  ``restore`` is
+    the TaskWatcher of the restore task and ``watcher(node, upid)`` builds the
+    ones of the start, stop and destroy tasks.
+
+    From the start of the guest until it booted, the start task and then its
+    readiness are checked every ``boot_poll_interval`` seconds whatever the
+    backoff of the TaskPoller has grown to, so the boot time and RTO are
+    measured to that interval.
+    """
+
+    def __init__(self, proxmox, node, kind, vmid, restore, watcher, boot_timeout=300, keep_failed=False,
+                 boot_poll_interval=1.0, clock=time.monotonic):
+        self.proxmox = proxmox
+        self.node = node
+        self.kind = kind
+        self.vmid = vmid
+        self.upid = restore.upid
+        self.make_watcher = watcher
+        self.boot_timeout = boot_timeout
+        self.keep_failed = keep_failed
+        self.boot_poll_interval = boot_poll_interval
+        self.clock = clock
+        self.restore = restore
+        self.task = restore
+        self.stage = 'restore'
+        self.submitted = clock()
+        self.restored = None
+        self.start_sent = None
+        self.booted = None
+        self.finished = None
+        self.agent = False
+        self.unplugged = []
+        self.created = False
+        self.torn_down = False
+        self.error = None
+        self.teardown_error = None
+
+    @property
+    def log(self):
+        return self.restore.log
+
+    def max_poll_delay(self):
+        """Cap the TaskPoller sleep while the guest starts and boots, see TaskPoller."""
+        return self.boot_poll_interval if self.stage in ('start', 'boot') else None
+
+    def guest_api(self):
+        return getattr(self.proxmox.nodes(self.node), self.kind)(self.vmid)
+
+    def send(self, stage, upid):
+        self.stage = stage
+        self.task = self.make_watcher(self.node, upid)
+
+    def task_done(self, action):
+        """Poll the current task; return True once it succeeded, raise if it failed."""
+        if not self.task.poll():
+            return False
+        if not self.task.succeeded():
+            raise RuntimeError(f"{action} failed: {self.task.status.get('exitstatus')}")
+        return True
+
+    def ready(self):
+        api = self.guest_api()
+        if self.agent:
+            try:
+                api.agent.ping.post()
+                return True
+            except Exception:
+                return False
+        return api.status.current.get().get('status') == 'running'
+
+    def step(self):
+        if self.stage == 'restore':
+            if not self.task_done('Restore'):
+                return
+            self.created = True
+            self.restored = self.clock()
+            api = self.guest_api()
+            config = api.config.get()
+            self.agent = self.kind == 'qemu' and agent_enabled(config.get('agent'))
+            changes = unplugged(config)
+            if changes:
+                api.config.put(**changes)
+            self.unplugged = sorted(changes)
+            self.start_sent = self.clock()
+            self.send('start', api.status.start.post())
+        elif self.stage == 'start':
+            if self.task_done('Start'):
+                self.stage = 'boot'
+                self.step()
+        elif self.stage == 'boot':
+            checked = self.clock()
+            if self.ready():
+                # the guest answered this check, however long the rest of the poll round takes
+                self.booted = checked
+                self.teardown()
+            elif self.clock() - self.start_sent >= self.boot_timeout:
+                raise RuntimeError(f"VM {self.vmid} did not boot within {self.boot_timeout}s")
+        elif self.stage == 'stop':
+            if self.task_done('Stop'):
+                self.send('destroy', self.guest_api().delete(purge=1, **{'destroy-unreferenced-disks': 1}))
+        elif self.stage == 'destroy':
+            if self.task_done('Destroy'):
+                self.torn_down = True
+                self.finish()
+
+    def teardown(self):
+        if not self.created:
+            self.finish()
+        elif self.start_sent is None:
+            self.send('destroy', self.guest_api().delete(purge=1, **{'destroy-unreferenced-disks': 1}))
+        else:
+            self.send('stop', self.guest_api().status.stop.post())
+
+    def finish(self):
+        self.stage = 'done'
+        self.finished = self.clock()
+
+    def poll(self):
+        if self.finished is not None:
+            return True
+        try:
+            self.step()
+        except Exception as e:
+            if self.stage in ('stop', 'destroy'):
+                self.teardown_error = str(e)
+                self.finish()
+            else:
+                self.error = str(e)
+                if self.keep_failed:
+                    self.finish()
+                else:
+                    try:
+                        self.teardown()
+                    except Exception as teardown_error:
+                        self.teardown_error = str(teardown_error)
+                        self.finish()
+        return self.finished is not None
+
+    def succeeded(self):
+        return self.booted is not None and self.error is None
+
+    def result(self):
+        restore = None if self.restored is None else round(self.restored - self.submitted, 3)
+        boot = None if self.booted is None else round(self.booted - self.start_sent, 3)
+        return dict(vmid=self.vmid, node=self.node, resource_type=self.kind, upid=self.upid,
+                    restore_duration=restore, time_to_boot=boot,
+                    rto=None if self.booted is None else round(self.booted - self.submitted, 3),
+                    boot_check='agent' if self.agent else 'status', network_unplugged=self.unplugged,
+                    booted=self.booted is not None, torn_down=self.torn_down, error=self.error,
+                    teardown_error=self.teardown_error, progress=self.restore.progress_result())
+
+
+def rto_summary(rtos):
+    """Return the count, percentiles and maximum of the RTOs in seconds of the tests that booted."""
+    rtos = sorted(rtos)
+    if not rtos:
+        return dict(count=0, p50=None, p90=None, p95=None, p99=None, max=None)
+    return dict(count=len(rtos), max=rtos[-1],
+                **dict((f"p{int(q * 100)}", quantile(rtos, q)) for q in (0.5, 0.9, 0.95, 0.99)))
@@ -0,0 +1,120 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+from collections import Counter
+from http.client import HTTPException
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.resilience import (
+    AuthenticationError,
+    ResourceException,
+)
+
+
+class JobError(Exception):
+    """A job cannot be submitted, for a reason of its own such as no free VMID for a scratch guest."""
+
+
+# Errors of submit() that fail only the job: API errors (connection errors and
+# timeouts included, see ResilientSender), socket errors and JobError.
+SUBMIT_ERRORS = (ResourceException, AuthenticationError, OSError, HTTPException, JobError)
+
+
+class SlotLimiter:
+    """Track concurrency slots such as ``('node', 'pve1')`` against per-kind limits.
+
+    ``limits`` maps a slot kind (e.g. ``node`` or ``storage``) to the maximum
+    number of jobs holding a slot of that kind at once; kinds without a limit,
+    or with a limit of 0, are unbounded.
+    """
+
+    def __init__(self, limits):
+        self.limits = dict((kind, limit) for kind, limit in limits.items() if limit)
+        self.used = Counter()
+
+    def fits(self, slots):
+        return all(self.used[slot] < self.limits[slot[0]] for slot in slots if slot[0] in self.limits)
+
+    def acquire(self, slots):
+        self.used.update(slots)
+
+    def release(self, slots):
+        self.used.subtract(slots)
+
+
+class BandwidthBudget:
+    """Split a total bandwidth between the jobs running at the same time.
+
+    A bandwidth limit cannot be changed once a task runs, so each job gets its
+    share when it is submitted: the unallocated bandwidth divided by the number
+    of jobs that can still start next to the running ones.  The sum of the
+    shares of running jobs never exceeds ``total``.
+    """
+
+    def __init__(self, total, max_active):
+        self.total = total
+        self.max_active = max(1, max_active)
+        self.allocated = {}
+
+    def share(self, waiting):
+        """Return the share for the next job, with ``waiting`` jobs (including it) still to submit."""
+        free = self.total - sum(self.allocated.values())
+        slots = max(1, min(self.max_active - len(self.allocated), waiting))
+        return max(1, free // slots)
+
+    def acquire(self, key, share):
+        self.allocated[key] = share
+
+    def release(self, key):
+        self.allocated.pop(key, None)
+
+
+def max_active_jobs(jobs, limits):
+    """Return an upper bound of the number of ``jobs`` that can run at once under ``limits``."""
+    bound = len(jobs)
+    for kind, limit in limits.items():
+        if not limit:
+            continue
+        per_slot = Counter(slot for job in jobs for slot in set(job['slots']) if slot[0] == kind)
+        if per_slot:
+            bound = min(bound, sum(min(limit, count) for count in per_slot.values()))
+    return bound
+
+
+def run_jobs(jobs, submit, poller, limits, wait=True, on_finish=None):
+    """Submit ``jobs`` as their concurrency slots allow and wait on them with ``poller``.
+
+    Each job is a dict with a ``slots`` list.  ``submit(job)`` starts the job and
+    returns a TaskWatcher for it, which is stored as ``job['watcher']``; the
+    SUBMIT_ERRORS raised while submitting are stored as ``job['error']``
+    instead, any other exception is a bug and propagates.  Jobs are
+    submitted in order, skipping jobs whose slots are full.  When ``wait`` is
+    false the function returns as soon as every job has been submitted, leaving
+    the last ones running.  ``on_finish(job)`` is called as each job finishes.
+    """
+    limiter = SlotLimiter(limits)
+    pending = list(jobs)
+    running = {}
+    while pending or running:
+        for job in list(pending):
+            if not limiter.fits(job['slots']):
+                continue
+            pending.remove(job)
+            try:
+                job['watcher'] = submit(job)
+            except SUBMIT_ERRORS as e:
+                job['error'] = str(e)
+                continue
+            limiter.acquire(job['slots'])
+            running[job['watcher'].upid] = job
+            poller.add(job['watcher'])
+        if not running or (not pending and not wait):
+            break
+        for watcher in poller.wait_any():
+            job = running.pop(watcher.upid)
+            limiter.release(job['slots'])
+            if on_finish is not None:
+                on_finish(job)
+    return jobs
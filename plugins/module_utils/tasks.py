@@ -0,0 +1,309 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import random
+import time
+from collections import deque
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.resilience import is_transient
+
+# Lines requested from /tasks/{upid}/log per call.
+LOG_PAGE_SIZE = 500
+# Lines of task log kept for the module result.
+LOG_TAIL_SIZE = 50
+# Consecutive polls failing with a transient error after which a task is given up on.
+MAX_POLL_ERRORS = 10
+# Only line of a /tasks/{upid}/log page without lines, numbered 1 even past the end of a longer log.
+NO_CONTENT = 'no content'
+
+
+class ProxmoxTaskError(Exception):
+    """A Proxmox task finished with an exit status other than OK or WARNINGS."""
+
+    def __init__(self, upid, status, log=None):
+        self.upid = upid
+        self.status = status
+        self.log = log or []
+        super(ProxmoxTaskError, self).__init__(f"Task {upid} failed: {status.get('exitstatus')}")
+
+
+class ProxmoxTaskTimeout(Exception):
+    """A Proxmox task was still running when the wait timeout expired."""
+
+    def __init__(self, upid, timeout, log=None):
+        self.upid = upid
+        self.timeout = timeout
+        self.log = log or []
+        super(ProxmoxTaskTimeout, self).__init__(f"Timed out after {timeout}s waiting for task {upid}")
+
+
+def parse_upid(upid):
+    """Split a UPID (``UPID:node:pid:pstart:starttime:type:id:user:``) into its fields."""
+    fields = upid.split(':')
+    if len(fields) < 8 or fields[0] != 'UPID':
+        raise ValueError(f"Invalid UPID: {upid}")
+    return dict(node=fields[1], pid=int(fields[2], 16), pstart=int(fields[3], 16),
+                starttime=int(fields[4], 16), type=fields[5], id=fields[6], user=fields[7])
+
+
+def task_succeeded(exitstatus):
+    """Whether a task exit status is a success: C(OK), or C(WARNINGS: n) for a task that only logged warnings.
+
+    vzdump ends with warnings when, for example, freezing the guest file
+    systems timed out; the backup itself was still made.
+    """
+    return exitstatus == 'OK' or str(exitstatus or '').startswith('WARNINGS')
+
+
+def task_handle(node, upid):
+    """Return a handle that proxmox_task_wait can wait on later."""
+    return dict(node=node, upid=upid, starttime=parse_upid(upid)['starttime'])
+
+
+def task_wait_argument_spec():
+    return dict(
+        wait_timeout=dict(type='int', default=None, required=False),
+        poll_interval=dict(type='float', default=1.0, required=False),
+        max_poll_interval=dict(type='float', default=30.0, required=False),
+    )
+
+
+def backoff_intervals(poll_interval, max_poll_interval, backoff=1.5, jitter=0.1):
+    """Yield exponentially growing sleep intervals with +/- ``jitter`` spread."""
+    interval = poll_interval
+    max_poll_interval = max(poll_interval, max_poll_interval)
+    while True:
+        spread = interval * jitter
+        yield max(0, interval + random.uniform(-spread, spread))
+        interval = min(interval * backoff, max_poll_interval)
+
+
+class TaskWatcher:
+    """Wait for a Proxmox task using exponential backoff with jitter.
+
+    The interval between status polls starts at ``poll_interval`` and grows by
+    ``backoff`` after every poll up to ``max_poll_interval``.  The task log is
+    read incrementally through its ``start``/``limit`` cursor so each line is
+    only transferred once; ``on_line`` is called with every new line.
+
+    A poll failing with a transient error (see is_transient()) does not lose
+    the task: the next poll asks for it again by its UPID and continues the log
+    from the same cursor.  Only ``max_poll_errors`` consecutive failures raise.
+
+    Log lines are also fed to ``progress`` (a ProgressTracker) when given; if it
+    reports that the task stalled, the task is stopped and fails.
+    """
+
+    def __init__(self, proxmox, node, upid, poll_interval=1.0, max_poll_interval=30.0,
+                 timeout=None, backoff=1.5, jitter=0.1, clock=time.monotonic, sleep=time.sleep,
+                 on_line=None, max_poll_errors=MAX_POLL_ERRORS, progress=None):
+        self.proxmox = proxmox
+        self.node = node
+        self.upid = upid
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.timeout = timeout
+        self.backoff = backoff
+        self.jitter = jitter
+        self.clock = clock
+        self.sleep = sleep
+        self.on_line = on_line
+        self.max_poll_errors = max_poll_errors
+        self.progress = progress
+        self.log = deque(maxlen=LOG_TAIL_SIZE)
+        self.log_offset = 0
+        self.polls = 0
+        self.log_requests = 0
+        self.poll_errors = 0
+        self.failed_polls = 0
+        self.started = None
+        self.finished = None
+        self.finished_at = None
+        self.status = None
+
+    def intervals(self):
+        return backoff_intervals(self.poll_interval, self.max_poll_interval, self.backoff, self.jitter)
+
+    def poll_status(self):
+        self.polls += 1
+        self.status = self.proxmox.nodes(self.node).tasks(self.upid).status.get()
+        return self.status
+
+    def poll_log(self):
+        while True:
+            self.log_requests += 1
+            lines = self.proxmox.nodes(self.node).tasks(self.upid).log.get(start=self.log_offset,
+                                                                           limit=LOG_PAGE_SIZE)
+            elapsed = self.clock() - self.started
+            if len(lines) == 1 and lines[0].get('t') == NO_CONTENT and int(lines[0].get('n', 0)) == 1:
+                # the task has not logged past the cursor yet
+                return
+            for line in lines:
+                self.log.append(line['t'])
+                if self.on_line is not None:
+                    self.on_line(line['t'])
+                if self.progress is not None:
+                    self.progress.feed(line['t'], elapsed)
+            if lines:
+                # ``n`` numbers the lines from 1, so the last one is the offset of the next
+                self.log_offset = max(self.log_offset, int(lines[-1]['n']))
+            if len(lines) < LOG_PAGE_SIZE:
+                return
+
+    def poll(self):
+        """Poll the task status and log once; return True once the task has stopped."""
+        if self.started is None:
+            self.started = self.clock()
+        try:
+            running = self.poll_status()['status'] == 'running'
+            self.poll_log()
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            self.poll_errors += 1
+            self.failed_polls += 1
+            if self.failed_polls > self.max_poll_errors:
+                raise
+            return False
+        self.failed_polls = 0
+        if running and self.progress is not None:
+            throughput = self.progress.stalled(self.elapsed())
+            if throughput is not None:
+                self.abort(f"throughput of {throughput:.1f} MiB/s over the last {self.progress.window}s is below "
+                           f"{self.progress.min_throughput} MiB/s")
+                running = False
+        if not running:
+            self.finished = self.clock()
+            self.finished_at = time.time()
+        return not running
+
+    def abort(self, reason):
+        """Stop the task on Proxmox and mark it as failed with ``reason``."""
+        try:
+            self.proxmox.nodes(self.node).tasks(self.upid).delete()
+        except Exception:
+            pass
+        self.status = dict(self.status, status='stopped', exitstatus=reason)
+        self.log.append(f"TASK ERROR: {reason}")
+
+    def elapsed(self):
+        return (self.clock() if self.finished is None else self.finished) - self.started
+
+    def stats(self):
+        return dict(polls=self.polls,
+                    poll_errors=self.poll_errors,
+                    log_requests=self.log_requests,
+                    log_lines=self.log_offset,
+                    wall_time=round(self.elapsed(), 3))
+
+    def succeeded(self):
+        return task_succeeded(self.status.get('exitstatus'))
+
+    def result(self):
+        if not self.succeeded():
+            raise ProxmoxTaskError(self.upid, self.status, list(self.log))
+        return dict(status=self.status, log=list(self.log), stats=self.stats(), progress=self.progress_result())
+
+    def progress_result(self):
+        return None if self.progress is None else self.progress.result()
+
+    def wait(self):
+        intervals = self.intervals()
+        while not self.poll():
+            if self.timeout is not None and self.elapsed() >= self.timeout:
+                raise ProxmoxTaskTimeout(self.upid, self.timeout, list(self.log))
+            delay = next(intervals)
+            if self.timeout is not None:
+                delay = min(delay, max(0, self.timeout - self.elapsed()))
+            self.sleep(delay)
+        return self.result()
+
+
+class TaskPoller:
+    """Wait on many TaskWatchers at once from a single polling loop.
+
+    Every round polls each running task once, then sleeps for one backoff
+    interval shared by all tasks.  The interval starts again from
+    ``poll_interval`` whenever new tasks are added.  A task whose
+    ``max_poll_delay()`` returns a number caps the sleep to it while it does,
+    for checks that must not wait for the backoff, like a RestoreTest
+    waiting for its guest to boot.
+    """
+
+    def __init__(self, poll_interval=1.0, max_poll_interval=30.0, timeout=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.timeout = timeout
+        self.clock = clock
+        self.sleep = sleep
+        self.running = []
+        self.started = None
+        self.rounds = 0
+        self.intervals = None
+
+    def add(self, watcher):
+        if self.started is None:
+            self.started = self.clock()
+        self.running.append(watcher)
+        self.intervals = None
+
+    def elapsed(self):
+        return self.clock() - self.started
+
+    def poll_once(self):
+        """Poll every running task once and return the ones that finished."""
+        self.rounds += 1
+        finished = [w for w in self.running if w.poll()]
+        self.running = [w for w in self.running if w.finished is None]
+        return finished
+
+    def wait_any(self):
+        """Block until at least one running task finishes and return the finished tasks."""
+        while self.running:
+            finished = self.poll_once()
+            if finished:
+                return finished
+            if self.timeout is not None and self.elapsed() >= self.timeout:
+                watcher = self.running[0]
+                raise ProxmoxTaskTimeout(watcher.upid, self.timeout, list(watcher.log))
+            if self.intervals is None:
+                self.intervals = backoff_intervals(self.poll_interval, self.max_poll_interval)
+            delay = next(self.intervals)
+            caps = [w.max_poll_delay() for w in self.running if hasattr(w, 'max_poll_delay')]
+            caps = [cap for cap in caps if cap is not None]
+            if caps:
+                delay = min([delay] + caps)
+            if self.timeout is not None:
+                delay = min(delay, max(0, self.timeout - self.elapsed()))
+            self.sleep(delay)
+        return []
+
+    def wait_all(self):
+        """Yield tasks as they finish until none are left running."""
+        while self.running:
+            for watcher in self.wait_any():
+                yield watcher
+
+
+def task_watcher(proxmox, node, upid, params, **kwargs):
+    """Build a TaskWatcher from the module's task wait options."""
+    return TaskWatcher(proxmox, node, upid,
+                       poll_interval=params['poll_interval'],
+                       max_poll_interval=params['max_poll_interval'],
+                       timeout=params['wait_timeout'], **kwargs)
+
+
+def task_poller(params):
+    """Build a TaskPoller from the module's task wait options."""
+    return TaskPoller(poll_interval=params['poll_interval'],
+                      max_poll_interval=params['max_poll_interval'],
+                      timeout=params['wait_timeout'])
+
+
+def wait_for_task(proxmox, node, upid, params, **kwargs):
+    """Build a TaskWatcher from the module's task wait options and wait on ``upid``."""
+    return task_watcher(proxmox, node, upid, params, **kwargs).wait()
@@ -0,0 +1,169 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import json
+import random
+import time
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.listing import fan_out
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.proxmox import (
+    cache_file,
+    write_private_json,
+)
+
+# Entries kept in the verified cache; the ones verified longest ago are dropped first.
+MAX_CACHE_ENTRIES = 100000
+
+
+def sample_backups(backups, latest=1, older=0, seed=None):
+    """Pick the ``latest`` newest backups of every VMID and ``older`` random ones among the rest.
+
+    ``backups`` must be sorted newest first, like list_backups() returns them.
+    """
+    rng = random.Random(seed)
+    groups = {}
+    for backup in backups:
+        groups.setdefault(backup.get('vmid'), []).append(backup)
+    sampled = []
+    for vmid in sorted(groups, key=str):
+        group = groups[vmid]
+        sampled.extend(group[:latest])
+        rest = group[latest:]
+        sampled.extend(rng.sample(rest, min(older, len(rest))))
+    return sampled
+
+
+def cache_key(backup):
+    return f"{backup['volid']}@{backup.get('ctime') or 0}"
+
+
+class VerifiedCache:
+    """Backups already verified successfully, keyed by volid and creation time, on disk.
+
+    A backup replaced under the same volid has another creation time, so it is
+    verified again.  Only successful verifications are cached.
+    """
+
+    def __init__(self, cache_dir, host, port, user, max_age=None):
+        self.path = cache_file(cache_dir, 'verified', host, port, user)
+        self.max_age = max_age
+        self.entries = None
+        self.dirty = False
+
+    def load(self):
+        if self.entries is None:
+            try:
+                with open(self.path) as f:
+                    self.entries = json.load(f)
+            except (IOError, OSError, ValueError):
+                self.entries = {}
+        return self.entries
+
+    def get(self, backup, now=None):
+        entry = self.load().get(cache_key(backup))
+        if entry is None:
+            return None
+        now = time.time() if now is None else now
+        if self.max_age is not None and now - entry['verified_at'] >= self.max_age:
+            return None
+        return entry
+
+    def add(self, result):
+        self.load()[cache_key(result)] = dict(method=result['method'], verified_at=int(time.time()))
+        self.dirty = True
+
+    def store(self):
+        if not self.dirty:
+            return
+        entries = self.load()
+        if len(entries) > MAX_CACHE_ENTRIES:
+            newest = sorted(entries.items(), key=lambda item: item[1]['verified_at'], reverse=True)
+            self.entries = entries = dict(newest[:MAX_CACHE_ENTRIES])
+        try:
+            write_private_json(self.path, entries)
+        except (IOError, OSError):
+            pass
+        self.dirty = False
+
+
+def backup_result(backup, method, server):
+    return dict(volid=backup['volid'], vmid=backup.get('vmid'), node=backup.get('node'),
+                storage=backup['volid'].split(':', 1)[0], ctime=backup.get('ctime'), method=method,
+                server_verification=server, state='ok', cached=False, error=None, duration=None)
+
+
+def server_verification(backup, pbs):
+    """Return the state of the last verify job of the backup server for ``backup``, or None."""
+    return (backup.get('verification') or {}).get('state') if pbs else None
+
+
+def verify_backup(proxmox, backup, pbs, require_server_verification=False):
+    """Check that ``backup`` can be read and return the outcome.
+
+    The archive header is read by extracting the guest configuration with
+    C(/nodes/{node}/vzdump/extractconfig), which checks the VMA header
+    checksum, the start of a container tarball, or the index and configuration
+    blob of a Proxmox Backup Server snapshot.  For PBS, the state left by the
+    verify jobs of the server is checked first: a snapshot they found corrupt
+    fails without being read.
+    """
+    started = time.monotonic()
+    server = server_verification(backup, pbs)
+    result = backup_result(backup, 'pbs' if pbs else 'header', server)
+    if server == 'failed':
+        result.update(state='failed',
+                      error=f"Verification by the backup server failed ({backup['verification'].get('upid')})")
+    else:
+        try:
+            config = proxmox.nodes(backup['node']).vzdump.extractconfig.get(volume=backup['volid'])
+            if not config or not str(config).strip():
+                result.update(state='failed', error="The archive holds no guest configuration")
+        except Exception as e:
+            result.update(state='failed', error=str(e))
+    if result['state'] == 'ok' and pbs and require_server_verification and server != 'ok':
+        result.update(state='unverified', error="Never verified by the backup server")
+    result['duration'] = round(time.monotonic() - started, 3)
+    return result
+
+
+def verify_backups(proxmox, backups, pbs_storages, cache=None, max_workers=4, require_server_verification=False,
+                   on_result=None):
+    """Verify ``backups`` with at most ``max_workers`` in parallel and return the outcomes in the same order.
+
+    Backups found in ``cache`` are not read again, but a PBS snapshot whose
+    server-side verification failed since still fails.  ``on_result(result)``
+    is called as each backup is done.
+    """
+    results = {}
+    pending = []
+
+    def done(backup, result):
+        results[backup.get('node'), backup['volid']] = result
+        if on_result is not None:
+            on_result(result)
+
+    for backup in backups:
+        pbs = backup['volid'].split(':', 1)[0] in pbs_storages
+        server = server_verification(backup, pbs)
+        entry = cache.get(backup) if cache is not None else None
+        if entry is None or server == 'failed' or (pbs and require_server_verification and server != 'ok'):
+            pending.append((backup, pbs))
+            continue
+        done(backup, dict(backup_result(backup, entry['method'], server), cached=True, duration=0.0))
+
+    def verify(item):
+        return verify_backup(proxmox, item[0], item[1], require_server_verification)
+
+    for (backup, pbs), result, error in fan_out(verify, pending, max_workers):
+        if error is not None:
+            result = dict(backup_result(backup, 'pbs' if pbs else 'header', server_verification(backup, pbs)),
+                          state='failed', error=str(error))
+        elif cache is not None and result['state'] == 'ok':
+            cache.add(result)
+        done(backup, result)
+    if cache is not None:
+        cache.store()
+    return [results[backup.get('node'), backup['volid']] for backup in backups]
@@ -0,0 +1,214 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import re
+from collections import deque
+
+STARTED_RE = re.compile(r'Starting Backup of VM (\d+) ')
+FINISHED_RE = re.compile(r'Finished Backup of VM (\d+) \((\d+):(\d+):(\d+)\)')
+FAILED_RE = re.compile(r'Backup of VM (\d+) failed - (.*)')
+ARCHIVE_RE = re.compile(r"creating (?:vzdump|Proxmox Backup Server) archive '([^']+)'")
+JOB_RE = re.compile(r'starting new backup job: vzdump (.*)')
+
+# Progress lines of vzdump to PBS (and of live-restore), e.g.
+# ``INFO:  10% (1.0 GiB of 10.0 GiB) in 5s, read: 204.8 MiB/s, write: 200.0 MiB/s``
+PBS_PROGRESS_RE = re.compile(r'(\d+)% \(([\d.]+) ([KMGTP]?i?B) of ([\d.]+) ([KMGTP]?i?B)\) in [^,]*, '
+                             r'read: ([\d.]+) ([KMGTP]?i?B)/s, write: ([\d.]+) ([KMGTP]?i?B)/s')
+# vzdump to VMA: ``INFO: status: 10% (1073741824/10737418240), sparse 0% (0), duration 5, read/write 204/200 MB/s``
+VMA_PROGRESS_RE = re.compile(r'status: (\d+)% \((\d+)/(\d+)\), sparse \d+% \(\d+\), duration (\d+), '
+                             r'read/write (\d+)/(\d+) MB/s')
+# qmrestore: ``progress 10% (read 1073741824 bytes, duration 5 sec)``, with a ``zeroes`` field for PBS
+RESTORE_PROGRESS_RE = re.compile(r'progress (\d+)% \(read (\d+) bytes, .*?duration (\d+) sec\)')
+UNITS = dict(B=1, KiB=1024, MiB=1024 ** 2, GiB=1024 ** 3, TiB=1024 ** 4, PiB=1024 ** 5,
+             KB=1000, MB=1000 ** 2, GB=1000 ** 3, TB=1000 ** 4, PB=1000 ** 5)
+MIB = 1024 ** 2
+# Samples kept per task in the progress time series.
+MAX_PROGRESS_SAMPLES = 64
+
+
+class VzdumpLogParser:
+    """Extract per-guest outcomes from the lines of a vzdump task log.
+
+    Guests start as ``pending`` and move to ``running``, ``ok`` or ``failed``
+    as the corresponding log lines are fed in.
+    """
+
+    def __init__(self, vmids):
+        self.current = None
+        self.guests = dict((vmid, dict(vmid=vmid, status='pending', archive=None,
+                                       duration=None, error=None))
+                           for vmid in vmids)
+
+    def guest(self, vmid):
+        vmid = int(vmid)
+        if vmid not in self.guests:
+            self.guests[vmid] = dict(vmid=vmid, status='pending', archive=None, duration=None, error=None)
+        return self.guests[vmid]
+
+    def feed(self, line):
+        match = STARTED_RE.search(line)
+        if match:
+            self.current = self.guest(match.group(1))
+            self.current['status'] = 'running'
+            return
+        match = FINISHED_RE.search(line)
+        if match:
+            guest = self.guest(match.group(1))
+            hours, minutes, seconds = (int(g) for g in match.groups()[1:])
+            guest.update(status='ok', duration=hours * 3600 + minutes * 60 + seconds)
+            return
+        match = FAILED_RE.search(line)
+        if match:
+            self.guest(match.group(1)).update(status='failed', error=match.group(2))
+            return
+        match = ARCHIVE_RE.search(line)
+        if match and self.current is not None:
+            self.current['archive'] = match.group(1)
+
+    def outcomes(self):
+        return [self.guests[vmid] for vmid in sorted(self.guests)]
+
+
+def progress_argument_spec():
+    return dict(
+        min_throughput=dict(type='float', default=None, required=False),
+        throughput_window=dict(type='int', default=300, required=False),
+    )
+
+
+def progress_tracker(params):
+    """Build a ProgressTracker from the module's progress options."""
+    return ProgressTracker(min_throughput=params['min_throughput'], window=params['throughput_window'])
+
+
+def job_command(line):
+    """Return the VMIDs and the storage given on the command line logged at the start of a vzdump job.
+
+    Returns ``(set(), None)`` for any other line.
+    """
+    match = JOB_RE.search(line)
+    args = match.group(1).split() if match else []
+    vmids = set()
+    for arg in args:
+        if not arg.isdigit():
+            break
+        vmids.add(int(arg))
+    storage = args[args.index('--storage') + 1] if '--storage' in args[:-1] else None
+    return vmids, storage
+
+
+def running_vzdumps(proxmox, node, storage=None):
+    """Return the VMIDs being backed up by the vzdump tasks running on ``node``, mapped to their UPID.
+
+    With ``storage``, only tasks writing to that storage are returned.  The
+    first line of the log of each task gives its guests and storage; tasks of a
+    single guest also carry its VMID as their ID.
+    """
+    running = {}
+    for task in proxmox.nodes(node).tasks.get(source='active', typefilter='vzdump'):
+        vmids, target = set(), None
+        for line in proxmox.nodes(node).tasks(task['upid']).log.get(start=0, limit=1):
+            vmids, target = job_command(line['t'])
+        if str(task.get('id') or '').isdigit():
+            vmids.add(int(task['id']))
+        if storage is not None and target != storage:
+            continue
+        for vmid in vmids:
+            running.setdefault(vmid, task['upid'])
+    return running
+
+
+def parse_progress(line):
+    """Return the progress reported by a vzdump or restore log line, or None."""
+    match = PBS_PROGRESS_RE.search(line)
+    if match:
+        g = match.groups()
+        return dict(percent=int(g[0]), read_bytes=int(float(g[1]) * UNITS[g[2]]),
+                    total_bytes=int(float(g[3]) * UNITS[g[4]]),
+                    read_mib_s=round(float(g[5]) * UNITS[g[6]] / MIB, 1),
+                    write_mib_s=round(float(g[7]) * UNITS[g[8]] / MIB, 1))
+    match = VMA_PROGRESS_RE.search(line)
+    if match:
+        g = [int(v) for v in match.groups()]
+        # vzdump computes these "MB/s" in MiB
+        return dict(percent=g[0], read_bytes=g[1], total_bytes=g[2], read_mib_s=float(g[4]), write_mib_s=float(g[5]))
+    match = RESTORE_PROGRESS_RE.search(line)
+    if match:
+        percent, read, duration = (int(v) for v in match.groups())
+        return dict(percent=percent, read_bytes=read, total_bytes=None,
+                    read_mib_s=round(read / duration / MIB, 1) if duration else None, write_mib_s=None)
+    return None
+
+
+class ProgressTracker:
+    """Turn the progress lines of a vzdump or restore task log into a bounded time series.
+
+    Lines are fed with the seconds elapsed since waiting started.  At most
+    ``max_samples`` samples are kept: when the series is full every other
+    sample is dropped and only every second new one is kept from then on, so
+    memory does not depend on the length of the task.  With
+    ``min_throughput`` (MiB/s), stalled() reports when less than that was read
+    on average over the last ``window`` seconds; the window restarts for every
+    guest of a vzdump job and only once progress was logged.
+    """
+
+    def __init__(self, min_throughput=None, window=300, max_samples=MAX_PROGRESS_SAMPLES):
+        self.min_throughput = min_throughput
+        self.window = window
+        self.max_samples = max_samples
+        self.samples = []
+        self.stride = 1
+        self.count = 0
+        self.last = None
+        self.vmid = None
+        self.done_bytes = 0
+        self.current_bytes = 0
+        self.history = deque()
+
+    def feed(self, line, elapsed):
+        match = STARTED_RE.search(line)
+        if match:
+            self.vmid = int(match.group(1))
+            self.done_bytes += self.current_bytes
+            self.current_bytes = 0
+            self.history.clear()
+            return
+        sample = parse_progress(line)
+        if sample is None:
+            return
+        sample.update(t=round(elapsed, 1), vmid=self.vmid)
+        self.current_bytes = sample['read_bytes']
+        self.history.append((elapsed, self.done_bytes + self.current_bytes))
+        self.last = sample
+        if self.count % self.stride == 0:
+            if len(self.samples) >= self.max_samples:
+                self.samples = self.samples[::2]
+                self.stride *= 2
+            self.samples.append(sample)
+        self.count += 1
+
+    def stalled(self, elapsed):
+        """Return the throughput in MiB/s over the last window if it is below ``min_throughput``, else None."""
+        if self.min_throughput is None or not self.history:
+            return None
+        while len(self.history) > 1 and self.history[1][0] <= elapsed - self.window:
+            self.history.popleft()
+        start, start_bytes = self.history[0]
+        if elapsed - start < self.window:
+            return None
+        throughput = (self.history[-1][1] - start_bytes) / (elapsed - start) / MIB
+        return throughput if throughput < self.min_throughput else None
+
+    def result(self):
+        if self.last is None:
+            return None
+        samples = list(self.samples)
+        if samples[-1] is not self.last:
+            samples.append(self.last)
+        read_bytes = self.done_bytes + self.current_bytes
+        return dict(percent=self.last['percent'], read_bytes=read_bytes,
+                    read_mib_s=round(read_bytes / self.last['t'] / MIB, 1) if self.last['t'] else None,
+                    samples=samples)
@@ -13,49 +13,101 @@ short_description: Trigger a backup on Proxmox
 
 version_added: "0.1.0"
 
-description: Trigger a backup on Proxmox
+description:
+    - Trigger a backup on Proxmox
+    - With O(max_age), guests that already have a recent enough backup on O(storage) are skipped, so running
+      the module again after a partial failure only backs up the guests still missing a backup.
+    - In check mode the guests are selected and, with O(max_age), their backups looked up, and the jobs that
+      would be submitted are returned without submitting them.
+    - Guests already being backed up to O(storage) by a running vzdump task are not submitted again; the module
+      follows that task instead.
 
 options:
-    api_host:
+    node:
         description:
-        - Specify the target host of the Proxmox VE cluster.
+        - Proxmox node to run the backup on.
+        - When given together with O(pool), O(tags) or O(all_guests), only guests currently on this node are selected.
+        - If omitted, the node of every selected guest is looked up with C(/cluster/resources).
+        required: false
         type: str
+    storage:
+        description: Storage identifier e.g. "local"
         required: true
-    api_port:
+        type: str
+    vmid:
         description:
-        - Specify the target port of the Proxmox VE cluster.
-        - Uses the E(PROXMOX_PORT) environment variable if not specified.
-        type: int
+        - VMID(s) of the VMs/Containers to back up.
+        - At least one of O(vmid), O(pool), O(tags) or O(all_guests) is required.
+        required: false
+        type: list
+        elements: int
+    pool:
+        description: Back up every guest of this pool.
         required: false
-        default: 8006
-    api_user:
-        description:
-        - Specify the user to authenticate with.
         type: str
-        required: true
-    api_password:
-        required: true
+    tags:
+        description: Back up every guest carrying any of these tags.
+        required: false
+        type: list
+        elements: str
+    all_guests:
+        description: Back up every guest on O(node).
+        required: false
+        default: false
+        type: bool
+    exclude:
+        description: VMIDs never to back up, even if selected by another option.
+        required: false
+        type: list
+        elements: int
+    max_concurrent_jobs:
         description:
-        - Specify the password to authenticate with.
-        - You can use E(PROXMOX_PASSWORD) environment variable.
-        type: str
-    verify_ssl:
+        - Selected guests are grouped into one vzdump job per node.
+        - Maximum number of those jobs running at once per node and per storage; V(0) means no limit.
+        - When jobs have to be queued, the module waits for running jobs to finish before submitting
+          the next ones, even if O(wait=false).
+        required: false
+        default: 0
+        type: int
+    max_age:
         description:
-        - If V(false), SSL certificates will not be validated.
-        - This should only be used on personally controlled sites using self-signed certificates.
-        type: bool
+        - Skip guests that have a backup on O(storage) created less than O(max_age) seconds ago.
+        - Each guest is looked up with a listing of O(storage) filtered by its VMID on the server; when more
+          than 20 guests of a node are selected, the storage is listed once through that node instead.
+        - Guests whose backups cannot be looked up are backed up.
+        - If not specified, every selected guest is backed up.
+        aliases: [skip_if_newer_than]
+        required: false
+        type: int
+    max_workers:
+        description: Maximum number of backup lookups for O(max_age) that run in parallel.
+        required: false
+        default: 4
+        type: int
+    attach_running:
+        description:
+        - Look up the vzdump tasks running on the nodes of the selected guests, with
+          C(/nodes/{node}/tasks?source=active&typefilter=vzdump), before submitting.
+        - Guests those tasks are backing up to O(storage) are not submitted again; the module returns the
+          running task for them and waits for it with O(wait=true).
+        required: false
         default: true
-    node:
-        description: Proxmox node that you wish to query
-        required: true
-        type: str
-    storage:
-        description: Storage identifier e.g. "local" or "all"
-        required: true
-        type: str
-    vmid:
-        description: VMID of the VM/Container you wish to filter by
-        required: true
+        type: bool
+    lock_dir:
+        description:
+        - Directory holding one lock file per cluster and VMID, on the host executing the module.
+        - When set, the module locks the selected guests until their job is submitted, so several hosts or plays
+          backing up the same guest at the same time submit a single vzdump job; the others wait for the lock,
+          then find the job running (see O(attach_running)) or, with O(max_age), the new backup.
+        - The locks only coordinate runs executing on the same host. Use O(run_on_controller=true) (or delegate
+          the task to the controller) so the runs of every target host take the locks on the controller;
+          otherwise each managed host has its own lock files and they exclude nothing across hosts.
+        required: false
+        type: path
+    lock_timeout:
+        description: Seconds to wait for the locks of O(lock_dir) before failing.
+        required: false
+        default: 300
         type: int
     wait:
         description: If true, poll Proxmox until backup is complete/failed
@@ -63,7 +115,13 @@ options:
         required: false
         type: bool
 
-requirements: [ "proxmoxer" ]
+extends_documentation_fragment:
+    - mcfitz2.proxmox_backup.proxmox
+    - mcfitz2.proxmox_backup.proxmox.metrics
+    - mcfitz2.proxmox_backup.proxmox.progress
+    - mcfitz2.proxmox_backup.proxmox.task_wait
+
+requirements: [ "proxmoxer >= 2.0, < 3.0" ]
 
 author:
     - Micah Fitzgerald (@mcfitz2)
@@ -71,127 +129,481 @@ author:
 
 EXAMPLES = r'''
 ---
-# Create a auto tag
-- name: Create a auto tag
-  devopsarr.sonarr.sonarr_auto_tag:
-    remove_tags_automatically: false
-    name: "Type"
-    tags: [1]
-    specifications:
-    - name: "anime"
-      implementation: "SeriesTypeSpecification"
-      negate: false
-      required: true
-      fields:
-      - name: "value"
-        value: 2
-
-# Delete a auto tag
-- name: Delete a auto tag
-  devopsarr.sonarr.sonarr_auto_tag:
-    name: Example
-    state: absent
+- name: Back up VMID 701 to the PBS datastore and wait for it to finish
+  mcfitz2.proxmox_backup.proxmox_backup:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    node: pve-node
+    storage: pbs
+    vmid: 701
+    wait: true
+    wait_timeout: 14400
+    max_poll_interval: 60
+
+- name: Back up the guests of pool "web" that have no backup from the last 20 hours
+  mcfitz2.proxmox_backup.proxmox_backup:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    storage: pbs
+    pool: web
+    max_age: 72000
+    wait: true
+  register: nightly
+
+- name: Back up every guest tagged "prod" except 105, at most two vzdump jobs at a time
+  mcfitz2.proxmox_backup.proxmox_backup:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    storage: pbs
+    tags:
+      - prod
+    exclude:
+      - 105
+    max_concurrent_jobs: 2
+    wait: true
+
+- name: Back up the web servers from every host of the play, one vzdump job per guest, failing stuck jobs
+  mcfitz2.proxmox_backup.proxmox_backup:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    storage: pbs
+    pool: web
+    lock_dir: /tmp/proxmox_backup_locks
+    run_on_controller: true
+    wait: true
+    min_throughput: 10
+    throughput_window: 600
 '''
 
 RETURN = r'''
-# These are examples of possible return values, and in general should use other names for return values.
-id:
-    description: auto tagID.
-    type: int
-    returned: always
-    sample: 1
-name:
-    description: Name.
-    returned: always
+upid:
+    description: UPID of the vzdump task when a single job was submitted.
     type: str
-    sample: "Example"
-remove_tags_automatically:
-    description: Remove tags automatically flag.
-    returned: always
-    type: bool
-    sample: false
-specifications:
-    description: specification list.
+    returned: success
+    sample: "UPID:pve:000A1B2C:0D3E4F5A:65A1B2C3:vzdump:701:root@pam:"
+handle:
+    description:
+    - Handle of the vzdump task when a single job was submitted.
+    - Pass it to M(mcfitz2.proxmox_backup.proxmox_task_wait) to wait for the task later.
+    type: dict
+    returned: success
+    sample: {"node": "pve", "upid": "UPID:pve:000A1B2C:0D3E4F5A:65A1B2C3:vzdump:701:root@pam:", "starttime": 1705095875}
+status:
+    description: Final task status as returned by Proxmox when a single job was submitted. Only set when O(wait=true).
+    type: dict
+    returned: success
+task_log:
+    description: Last lines of the task log when a single job was submitted. Only set when O(wait=true).
     type: list
-    returned: always
-tags:
-    description: Tag list.
+    elements: str
+    returned: success
+progress:
+    description: Progress of the task when a single job was submitted, see RV(jobs[].progress).
+    type: dict
+    returned: success
+task_stats:
+    description: Statistics about waiting for the task when a single job was submitted. Only set when O(wait=true).
+    type: dict
+    returned: success
+    contains:
+        polls:
+            description: Number of task status requests.
+            type: int
+        poll_errors:
+            description: Number of polls that failed with a transient error and were tried again later.
+            type: int
+        log_requests:
+            description: Number of task log requests.
+            type: int
+        log_lines:
+            description: Number of task log lines read.
+            type: int
+        wall_time:
+            description: Seconds spent waiting for the task.
+            type: float
+jobs:
+    description:
+    - The vzdump jobs submitted, one per node.
+    - In check mode, the jobs that would be submitted.
     type: list
-    returned: always
-    elements: int
-    sample: [1,2]
+    elements: dict
+    returned: success
+    contains:
+        node:
+            description: Node the job ran on.
+            type: str
+        vmids:
+            description: VMIDs backed up by the job.
+            type: list
+            elements: int
+        upid:
+            description: UPID of the vzdump task, or V(null) if it could not be submitted.
+            type: str
+        attached:
+            description: Whether the job is a vzdump task that was already running rather than one the module submitted.
+            type: bool
+        handle:
+            description: Handle of the vzdump task for M(mcfitz2.proxmox_backup.proxmox_task_wait).
+            type: dict
+        error:
+            description: Why the job could not be submitted or failed.
+            type: str
+        status:
+            description: Final task status, once the job has finished.
+            type: dict
+        task_stats:
+            description: Statistics about waiting for the job, once it has finished.
+            type: dict
+        progress:
+            description:
+            - Progress parsed from the task log, or V(null) if the task logged no progress, once the job has finished.
+            - C(percent) of the guest being backed up last, C(read_bytes) read over all guests, average
+              C(read_mib_s), and up to 64 C(samples) of the progress lines spread over the task, each with the
+              seconds C(t) since waiting started, C(vmid), C(percent), C(read_bytes), C(total_bytes),
+              C(read_mib_s) and C(write_mib_s).
+            type: dict
+guests:
+    description: Per-guest outcome parsed from the vzdump task logs.
+    type: list
+    elements: dict
+    returned: success
+    contains:
+        vmid:
+            description: VMID of the guest.
+            type: int
+        node:
+            description: Node the guest was backed up on.
+            type: str
+        upid:
+            description: UPID of the vzdump task that included the guest.
+            type: str
+        status:
+            description:
+            - V(ok) or V(failed) once the guest was processed, V(pending) or V(running) while the job
+              is still running (always the case when O(wait=false)), V(unknown) if the log said nothing about it.
+            - V(planned) in check mode.
+            type: str
+        archive:
+            description: Archive created for the guest.
+            type: str
+        duration:
+            description: Seconds the backup of the guest took.
+            type: int
+        error:
+            description: Error reported for the guest.
+            type: str
+skipped:
+    description: Guests not backed up because of O(max_age).
+    type: list
+    elements: dict
+    returned: success
+    contains:
+        vmid:
+            description: VMID of the guest.
+            type: int
+        node:
+            description: Node of the guest.
+            type: str
+        latest_backup:
+            description: Volume ID of the newest backup of the guest on O(storage).
+            type: str
+        age_seconds:
+            description: Age of that backup in seconds.
+            type: int
+metrics:
+    description: API requests and time spent per phase of the module.
+    returned: when O(collect_metrics=true)
+    type: dict
+    contains:
+        requests:
+            description: Number of API requests.
+            type: int
+        bytes_received:
+            description: Bytes of API responses received.
+            type: int
+        retries:
+            description: Number of API requests sent again, for example after renewing an expired ticket.
+            type: int
+        endpoints:
+            description:
+            - Requests keyed by method and endpoint, e.g. C(GET nodes/{node}/storage/{storage}/content), with
+              their C(count), C(errors), C(bytes), C(total_seconds), C(max_seconds), C(p50_seconds),
+              C(p90_seconds) and C(p99_seconds).
+            type: dict
+        phases:
+            description: Seconds spent in each phase of the module, e.g. C(auth), C(discovery), C(submit) and C(wait).
+            type: dict
+        wall_time:
+            description: Seconds from the start of the module until it returned.
+            type: float
 '''
 
-from ansible.module_utils.basic import missing_required_lib  # noqa: E402
-import traceback  # noqa: E402
+import time  # noqa: E402
 from ansible.module_utils.basic import AnsibleModule  # noqa: E402
-PROXMOXER_IMP_ERR = None
-try:
-    from proxmoxer import ProxmoxAPI
-    from proxmoxer import ResourceException
-    HAS_PROXMOXER = True
-except ImportError:
-    HAS_PROXMOXER = False
-    PROXMOXER_IMP_ERR = traceback.format_exc()
-
-
-def poll_task(proxmox, node, upid):
-    status = proxmox.nodes(node).tasks(upid).status.get()
-    while status['status'] == 'running':
-        status = proxmox.nodes(node).tasks(upid).status.get()
-    if status['exitstatus'] != 'OK':
-        raise ResourceException(status_code=500,
-                                status_message="Task failed",
-                                content=f"{status['exitstatus']}")
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.proxmox import (  # noqa: E402
+    PROXMOX_AUTH_REQUIRED_ONE_OF,
+    PROXMOX_AUTH_REQUIRED_TOGETHER,
+    ResourceException,
+    connect,
+    proxmox_auth_argument_spec,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.guests import (  # noqa: E402
+    cluster_guests,
+    group_by_node,
+    select_guests,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.listing import (  # noqa: E402
+    fan_out,
+    latest_backups,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.locks import (  # noqa: E402
+    GuestLocks,
+    GuestLockTimeout,
+    cluster_name,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.scheduler import run_jobs  # noqa: E402
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.tasks import (  # noqa: E402
+    ProxmoxTaskTimeout,
+    task_handle,
+    task_poller,
+    task_wait_argument_spec,
+    task_watcher,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.vzdump import (  # noqa: E402
+    VzdumpLogParser,
+    progress_argument_spec,
+    progress_tracker,
+    running_vzdumps,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.metrics import (  # noqa: E402
+    metrics_argument_spec,
+    module_metrics,
+)
+
+
+def plan_jobs(proxmox, params):
+    """Return one vzdump job per node holding all the guests selected on that node."""
+    node = params['node']
+    vmids = params['vmid'] or []
+    storage = params['storage']
+    selectors = params['pool'] or params['tags'] or params['all_guests'] or params['exclude']
+    missing = []
+    if node and not selectors:
+        groups = {node: sorted(set(vmids))}
     else:
-        return status
+        selected = select_guests(cluster_guests(proxmox), vmids=vmids, node=node,
+                                 pool=params['pool'], tags=params['tags'],
+                                 all_guests=params['all_guests'], exclude=params['exclude'])
+        missing = sorted(set(vmids) - set(selected) - set(params['exclude'] or []))
+        groups = group_by_node(selected)
+    jobs = [dict(node=n, vmids=v, slots=[('node', n), ('storage', storage)])
+            for n, v in sorted(groups.items())]
+    return jobs, missing
 
 
-def main():
-    module = AnsibleModule(
+def skip_fresh(proxmox, module, jobs, now=None):
+    """Remove the guests with a backup newer than O(max_age) on the storage from ``jobs`` and return them."""
+    params = module.params
+    now = time.time() if now is None else now
+    newest, errors = latest_backups(proxmox, params['storage'], dict((job['node'], job['vmids']) for job in jobs),
+                                    since=now - params['max_age'], max_workers=params['max_workers'])
+    for key, error in sorted(errors.items(), key=lambda item: str(item[0])):
+        module.warn(f"Unable to look up the backups of {key}, backing up anyway: {error}")
+    skipped = []
+    for job in jobs:
+        skipped.extend(dict(vmid=vmid, node=job['node'], latest_backup=newest[vmid]['volid'],
+                            age_seconds=max(0, int(now - newest[vmid]['ctime'])))
+                       for vmid in job['vmids'] if vmid in newest)
+        job['vmids'] = [vmid for vmid in job['vmids'] if vmid not in newest]
+    return [job for job in jobs if job['vmids']], skipped
+
+
+def attach_running(proxmox, module, jobs):
+    """Move the guests of ``jobs`` already being backed up to the storage into jobs following the running task."""
+    params = module.params
+    nodes = sorted(set(job['node'] for job in jobs))
+    running = {}
+    for node, upids, error in fan_out(lambda n: running_vzdumps(proxmox, n, params['storage']), nodes,
+                                      params['max_workers']):
+        if error is not None:
+            module.warn(f"Unable to list the vzdump tasks running on {node}, submitting anyway: {error}")
+            continue
+        running[node] = upids
+    planned = []
+    for job in jobs:
+        upids = running.get(job['node'], {})
+        attached = {}
+        for vmid in job['vmids']:
+            if vmid in upids:
+                attached.setdefault(upids[vmid], []).append(vmid)
+        planned.extend(dict(job, vmids=vmids, attach=upid) for upid, vmids in sorted(attached.items()))
+        job['vmids'] = [vmid for vmid in job['vmids'] if vmid not in upids]
+        if job['vmids']:
+            planned.append(job)
+    return planned
+
+
+def planned_results(jobs):
+    """Return the jobs and guests results of ``jobs`` as they would be submitted, for check mode."""
+    results = [dict(node=job['node'], vmids=job['vmids'], upid=job.get('attach'), attached='attach' in job,
+                    handle=None, error=None, status=None, task_stats=None, progress=None) for job in jobs]
+    guests = [dict(vmid=vmid, node=job['node'], upid=job.get('attach'),
+                   status='running' if 'attach' in job else 'planned', archive=None, duration=None, error=None)
+              for job in jobs for vmid in job['vmids']]
+    return results, guests
+
+
+def submit_job(proxmox, job, params, locks=None):
+    job['parser'] = VzdumpLogParser(job['vmids'])
+    upid = job.get('attach')
+    if upid is None:
+        upid = proxmox.nodes(job['node']).vzdump.post(vmid=','.join(str(v) for v in job['vmids']),
+                                                      storage=params['storage'])
+    if locks is not None:
+        locks.release(job['vmids'])
+    return task_watcher(proxmox, job['node'], upid, params, on_line=job['parser'].feed,
+                        progress=progress_tracker(params))
+
+
+def job_results(jobs):
+    results = []
+    guests = []
+    for job in jobs:
+        watcher = job.get('watcher')
+        result = dict(node=job['node'], vmids=job['vmids'], upid=watcher and watcher.upid, attached='attach' in job,
+                      handle=watcher and task_handle(job['node'], watcher.upid),
+                      error=job.get('error'), status=None, task_stats=None, progress=None)
+        finished = watcher is not None and watcher.finished is not None
+        if finished:
+            result.update(status=watcher.status, task_stats=watcher.stats(), progress=watcher.progress_result())
+            if not watcher.succeeded():
+                result['error'] = f"Task failed: {watcher.status.get('exitstatus')}"
+        results.append(result)
+        for guest in job['parser'].outcomes() if 'parser' in job else []:
+            if guest['vmid'] not in job['vmids']:
+                # other guests of a running task that was attached to
+                continue
+            guest.update(node=job['node'], upid=result['upid'])
+            if result['upid'] is None:
+                guest.update(status='failed', error=result['error'])
+            elif finished and guest['status'] in ('pending', 'running'):
+                guest['status'] = 'unknown'
+            guests.append(guest)
+    return results, guests
+
+
+def module_args():
+    return dict(
         argument_spec=dict(
-            api_host=dict(type='str', required=True),
-            api_user=dict(type='str', required=True),
-            api_password=dict(type='str', required=True, no_log=True),
-            api_port=dict(type='int', required=False, default=8006),
-            node=dict(type='str', required=True),
+            **proxmox_auth_argument_spec(),
+            **metrics_argument_spec(),
+            node=dict(type='str', required=False),
             storage=dict(type='str', required=True),
-            verify_ssl=dict(type='bool', default=True),
-            vmid=dict(type='int', required=True),
-            wait=dict(type='bool', default=False, required=False)
+            vmid=dict(type='list', elements='int', required=False),
+            pool=dict(type='str', required=False),
+            tags=dict(type='list', elements='str', required=False),
+            all_guests=dict(type='bool', default=False, required=False),
+            exclude=dict(type='list', elements='int', required=False),
+            max_age=dict(type='int', required=False, aliases=['skip_if_newer_than']),
+            max_workers=dict(type='int', default=4, required=False),
+            max_concurrent_jobs=dict(type='int', default=0, required=False),
+            attach_running=dict(type='bool', default=True, required=False),
+            lock_dir=dict(type='path', required=False),
+            lock_timeout=dict(type='int', default=300, required=False),
+            wait=dict(type='bool', default=False, required=False),
+            **progress_argument_spec(),
+            **task_wait_argument_spec()
         ),
+        required_one_of=PROXMOX_AUTH_REQUIRED_ONE_OF + [('vmid', 'pool', 'tags', 'all_guests')],
+        required_together=PROXMOX_AUTH_REQUIRED_TOGETHER,
+        required_if=[('all_guests', True, ['node'])],
         supports_check_mode=True
     )
-    if not HAS_PROXMOXER:
-        module.fail_json(msg=missing_required_lib(
-            'proxmoxer'), exception=PROXMOXER_IMP_ERR)
-    result = dict(
-        changed=False,
-        original_message='',
-        message=''
-    )
 
-    if module.check_mode:
-        module.exit_json(**result)
-    storage = module.params['storage']
-    node = module.params['node']
-    vmid = module.params['vmid']
+
+def run_module(module):
     wait = module.params['wait']
-    proxmox = ProxmoxAPI(module.params['api_host'],
-                         user=module.params['api_user'],
-                         password=module.params['api_password'],
-                         verify_ssl=module.params['verify_ssl'])
+    limit = module.params['max_concurrent_jobs']
+    metrics = module_metrics(module, 'proxmox_backup')
+    with metrics.phase('auth'):
+        proxmox = connect(module)
+    metrics.attach(proxmox)
+    locks = None
+
+    def submit(job):
+        with metrics.phase('submit'):
+            return submit_job(proxmox, job, module.params, locks)
 
     try:
+        with metrics.phase('discovery'):
+            jobs, missing = plan_jobs(proxmox, module.params)
+        if missing:
+            module.fail_json(msg=f"Guests not found in the cluster: {', '.join(str(v) for v in missing)}")
+        if not jobs:
+            module.exit_json(changed=False, msg="No guests matched the selection", jobs=[], guests=[], skipped=[])
+        if module.params['lock_dir'] and not module.check_mode:
+            with metrics.phase('lock'):
+                locks = GuestLocks(module.params['lock_dir'], cluster_name(proxmox, module.params['api_host']),
+                                   timeout=module.params['lock_timeout'])
+                locks.acquire(vmid for job in jobs for vmid in job['vmids'])
+        skipped = []
+        if module.params['max_age'] is not None:
+            with metrics.phase('freshness'):
+                jobs, skipped = skip_fresh(proxmox, module, jobs)
+            if locks is not None:
+                locks.release(s['vmid'] for s in skipped)
+        if module.params['attach_running'] and jobs:
+            with metrics.phase('attach'):
+                jobs = attach_running(proxmox, module, jobs)
+        if module.check_mode:
+            results, guests = planned_results(jobs)
+            module.exit_json(changed=any('attach' not in job for job in jobs), jobs=results, guests=guests,
+                             skipped=skipped)
+        if not jobs:
+            module.exit_json(changed=False, msg="Every selected guest has a recent enough backup", jobs=[],
+                             guests=[], skipped=skipped)
+
+        poller = task_poller(module.params)
+        try:
+            with metrics.phase('wait'):
+                run_jobs(jobs, submit, poller, limits=dict(node=limit, storage=limit), wait=wait)
+        except ProxmoxTaskTimeout as e:
+            results, guests = job_results(jobs)
+            module.fail_json(msg=str(e), jobs=results, guests=guests)
 
-        upid = proxmox.nodes(node).vzdump.post(vmid=vmid, storage=storage)
-        status = None
-        if wait:
-            status = poll_task(proxmox, node, upid)
-        module.exit_json(changed=True, upid=upid, status=status)
+        results, guests = job_results(jobs)
+        result = dict(changed=any(r['upid'] and not r['attached'] for r in results), jobs=results, guests=guests,
+                      skipped=skipped, upid=None, handle=None, status=None, task_log=None, task_stats=None,
+                      progress=None)
+        if len(jobs) == 1:
+            result.update(upid=results[0]['upid'], handle=results[0]['handle'], status=results[0]['status'],
+                          task_stats=results[0]['task_stats'], progress=results[0]['progress'])
+            if 'watcher' in jobs[0] and jobs[0]['watcher'].finished is not None:
+                result['task_log'] = list(jobs[0]['watcher'].log)
+        failed_jobs = [r for r in results if r['error']]
+        failed_guests = [g for g in guests if g['status'] == 'failed']
+        if failed_jobs or failed_guests:
+            # guests of a failed job may not have logged an outcome
+            without_backup = failed_guests + [g for g in guests if g['status'] == 'unknown']
+            module.fail_json(msg=f"{len(failed_jobs)} of {len(results)} job(s) failed, "
+                                 f"{len(without_backup)} of {len(guests)} guest(s) without a backup", **result)
+        module.exit_json(**result)
 
+    except GuestLockTimeout as e:
+        module.fail_json(msg=str(e))
     except ResourceException as e:
         module.fail_json(msg=f"A Proxmox error occurred: {str(e)}")
+    finally:
+        if locks is not None:
+            locks.release_all()
+
+
+def main():
+    run_module(AnsibleModule(**module_args()))
 
 
 if __name__ == '__main__':
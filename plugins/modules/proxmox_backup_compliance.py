@@ -0,0 +1,361 @@
+#!/usr/bin/python
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: proxmox_backup_compliance
+
+short_description: Check that every Proxmox guest has recent enough backups
+
+version_added: "0.1.0"
+
+description:
+    - Check every guest of the cluster against a backup policy and report the violations grouped by severity.
+    - The guests and storages are read with one C(/cluster/resources) call and every backup storage is listed
+      once, shared storages through a single node. The listings are reduced to per-VMID statistics while they
+      are read, and the guests are then checked in one pass.
+
+options:
+    node:
+        description:
+        - Only check the guests on these nodes, and only list the storages of these nodes.
+        required: false
+        type: list
+        elements: str
+    storage:
+        description: Storage identifier e.g. "local" or "all"
+        required: false
+        default: 'all'
+        type: str
+    rpo:
+        description: Default recovery point objective, the maximum age in seconds of the newest backup of a guest.
+        type: int
+        required: false
+        default: 86400
+    min_copies:
+        description: Default minimum number of backups of a guest, over all storages.
+        type: int
+        required: false
+        default: 1
+    required_storages:
+        description: Default list of storages that must each hold a backup of a guest newer than its RPO.
+        type: list
+        elements: str
+        required: false
+    severity:
+        description: Default severity of violations.
+        type: str
+        required: false
+        default: critical
+        choices: [critical, warning, info]
+    rules:
+        description:
+        - Policies for guests selected by VMID, tag or pool, overriding the defaults.
+        - A rule for the VMID of a guest wins over a rule for one of its tags, which wins over a rule for its pool.
+          Between rules of the same kind the first one listed wins.
+        type: list
+        elements: dict
+        required: false
+        default: []
+        suboptions:
+            name:
+                description: Name of the rule in the violations. Defaults to its selector, e.g. C(tag:prod).
+                type: str
+            vmid:
+                description: VMIDs the rule applies to.
+                type: list
+                elements: int
+            tag:
+                description: Tag the rule applies to.
+                type: str
+            pool:
+                description: Pool the rule applies to.
+                type: str
+            rpo:
+                description: Maximum age in seconds of the newest backup.
+                type: int
+            min_copies:
+                description: Minimum number of backups.
+                type: int
+            required_storages:
+                description: Storages that must each hold a backup newer than the RPO.
+                type: list
+                elements: str
+            severity:
+                description: Severity of violations of the rule.
+                type: str
+                choices: [critical, warning, info]
+    exclude:
+        description: VMIDs not to check.
+        type: list
+        elements: int
+        required: false
+        default: []
+    include_templates:
+        description: Whether templates are checked too.
+        type: bool
+        required: false
+        default: false
+    max_workers:
+        description: Maximum number of storage content listings that run in parallel.
+        type: int
+        required: false
+        default: 4
+    timeout:
+        description: Timeout in seconds for each API request.
+        type: int
+        required: false
+        default: 30
+
+notes:
+    - Storages that cannot be listed are reported in RV(errors); the backups they hold are missing from the check,
+      which can cause violations.
+
+extends_documentation_fragment:
+    - mcfitz2.proxmox_backup.proxmox
+    - mcfitz2.proxmox_backup.proxmox.metrics
+
+requirements: [ "proxmoxer >= 2.0, < 3.0" ]
+
+author:
+    - Micah Fitzgerald (@mcfitz2)
+'''
+
+EXAMPLES = r'''
+---
+- name: Check the nightly backups of the whole cluster
+  mcfitz2.proxmox_backup.proxmox_backup_compliance:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    rpo: 93600
+    rules:
+      - tag: prod
+        rpo: 14400
+        min_copies: 3
+        required_storages: [pbs, pbs-offsite]
+      - pool: lab
+        rpo: 604800
+        severity: warning
+      - vmid: [9000, 9001]
+        min_copies: 0
+        severity: info
+  register: compliance
+  failed_when: compliance.violations.critical | length > 0
+'''
+
+RETURN = r'''
+compliant:
+    description: Whether no guest violates its policy.
+    returned: success
+    type: bool
+guests:
+    description: Number of guests checked.
+    returned: success
+    type: int
+compliant_guests:
+    description: Number of guests without violations.
+    returned: success
+    type: int
+violations:
+    description: Violations keyed by severity, V(critical), V(warning) and V(info).
+    returned: success
+    type: dict
+    sample: {"critical": [{"vmid": 101, "name": "db1", "node": "pve1", "pool": null, "rule": "tag:prod",
+                           "severity": "critical", "check": "rpo", "message": "No backup found",
+                           "latest_backup": null, "age_seconds": null}], "warning": [], "info": []}
+    contains:
+        vmid:
+            description: VMID of the guest.
+            type: int
+        name:
+            description: Name of the guest.
+            type: str
+        node:
+            description: Node of the guest.
+            type: str
+        pool:
+            description: Pool of the guest.
+            type: str
+        rule:
+            description: Rule the guest was checked against, V(default) for the defaults.
+            type: str
+        severity:
+            description: Severity of the violation.
+            type: str
+        check:
+            description: Check that failed, V(rpo), V(min_copies) or V(required_storage).
+            type: str
+        message:
+            description: Description of the violation.
+            type: str
+        latest_backup:
+            description: Volume ID of the newest backup of the guest.
+            type: str
+        age_seconds:
+            description: Age of the newest backup of the guest in seconds.
+            type: int
+summary:
+    description: Number of violations per severity.
+    returned: success
+    type: dict
+    sample: {"critical": 1, "warning": 0, "info": 0}
+errors:
+    description: Storages that could not be listed, keyed by C(node/storage).
+    returned: always
+    type: dict
+timing:
+    description: Seconds spent in each phase.
+    returned: success
+    type: dict
+    contains:
+        discovery:
+            description: Reading the guests and storages.
+            type: float
+        listing:
+            description: Listing the storages and building the per-VMID statistics.
+            type: float
+        evaluation:
+            description: Checking the guests.
+            type: float
+        total:
+            description: All of the above.
+            type: float
+metrics:
+    description: API requests and time spent per phase of the module.
+    returned: when O(collect_metrics=true)
+    type: dict
+    contains:
+        requests:
+            description: Number of API requests.
+            type: int
+        bytes_received:
+            description: Bytes of API responses received.
+            type: int
+        retries:
+            description: Number of API requests sent again, for example after renewing an expired ticket.
+            type: int
+        endpoints:
+            description:
+            - Requests keyed by method and endpoint, e.g. C(GET nodes/{node}/storage/{storage}/content), with
+              their C(count), C(errors), C(bytes), C(total_seconds), C(max_seconds), C(p50_seconds),
+              C(p90_seconds) and C(p99_seconds).
+            type: dict
+        phases:
+            description: Seconds spent in each phase of the module, e.g. C(auth), C(discovery), C(submit) and C(wait).
+            type: dict
+        wall_time:
+            description: Seconds from the start of the module until it returned.
+            type: float
+'''
+
+import time  # noqa: E402
+from ansible.module_utils.basic import AnsibleModule  # noqa: E402
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.proxmox import (  # noqa: E402
+    PROXMOX_AUTH_REQUIRED_ONE_OF,
+    PROXMOX_AUTH_REQUIRED_TOGETHER,
+    ResourceException,
+    connect,
+    proxmox_auth_argument_spec,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.listing import (  # noqa: E402
+    BackupStats,
+    discover_cluster_storages,
+    list_backups,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.compliance import (  # noqa: E402
+    SEVERITIES,
+    CompliancePolicy,
+    evaluate,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.metrics import (  # noqa: E402
+    metrics_argument_spec,
+    module_metrics,
+)
+
+
+def module_args():
+    return dict(
+        argument_spec=dict(
+            **proxmox_auth_argument_spec(),
+            **metrics_argument_spec(),
+            node=dict(type='list', elements='str', required=False),
+            storage=dict(type='str', required=False, default='all'),
+            rpo=dict(type='int', default=86400, required=False),
+            min_copies=dict(type='int', default=1, required=False),
+            required_storages=dict(type='list', elements='str', default=None, required=False),
+            severity=dict(type='str', default='critical', choices=list(SEVERITIES), required=False),
+            rules=dict(type='list', elements='dict', default=[], required=False, options=dict(
+                name=dict(type='str'),
+                vmid=dict(type='list', elements='int'),
+                tag=dict(type='str'),
+                pool=dict(type='str'),
+                rpo=dict(type='int'),
+                min_copies=dict(type='int'),
+                required_storages=dict(type='list', elements='str'),
+                severity=dict(type='str', choices=list(SEVERITIES))),
+                required_one_of=[('vmid', 'tag', 'pool')],
+                mutually_exclusive=[('vmid', 'tag', 'pool')]
+            ),
+            exclude=dict(type='list', elements='int', default=[], required=False),
+            include_templates=dict(type='bool', default=False, required=False),
+            max_workers=dict(type='int', default=4, required=False),
+            timeout=dict(type='int', default=30, required=False)
+        ),
+        required_one_of=PROXMOX_AUTH_REQUIRED_ONE_OF,
+        required_together=PROXMOX_AUTH_REQUIRED_TOGETHER,
+        supports_check_mode=True
+    )
+
+
+def run_module(module):
+    nodes = module.params['node']
+    exclude = set(module.params['exclude'])
+    policy = CompliancePolicy(dict((field, module.params[field])
+                                   for field in ('rpo', 'min_copies', 'required_storages', 'severity')),
+                              module.params['rules'])
+    metrics = module_metrics(module, 'proxmox_backup_compliance')
+    with metrics.phase('auth'):
+        proxmox = connect(module, timeout=module.params['timeout'])
+    metrics.attach(proxmox)
+
+    try:
+        started = time.monotonic()
+        with metrics.phase('discovery'):
+            resources = proxmox.cluster.resources.get()
+            guests = [r for r in resources if r.get('type') in ('qemu', 'lxc') and r['vmid'] not in exclude
+                      and (not nodes or r.get('node') in nodes)
+                      and (module.params['include_templates'] or not r.get('template'))]
+            targets, errors = discover_cluster_storages(proxmox, nodes, module.params['storage'], resources)
+        discovered = time.monotonic()
+        with metrics.phase('listing'):
+            stats, list_errors = list_backups(proxmox, targets, max_workers=module.params['max_workers'],
+                                              selected=BackupStats(per_storage=True))
+        errors.update(list_errors)
+        if errors and len(list_errors) == len(targets):
+            module.fail_json(msg="Unable to list any storage", errors=errors)
+        listed = time.monotonic()
+        with metrics.phase('evaluation'):
+            violations, compliant = evaluate(guests, stats, policy, time.time())
+        finished = time.monotonic()
+    except ResourceException as e:
+        module.fail_json(msg=f"A Proxmox error occurred: {str(e)}")
+
+    module.exit_json(changed=False, compliant=compliant == len(guests), guests=len(guests),
+                     compliant_guests=compliant, violations=violations,
+                     summary=dict((severity, len(found)) for severity, found in violations.items()),
+                     errors=errors,
+                     timing=dict(discovery=round(discovered - started, 3), listing=round(listed - discovered, 3),
+                                 evaluation=round(finished - listed, 3), total=round(finished - started, 3)))
+
+
+def main():
+    run_module(AnsibleModule(**module_args()))
+
+
+if __name__ == '__main__':
+    main()
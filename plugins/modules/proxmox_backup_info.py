@@ -16,50 +16,107 @@ version_added: "0.1.0"
 description: Get backup information from Proxmox.
 
 options:
-    api_host:
+    node:
         description:
-        - Specify the target host of the Proxmox VE cluster.
+        - Proxmox node(s) that you wish to query.
+        - If omitted, every online node of the cluster is queried.
+        - If omitted or when more than one node is given, nodes and storages are discovered
+          with a single C(/cluster/resources) call and each shared storage is listed only once.
+        required: false
+        type: list
+        elements: str
+    vmid:
+        description: VMID of the VM/Container you wish to filter by
+        required: false
+        type: int
+    storage:
+        description: Storage identifier e.g. "local" or "all"
+        required: false
+        default: 'all'
         type: str
-        required: true
-    api_port:
+    since:
         description:
-        - Specify the target port of the Proxmox VE cluster.
-        - Uses the E(PROXMOX_PORT) environment variable if not specified.
+        - Only return backups created at or after this time, in seconds since the epoch.
         type: int
         required: false
-        default: 8006
-    api_user:
+    limit:
         description:
-        - Specify the user to authenticate with.
-        type: str
-        required: true
-    api_password:
-        required: true
+        - Only return the O(limit) newest backups of every VMID.
+        - The newest backups are picked while the listings are read, without sorting every backup.
+        type: int
+        required: false
+    latest_only:
         description:
-        - Specify the password to authenticate with.
-        - You can use E(PROXMOX_PASSWORD) environment variable.
-        type: str
-    verify_ssl:
+        - Only return RV(latest) and leave RV(backups) empty.
+        - Mutually exclusive with O(limit).
+        type: bool
+        required: false
+        default: false
+    forecast:
         description:
-        - If V(false), SSL certificates will not be validated.
-        - This should only be used on personally controlled sites using self-signed certificates.
+        - If V(true), return RV(forecast) instead of RV(backups), with the backup size trends of every storage
+          and guest and the days until each storage is full.
+        - The listings are aggregated while they are read, keeping a few counters per guest and storage
+          instead of the backups, and the capacity of every storage is read from
+          C(/nodes/{node}/storage/{storage}/status).
+        - Mutually exclusive with O(limit) and O(latest_only).
         type: bool
-        default: true
-    node:
-        description: Proxmox node that you wish to query
-        required: true
-        type: str
-    vmid:
-        description: VMID of the VM/Container you wish to filter by
         required: false
+        default: false
+    forecast_window:
+        description:
+        - Number of past days of backups in the daily series and ingest rate of RV(forecast.storages).
+        - Size trends use every backup listed, see O(since) to restrict them.
         type: int
-    storage:
-        description: Storage identifier e.g. "local" or "all"
         required: false
-        default: 'all'
-        type: str
+        default: 30
+    max_workers:
+        description:
+        - Maximum number of storage content listings that run in parallel.
+        type: int
+        required: false
+        default: 4
+    timeout:
+        description:
+        - Timeout in seconds for each API request, including every storage content listing.
+        - Storages that time out or fail are reported in RV(errors) instead of failing the module.
+        type: int
+        required: false
+        default: 30
+    index_cache:
+        description:
+        - If V(true), storage listings are kept in a SQLite index on the host running the module
+          (the controller with O(run_on_controller=true)) and reused by later runs.
+        - A storage is only listed again once its entry is older than O(index_max_age) or when its usage
+          reported by Proxmox has changed, which happens whenever a backup is added or removed.
+          Usage is only known when storages are discovered, that is unless a single O(node) and a
+          specific O(storage) are given.
+        - With O(vmid), the listing is filtered by the API and only the rows of that guest are refreshed.
+        - Proxmox refreshes storage usage every few seconds, so a backup that finished moments ago may
+          not be seen until then.
+        type: bool
+        required: false
+        default: false
+    index_cache_dir:
+        description:
+        - Directory for the index.
+        - Each API host, port and O(api_user) or O(api_token_id) has its own index, since what a
+          listing holds depends on their permissions.
+        - Defaults to C(mcfitz2.proxmox_backup) under E(XDG_CACHE_HOME) or C(~/.cache).
+        type: path
+        required: false
+    index_max_age:
+        description:
+        - Seconds after which an indexed storage listing is refreshed even if the storage usage did not change.
+        type: int
+        required: false
+        default: 600
 
-requirements: [ "proxmoxer" ]
+extends_documentation_fragment:
+    - mcfitz2.proxmox_backup.proxmox
+    - mcfitz2.proxmox_backup.proxmox.metrics
+
+requirements: [ "proxmoxer >= 2.0, < 3.0" ]
 
 author:
     - Micah Fitzgerald (@mcfitz2)
@@ -69,57 +126,242 @@ EXAMPLES = r'''
 ---
 # Create a auto tag
 - name: Get backups for VMID 701 accross all data stores
-  mcfitz2.proxmox_backup:
+  mcfitz2.proxmox_backup.proxmox_backup_info:
     api_user: root@pam
     api_password: 1q2w3e
     api_host: node1
     vmid: 701
     node: pve-node
+
+- name: Get all backups from two nodes, listing up to 8 storages at once
+  mcfitz2.proxmox_backup.proxmox_backup_info:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    node:
+      - pve-node1
+      - pve-node2
+    max_workers: 8
+    timeout: 60
+
+- name: Get backups for VMID 701 from every node and storage of the cluster
+  mcfitz2.proxmox_backup.proxmox_backup_info:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    vmid: 701
+
+- name: Get the latest backup of VMID 701, answering from the local index when nothing changed
+  mcfitz2.proxmox_backup.proxmox_backup_info:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    vmid: 701
+    index_cache: true
+    run_on_controller: true
+
+- name: Get the three newest backups of every guest from the last week
+  mcfitz2.proxmox_backup.proxmox_backup_info:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    limit: 3
+    since: "{{ now().timestamp() | int - 7 * 86400 }}"
+
+- name: Find the backup storage that fills up last
+  mcfitz2.proxmox_backup.proxmox_backup_info:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    forecast: true
+  register: capacity
+
+- name: Back up VMID 701 to it
+  mcfitz2.proxmox_backup.proxmox_backup:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    node: pve-node
+    storage: "{{ capacity.forecast.storages[capacity.forecast.most_headroom].storage }}"
+    vmid: 701
 '''
 
 RETURN = r'''
 # These are examples of possible return values, and in general should use other names for return values.
 latest:
-    description: Newest backup from results
+    description: Newest backup from results, V(null) if no backup matched.
     type: dict
     returned: always
 backups:
-    description: List of backups
+    description:
+    - List of backups, newest first, deduplicated by C(volid) (and node for storages that are not shared).
+    - Each entry also carries the C(node) it was listed from.
+    - Empty when O(latest_only=true) or O(forecast=true).
     returned: always
     type: list
+forecast:
+    description: Backup size trends and storage capacity forecast.
+    returned: when O(forecast=true)
+    type: dict
+    contains:
+        storages:
+            description:
+            - Storages keyed by name when shared, by C(node/storage) otherwise, each with its C(storage), C(node)
+              (V(null) when shared), C(shared), and C(total), C(used) and C(avail) bytes from Proxmox (V(null) if
+              its status could not be read).
+            - C(backup_count) and C(backup_bytes) of the backups listed, and C(series), one entry per day of the
+              last O(forecast_window) days with backups, with its C(date), C(count) and C(bytes).
+            - C(ingest_rate), the bytes per day written by backups over the window.
+            - C(growth_rate), the bytes per day usage grows by once pruning removes as many backups as are
+              written, that is the sum over its guests of the number of backups kept times the daily growth of
+              their backup size.
+            - C(days_to_full), C(avail) divided by C(growth_rate), and C(days_to_full_without_pruning), C(avail)
+              divided by C(ingest_rate); V(null) when the storage is not filling up or its capacity is unknown.
+            type: dict
+            sample:
+                pbs:
+                    storage: pbs
+                    node: null
+                    shared: true
+                    total: 10995116277760
+                    used: 4398046511104
+                    avail: 6597069766656
+                    backup_count: 1500
+                    backup_bytes: 4398046511104
+                    series: [{"date": "2024-05-01", "count": 50, "bytes": 146601550370}]
+                    ingest_rate: 146601550370.0
+                    growth_rate: 1610612736.0
+                    days_to_full: 4096.0
+                    days_to_full_without_pruning: 45.0
+        guests:
+            description:
+            - Guests keyed by VMID, with their C(backup_count), C(total_size) and C(storages).
+            - C(storages) is keyed like RV(forecast.storages), with the C(backup_count), C(total_size),
+              C(latest_size) and C(latest_ctime) of the guest there, the C(size_growth) of its backups in bytes
+              per day (a least-squares fit of size over time), the mean C(backup_interval) in seconds and the
+              C(daily_bytes) written at that interval.
+            type: dict
+        most_headroom:
+            description:
+            - Key in RV(forecast.storages) of the storage that fills up last, or among those not filling up
+              the one with most space available. V(null) if no storage capacity could be read.
+            type: str
+            sample: pbs
+        window:
+            description: The O(forecast_window) in days.
+            type: int
+        generated_at:
+            description: Time of the forecast, in seconds since the epoch.
+            type: int
+errors:
+    description:
+    - Storages that could not be listed, keyed by C(node/storage) (or C(node) when storage discovery failed).
+    - The other results are still returned when some storages fail.
+    returned: always
+    type: dict
+    sample: {"pve1/nfs-backup": "500 Internal Server Error: storage 'nfs-backup' is not online"}
+index:
+    description: How the storages were answered when O(index_cache=true).
+    returned: when O(index_cache=true)
+    type: dict
+    contains:
+        path:
+            description: Path of the index.
+            type: str
+        hits:
+            description: Number of storages answered from the index.
+            type: int
+        refreshed:
+            description: Number of storages listed again and updated in the index.
+            type: int
+metrics:
+    description: API requests and time spent per phase of the module.
+    returned: when O(collect_metrics=true)
+    type: dict
+    contains:
+        requests:
+            description: Number of API requests.
+            type: int
+        bytes_received:
+            description: Bytes of API responses received.
+            type: int
+        retries:
+            description: Number of API requests sent again, for example after renewing an expired ticket.
+            type: int
+        endpoints:
+            description:
+            - Requests keyed by method and endpoint, e.g. C(GET nodes/{node}/storage/{storage}/content), with
+              their C(count), C(errors), C(bytes), C(total_seconds), C(max_seconds), C(p50_seconds),
+              C(p90_seconds) and C(p99_seconds).
+            type: dict
+        phases:
+            description: Seconds spent in each phase of the module, e.g. C(auth), C(discovery), C(submit) and C(wait).
+            type: dict
+        wall_time:
+            description: Seconds from the start of the module until it returned.
+            type: float
 '''
 
 from ansible.module_utils.basic import missing_required_lib  # noqa: E402
-import traceback  # noqa: E402
 from ansible.module_utils.basic import AnsibleModule  # noqa: E402
-PROXMOXER_IMP_ERR = None
-try:
-    from proxmoxer import ProxmoxAPI
-    from proxmoxer import ResourceException
-    HAS_PROXMOXER = True
-except ImportError:
-    HAS_PROXMOXER = False
-    PROXMOXER_IMP_ERR = traceback.format_exc()
-
-
-def run_module():
-    module = AnsibleModule(
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.proxmox import (  # noqa: E402
+    PROXMOX_AUTH_REQUIRED_ONE_OF,
+    PROXMOX_AUTH_REQUIRED_TOGETHER,
+    ResourceException,
+    connect,
+    default_cache_dir,
+    proxmox_auth_argument_spec,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.forecast import (  # noqa: E402
+    CapacityForecast,
+    storage_capacity,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.index import (  # noqa: E402
+    HAS_SQLITE,
+    SQLITE_IMP_ERR,
+    BackupIndexError,
+    indexed_backups,
+    open_index,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.listing import (  # noqa: E402
+    NewestBackups,
+    discover_cluster_storages,
+    discover_storages,
+    list_backups,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.metrics import (  # noqa: E402
+    metrics_argument_spec,
+    module_metrics,
+)
+
+
+def module_args():
+    return dict(
         argument_spec=dict(
-            api_host=dict(type='str', required=True),
-            api_user=dict(type='str', required=True),
-            api_password=dict(type='str', required=True, no_log=True),
-            api_port=dict(type='int', required=False, default=8006),
-            node=dict(type='str', required=True),
+            **proxmox_auth_argument_spec(),
+            **metrics_argument_spec(),
+            node=dict(type='list', elements='str', required=False),
             storage=dict(type='str', required=False, default='all'),
-            verify_ssl=dict(type='bool', default=True),
-            vmid=dict(type='int', default=None, required=False)
+            vmid=dict(type='int', default=None, required=False),
+            since=dict(type='int', default=None, required=False),
+            limit=dict(type='int', default=None, required=False),
+            latest_only=dict(type='bool', default=False, required=False),
+            forecast=dict(type='bool', default=False, required=False),
+            forecast_window=dict(type='int', default=30, required=False),
+            max_workers=dict(type='int', default=4, required=False),
+            timeout=dict(type='int', default=30, required=False),
+            index_cache=dict(type='bool', default=False, required=False),
+            index_cache_dir=dict(type='path', default=None, required=False),
+            index_max_age=dict(type='int', default=600, required=False)
         ),
+        required_one_of=PROXMOX_AUTH_REQUIRED_ONE_OF,
+        required_together=PROXMOX_AUTH_REQUIRED_TOGETHER,
+        mutually_exclusive=[('limit', 'latest_only', 'forecast')],
         supports_check_mode=True
     )
-    if not HAS_PROXMOXER:
-        module.fail_json(msg=missing_required_lib(
-            'proxmoxer'), exception=PROXMOXER_IMP_ERR)
 
+
+def run_module(module):
     result = dict(
         changed=False,
         original_message='',
@@ -128,37 +370,74 @@ def run_module():
 
     if module.check_mode:
         module.exit_json(**result)
+    metrics = module_metrics(module, 'proxmox_backup_info')
+    if module.params['index_cache'] and not HAS_SQLITE:
+        module.fail_json(msg=missing_required_lib('sqlite3'), exception=SQLITE_IMP_ERR)
+    if module.params['limit'] is not None and module.params['limit'] < 1:
+        module.fail_json(msg="limit must be at least 1")
+    if module.params['forecast_window'] < 1:
+        module.fail_json(msg="forecast_window must be at least 1")
 
     storage = module.params['storage']
-    node = module.params['node']
+    nodes = module.params['node']
     vmid = module.params['vmid']
-    proxmox = ProxmoxAPI(module.params['api_host'],
-                         user=module.params['api_user'],
-                         password=module.params['api_password'],
-                         verify_ssl=module.params['verify_ssl'])
+    since = module.params['since']
+    latest_only = module.params['latest_only']
+    forecast = module.params['forecast']
+    max_workers = module.params['max_workers']
+    with metrics.phase('auth'):
+        proxmox = connect(module, timeout=module.params['timeout'])
+    metrics.attach(proxmox)
 
     try:
-        if storage == 'all':
-            storages = [s['storage']
-                        for s in proxmox.nodes(node).storage.get(content="backup")]
+        with metrics.phase('discovery'):
+            if not nodes or len(nodes) > 1:
+                targets, errors = discover_cluster_storages(proxmox, nodes, storage)
+            else:
+                targets, errors = discover_storages(proxmox, nodes, storage, max_workers)
+        if forecast:
+            selected = CapacityForecast(targets, module.params['forecast_window'])
+        elif latest_only:
+            selected = NewestBackups(1, per_vmid=False)
         else:
-            storages = [storage]
-        backups = []
-        for stor in storages:
-            backups.extend([backup
-                            for backup in
-                            proxmox.nodes(node).storage(
-                                stor).content.get(content='backup')
-                            if (vmid and vmid == backup['vmid']) or not vmid])
-        backups.sort(key=lambda x: x['ctime'], reverse=True)
-        module.exit_json(changed=False, latest=backups[0], backups=backups)
+            selected = NewestBackups(module.params['limit'])
+        extra = dict()
+        with metrics.phase('listing'):
+            if module.params['index_cache']:
+                # a privilege separated API token can see less than its user
+                user = module.params['api_user']
+                if module.params['api_token_id']:
+                    user = f"{user}!{module.params['api_token_id']}"
+                index = open_index(module.params['index_cache_dir'] or default_cache_dir(),
+                                   module.params['api_host'], module.params['api_port'], user)
+                try:
+                    backups, list_errors, stats = indexed_backups(proxmox, index, targets, vmid, max_workers,
+                                                                  module.params['index_max_age'], since, selected)
+                finally:
+                    index.close()
+                extra['index'] = dict(path=index.path, **stats)
+            else:
+                backups, list_errors = list_backups(proxmox, targets, vmid, max_workers, since, selected)
+        errors.update(list_errors)
+        if errors and len(list_errors) == len(targets):
+            module.fail_json(msg="Unable to list any storage", errors=errors, **extra)
+        if forecast:
+            with metrics.phase('capacity'):
+                capacity, capacity_errors = storage_capacity(proxmox, targets, max_workers)
+            errors.update(capacity_errors)
+            extra['forecast'] = selected.forecast(capacity)
+        latest = backups[0] if backups else None
+        module.exit_json(changed=False, latest=latest, backups=[] if latest_only or forecast else backups,
+                         errors=errors, **extra)
 
+    except BackupIndexError as e:
+        module.fail_json(msg=str(e))
     except ResourceException as e:
         module.fail_json(msg=f"A Proxmox error occurred: {str(e)}")
 
 
 def main():
-    run_module()
+    run_module(AnsibleModule(**module_args()))
 
 
 if __name__ == '__main__':
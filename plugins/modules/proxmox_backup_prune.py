@@ -0,0 +1,301 @@
+#!/usr/bin/python
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: proxmox_backup_prune
+
+short_description: Prune Proxmox backups by retention policy
+
+version_added: "0.1.0"
+
+description:
+    - Apply a retention policy to the backups of every guest and delete the backups it does not keep.
+    - Backups are grouped per storage and VMID and marked like Proxmox C(prune-backups) does; protected backups
+      are never deleted.
+    - In check mode the module only reports what it would delete and how many bytes that would free.
+
+options:
+    node:
+        description:
+        - Proxmox node(s) whose storages are pruned.
+        - If omitted, every online node of the cluster is used.
+        - If omitted or when more than one node is given, nodes and storages are discovered
+          with a single C(/cluster/resources) call and each shared storage is listed only once.
+        required: false
+        type: list
+        elements: str
+    vmid:
+        description: Only prune the backups of this VMID.
+        required: false
+        type: int
+    storage:
+        description: Storage identifier e.g. "local" or "all"
+        required: false
+        default: 'all'
+        type: str
+    keep_last:
+        description: Keep the last O(keep_last) backups.
+        type: int
+        required: false
+    keep_hourly:
+        description: Keep the newest backup of each of the last O(keep_hourly) hours that have a backup.
+        type: int
+        required: false
+    keep_daily:
+        description: Keep the newest backup of each of the last O(keep_daily) days that have a backup.
+        type: int
+        required: false
+    keep_weekly:
+        description: Keep the newest backup of each of the last O(keep_weekly) ISO weeks that have a backup.
+        type: int
+        required: false
+    keep_monthly:
+        description: Keep the newest backup of each of the last O(keep_monthly) months that have a backup.
+        type: int
+        required: false
+    keep_yearly:
+        description: Keep the newest backup of each of the last O(keep_yearly) years that have a backup.
+        type: int
+        required: false
+    max_workers:
+        description:
+        - Maximum number of storage content listings, and of delete batches, that run in parallel.
+        type: int
+        required: false
+        default: 4
+    batch_size:
+        description:
+        - Number of backups deleted one after the other by each parallel worker.
+        type: int
+        required: false
+        default: 20
+    timeout:
+        description: Timeout in seconds for each API request.
+        type: int
+        required: false
+        default: 30
+
+notes:
+    - At least one keep option must be given. Every backup not kept by one of them is deleted.
+    - Hours, days, weeks, months and years are computed in the local time of the host running the module.
+
+extends_documentation_fragment:
+    - mcfitz2.proxmox_backup.proxmox
+    - mcfitz2.proxmox_backup.proxmox.metrics
+    - mcfitz2.proxmox_backup.proxmox.task_wait
+
+requirements: [ "proxmoxer >= 2.0, < 3.0" ]
+
+author:
+    - Micah Fitzgerald (@mcfitz2)
+'''
+
+EXAMPLES = r'''
+---
+- name: Show what a 7 daily, 4 weekly, 6 monthly policy would delete
+  mcfitz2.proxmox_backup.proxmox_backup_prune:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    keep_daily: 7
+    keep_weekly: 4
+    keep_monthly: 6
+  check_mode: true
+  register: plan
+
+- name: Prune the backups of VMID 701 on the PBS storage, keeping the last 3
+  mcfitz2.proxmox_backup.proxmox_backup_prune:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    vmid: 701
+    storage: pbs
+    keep_last: 3
+'''
+
+RETURN = r'''
+pruned:
+    description:
+    - Backups not kept by the policy, newest first.
+    - In check mode, the backups that would be deleted.
+    returned: always
+    type: list
+    elements: dict
+    contains:
+        volid:
+            description: Volume ID of the backup.
+            type: str
+        vmid:
+            description: VMID of the guest.
+            type: int
+        node:
+            description: Node the backup was listed and deleted through.
+            type: str
+        storage:
+            description: Storage of the backup.
+            type: str
+        ctime:
+            description: Creation time of the backup, in seconds since the epoch.
+            type: int
+        size:
+            description: Size of the backup in bytes.
+            type: int
+        deleted:
+            description: Whether the backup was deleted. Always V(false) in check mode.
+            type: bool
+kept:
+    description: Number of backups kept, including protected ones.
+    returned: always
+    type: int
+bytes_freed:
+    description:
+    - Bytes freed by deleting the backups of RV(pruned).
+    - In check mode, the bytes that would be freed.
+    returned: always
+    type: int
+errors:
+    description:
+    - Storages that could not be listed, keyed by C(node/storage) (or C(node) when storage discovery failed),
+      and backups that could not be deleted, keyed by C(volid).
+    - Backups of storages that could not be listed are neither kept nor pruned.
+    returned: always
+    type: dict
+metrics:
+    description: API requests and time spent per phase of the module.
+    returned: when O(collect_metrics=true)
+    type: dict
+    contains:
+        requests:
+            description: Number of API requests.
+            type: int
+        bytes_received:
+            description: Bytes of API responses received.
+            type: int
+        retries:
+            description: Number of API requests sent again, for example after renewing an expired ticket.
+            type: int
+        endpoints:
+            description:
+            - Requests keyed by method and endpoint, e.g. C(GET nodes/{node}/storage/{storage}/content), with
+              their C(count), C(errors), C(bytes), C(total_seconds), C(max_seconds), C(p50_seconds),
+              C(p90_seconds) and C(p99_seconds).
+            type: dict
+        phases:
+            description: Seconds spent in each phase of the module, e.g. C(auth), C(discovery), C(submit) and C(wait).
+            type: dict
+        wall_time:
+            description: Seconds from the start of the module until it returned.
+            type: float
+'''
+
+from ansible.module_utils.basic import AnsibleModule  # noqa: E402
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.proxmox import (  # noqa: E402
+    PROXMOX_AUTH_REQUIRED_ONE_OF,
+    PROXMOX_AUTH_REQUIRED_TOGETHER,
+    ResourceException,
+    connect,
+    proxmox_auth_argument_spec,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.listing import (  # noqa: E402
+    discover_cluster_storages,
+    discover_storages,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.prune import (  # noqa: E402
+    PRUNE_RULES,
+    delete_backups,
+    plan_prune,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.tasks import (  # noqa: E402
+    task_wait_argument_spec,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.metrics import (  # noqa: E402
+    metrics_argument_spec,
+    module_metrics,
+)
+
+
+def module_args():
+    return dict(
+        argument_spec=dict(
+            **proxmox_auth_argument_spec(),
+            **metrics_argument_spec(),
+            node=dict(type='list', elements='str', required=False),
+            storage=dict(type='str', required=False, default='all'),
+            vmid=dict(type='int', default=None, required=False),
+            keep_last=dict(type='int', default=None, required=False),
+            keep_hourly=dict(type='int', default=None, required=False),
+            keep_daily=dict(type='int', default=None, required=False),
+            keep_weekly=dict(type='int', default=None, required=False),
+            keep_monthly=dict(type='int', default=None, required=False),
+            keep_yearly=dict(type='int', default=None, required=False),
+            max_workers=dict(type='int', default=4, required=False),
+            batch_size=dict(type='int', default=20, required=False),
+            timeout=dict(type='int', default=30, required=False),
+            **task_wait_argument_spec()
+        ),
+        required_one_of=PROXMOX_AUTH_REQUIRED_ONE_OF,
+        required_together=PROXMOX_AUTH_REQUIRED_TOGETHER,
+        supports_check_mode=True
+    )
+
+
+def run_module(module):
+    keep = dict((option, module.params[option]) for option, fmt in PRUNE_RULES)
+    if any(count is not None and count < 0 for count in keep.values()):
+        module.fail_json(msg="keep options must not be negative")
+    if not any(keep.values()):
+        module.fail_json(msg=f"At least one of {', '.join(option for option, fmt in PRUNE_RULES)} is required")
+
+    nodes = module.params['node']
+    storage = module.params['storage']
+    max_workers = module.params['max_workers']
+    metrics = module_metrics(module, 'proxmox_backup_prune')
+    with metrics.phase('auth'):
+        proxmox = connect(module, timeout=module.params['timeout'])
+    metrics.attach(proxmox)
+
+    try:
+        with metrics.phase('discovery'):
+            if not nodes or len(nodes) > 1:
+                targets, errors = discover_cluster_storages(proxmox, nodes, storage)
+            else:
+                targets, errors = discover_storages(proxmox, nodes, storage, max_workers)
+        with metrics.phase('listing'):
+            plan, list_errors = plan_prune(proxmox, targets, keep, module.params['vmid'], max_workers)
+        errors.update(list_errors)
+        if errors and len(list_errors) == len(targets):
+            module.fail_json(msg="Unable to list any storage", errors=errors)
+        with metrics.phase('planning'):
+            kept, pruned = plan.plan()
+
+        delete_errors = {}
+        if pruned and not module.check_mode:
+            with metrics.phase('delete'):
+                delete_errors = delete_backups(proxmox, pruned, module.params, module.params['batch_size'],
+                                               max_workers)
+        for backup in pruned:
+            backup['deleted'] = not module.check_mode and backup['volid'] not in delete_errors
+        errors.update(delete_errors)
+        freed = [b for b in pruned if b['deleted'] or module.check_mode]
+        result = dict(changed=any(b['deleted'] for b in pruned) or (module.check_mode and bool(pruned)),
+                      pruned=pruned, kept=len(kept), bytes_freed=sum(b['size'] or 0 for b in freed),
+                      errors=errors)
+        if delete_errors:
+            module.fail_json(msg=f"Unable to delete {len(delete_errors)} of {len(pruned)} backup(s)", **result)
+        module.exit_json(**result)
+
+    except ResourceException as e:
+        module.fail_json(msg=f"A Proxmox error occurred: {str(e)}")
+
+
+def main():
+    run_module(AnsibleModule(**module_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -13,54 +13,131 @@ short_description: Restore a Proxmox LXC/VM from backup
 
 version_added: "0.1.0"
 
-description: Restore a Proxmox LXC/VM from backup
+description:
+    - Restore a Proxmox LXC/VM from backup
+    - With O(restore_tests), backups are test-restored instead, without touching existing guests. Each one is
+      restored to a free VMID from C(/cluster/nextid) with unique MAC addresses, started with every network
+      interface unplugged, timed until its guest agent answers (or the container or VM without agent runs),
+      then stopped and destroyed.
 
 options:
-    api_host:
+    node:
         description:
-        - Specify the target host of the Proxmox VE cluster.
+        - Proxmox node to restore a new guest on.
+        - Existing guests are always restored on the node they currently run on, which is looked up
+          with O(vmid) in C(/cluster/resources).
+        - Required when O(vmid) does not exist yet.
+        required: false
         type: str
-        required: true
-    api_port:
+    vmid:
         description:
-        - Specify the target port of the Proxmox VE cluster.
-        - Uses the E(PROXMOX_PORT) environment variable if not specified.
+        - VMID of VM/LXC to restore.
+        - Required unless O(restores) or O(restore_tests) is given.
         type: int
         required: false
-        default: 8006
-    api_user:
+    backup:
         description:
-        - Specify the user to authenticate with.
+        - Backup to restore.
+        - Required with O(vmid).
+        required: false
         type: str
-        required: true
-    api_password:
-        required: true
+    restores:
         description:
-        - Specify the password to authenticate with.
-        - You can use E(PROXMOX_PASSWORD) environment variable.
-        type: str
-    verify_ssl:
+        - Restore many guests at once instead of O(vmid) from O(backup).
+        - The restores are submitted as the O(max_concurrent_restores), O(max_concurrent_per_node)
+          and O(max_concurrent_per_storage) limits allow and watched from a single polling loop.
+        - Existing guests are all shut down (or stopped) in parallel first; only the guests confirmed
+          stopped are restored.
+        - When restores have to be queued, the module waits for running ones to finish before submitting
+          the next ones, even if O(wait=false).
+        type: list
+        elements: dict
+        required: false
+        suboptions:
+            vmid:
+                description: VMID of the guest to restore.
+                type: int
+                required: true
+            backup:
+                description: Backup to restore.
+                type: str
+                required: true
+            node:
+                description: Node to restore a new guest on. Existing guests are restored on their current node.
+                type: str
+                required: false
+            storage:
+                description: Destination datastore. Defaults to O(storage).
+                type: str
+                required: false
+    restore_tests:
         description:
-        - If V(false), SSL certificates will not be validated.
-        - This should only be used on personally controlled sites using self-signed certificates.
-        type: bool
-        default: true
-    node:
-        description: Proxmox node that you wish to query
-        required: true
-        type: str
-    vmid:
-        description: VMID of VM/LXC to restore
+        - Backups to test-restore to scratch guests, which are booted, timed and destroyed.
+        - A scratch guest never uses the VMID of an existing guest, and is restored with O(unique=true) and
+          started with C(link_down=1) on all its network interfaces, so it cannot clash with the original guest.
+        - The tests run side by side under the O(max_concurrent_restores), O(max_concurrent_per_node) and
+          O(max_concurrent_per_storage) limits, and O(bandwidth_budget); a test holds its slot until its guest
+          is destroyed.
+        - The module always waits for the tests, whatever O(wait).
+        type: list
+        elements: dict
+        required: false
+        suboptions:
+            backup:
+                description: Backup to test.
+                type: str
+                required: true
+            node:
+                description: Node to restore the scratch guest on. Defaults to O(node), which is then required.
+                type: str
+                required: false
+            storage:
+                description: Destination datastore. Defaults to O(storage).
+                type: str
+                required: false
+    boot_timeout:
+        description:
+        - Seconds a scratch guest of O(restore_tests) may take to boot once started before its test fails.
+        - While a guest boots it is checked every O(poll_interval) seconds, without the backoff up to
+          O(max_poll_interval), so RV(restore_tests[].time_to_boot) is accurate to O(poll_interval).
         type: int
-        required: true
-    backup:
-        description: Backup to restore
-        required: true
-        type: str
+        required: false
+        default: 300
+    keep_failed:
+        description: Keep the scratch guests of failed O(restore_tests) for investigation instead of destroying them.
+        type: bool
+        required: false
+        default: false
     bandwidth_limit:
         description: Override I/O bandwidth limit (in KiB/s).
         type: int
         required: false
+    bandwidth_budget:
+        description:
+        - Total I/O bandwidth (in KiB/s) shared by the restores of O(restores) that run at the same time.
+        - Every restore is limited to its share of the budget when it is submitted, that is the unallocated
+          bandwidth divided by the number of restores that can still start next to the running ones.
+          O(bandwidth_limit) still caps every share.
+        type: int
+        required: false
+    max_concurrent_restores:
+        description: Maximum number of restores of O(restores) running at once. V(0) means no limit.
+        type: int
+        required: false
+        default: 0
+    max_concurrent_per_node:
+        description: Maximum number of restores of O(restores) running at once on the same node. V(0) means no limit.
+        type: int
+        required: false
+        default: 0
+    max_concurrent_per_storage:
+        description:
+        - Maximum number of restores of O(restores) reading from or writing to the same storage at once.
+        - Both the storage holding the backup and the destination datastore count.
+        - V(0) means no limit.
+        type: int
+        required: false
+        default: 0
     storage:
         description: Destination datastore. If not specified, resource will be restored to its original datastore
         required: false
@@ -81,15 +158,40 @@ options:
         required: false
         type: bool
     hard_stop:
-        description: Execute a stop operation if VM/LXC is running
+        description:
+        - Execute a stop operation if VM/LXC is running, instead of shutting it down.
+        - The restore is only submitted once the guest is confirmed stopped.
         default: false
         required: false
         type: bool
     try_hard_stop:
-        description: Execute a stop operation if the shutdown operation fails
+        description:
+        - Execute a stop operation if the shutdown operation fails or takes longer than O(shutdown_timeout).
         default: false
         required: false
         type: bool
+    shutdown_timeout:
+        description:
+        - Seconds to wait for a guest to shut down before stopping it with O(try_hard_stop=true).
+        - Without O(try_hard_stop), guests are waited on for up to O(wait_timeout).
+        type: int
+        required: false
+        default: 180
+    resource_cache_ttl:
+        description:
+        - Seconds the cluster guest list used to find the type and node of O(vmid) is cached for,
+          so restoring many guests in a loop or in later tasks does not fetch it again each time.
+        - A guest missing from the cached list is looked up again in a fresh one.
+        - V(0) disables the cache.
+        type: int
+        required: false
+        default: 30
+    resource_cache_dir:
+        description:
+        - Directory for the guest list cache.
+        - Defaults to C(mcfitz2.proxmox_backup) under E(XDG_CACHE_HOME) or C(~/.cache).
+        type: path
+        required: false
     override:
         description: Override VM/LXC config from backup
         type: dict
@@ -107,7 +209,13 @@ options:
                 description: Override number of cores assigned to the VM/LXC. Defaults to value in backup
                 type: int
 
-requirements: [ "proxmoxer" ]
+extends_documentation_fragment:
+    - mcfitz2.proxmox_backup.proxmox
+    - mcfitz2.proxmox_backup.proxmox.metrics
+    - mcfitz2.proxmox_backup.proxmox.progress
+    - mcfitz2.proxmox_backup.proxmox.task_wait
+
+requirements: [ "proxmoxer >= 2.0, < 3.0" ]
 
 author:
     - Micah Fitzgerald (@mcfitz2)
@@ -115,102 +223,623 @@ author:
 
 EXAMPLES = r'''
 ---
+- name: Restore VMID 701 from its latest backup and wait for it
+  mcfitz2.proxmox_backup.proxmox_backup_restore:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    vmid: 701
+    backup: "pbs:backup/vm/701/2024-01-12T21:44:35Z"
+    wait: true
+
+- name: Restore a set of guests, two per node and storage at a time, sharing 400 MiB/s
+  mcfitz2.proxmox_backup.proxmox_backup_restore:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    restores: "{{ dr_plan }}"
+    max_concurrent_per_node: 2
+    max_concurrent_per_storage: 2
+    bandwidth_budget: 409600
+    wait: true
+  register: drill
+
+- name: Show the recovery time
+  ansible.builtin.debug:
+    msg: "All guests restored in {{ drill.rto }}s"
+
+- name: Boot-test backups two at a time, without touching the guests
+  mcfitz2.proxmox_backup.proxmox_backup_restore:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    node: pve-test
+    storage: local-lvm
+    restore_tests:
+      - backup: "pbs:backup/vm/100/2024-01-12T21:14:35Z"
+      - backup: "pbs:backup/vm/101/2024-01-12T21:15:02Z"
+      - backup: "pbs:backup/ct/102/2024-01-12T21:15:40Z"
+    max_concurrent_restores: 2
+    boot_timeout: 600
+  register: audit
+
+- name: Show the recovery time percentiles
+  ansible.builtin.debug:
+    msg: "p50 {{ audit.rto_summary.p50 }}s, p95 {{ audit.rto_summary.p95 }}s"
 '''
 
 RETURN = r'''
 # These are examples of possible return values, and in general should use other names for return values.
+node:
+    description: Node the guest was restored on.
+    type: str
+    returned: success and O(restores) is not given
+resource_type:
+    description: Type of the restored guest, V(qemu) or V(lxc).
+    type: str
+    returned: success and O(restores) is not given
 task_id:
     description: UPID of restore task
     type: str
-    returned: always
+    returned: when O(restores) is not given
     sample: UPID
+handle:
+    description:
+    - Handle of the restore task.
+    - Pass it to M(mcfitz2.proxmox_backup.proxmox_task_wait) to wait for the task later.
+    type: dict
+    returned: success
+    sample: {"node": "pve", "upid": "UPID:pve:000A1B2C:0D3E4F5A:65A1B2C3:vzrestore:701:root@pam:", "starttime": 1705095875}
+status:
+    description: Final task status as returned by Proxmox. Only set when O(wait=true).
+    type: dict
+    returned: success
+task_log:
+    description: Last lines of the task log. Only set when O(wait=true).
+    type: list
+    elements: str
+    returned: success
+stop:
+    description: How the existing guest was stopped before the restore, V(null) if it did not exist.
+    type: dict
+    returned: when O(restores) is not given
+    contains:
+        vmid:
+            description: VMID of the guest.
+            type: int
+        node:
+            description: Node of the guest.
+            type: str
+        stopped:
+            description: Whether the guest was confirmed stopped.
+            type: bool
+        method:
+            description: Last operation sent to the guest, V(shutdown) or V(stop).
+            type: str
+        escalated:
+            description: Whether a stop was sent because the shutdown failed or timed out.
+            type: bool
+        duration:
+            description: Seconds until the guest was stopped or given up on.
+            type: float
+        error:
+            description: Why the guest could not be stopped.
+            type: str
+task_stats:
+    description: Statistics about waiting for the task. Only set when O(wait=true).
+    type: dict
+    returned: success
+    contains:
+        polls:
+            description: Number of task status requests.
+            type: int
+        poll_errors:
+            description: Number of polls that failed with a transient error and were tried again later.
+            type: int
+        log_requests:
+            description: Number of task log requests.
+            type: int
+        log_lines:
+            description: Number of task log lines read.
+            type: int
+        wall_time:
+            description: Seconds spent waiting for the task.
+            type: float
+progress:
+    description:
+    - Progress parsed from the restore task log, or V(null) if the task logged no progress. Only set when O(wait=true).
+    - C(percent), C(read_bytes), average C(read_mib_s), and up to 64 C(samples) of the progress lines spread over
+      the task, each with the seconds C(t) since waiting started, C(percent), C(read_bytes) and C(read_mib_s).
+    type: dict
+    returned: success
+restores:
+    description: One entry per item of O(restores).
+    type: list
+    elements: dict
+    returned: when O(restores) is given
+    contains:
+        vmid:
+            description: VMID of the guest.
+            type: int
+        backup:
+            description: Backup restored.
+            type: str
+        node:
+            description: Node the guest was restored on.
+            type: str
+        storage:
+            description: Destination datastore, V(null) for the original one.
+            type: str
+        resource_type:
+            description: Type of the guest, V(qemu) or V(lxc).
+            type: str
+        upid:
+            description: UPID of the restore task, or V(null) if it could not be submitted.
+            type: str
+        handle:
+            description: Handle of the restore task for M(mcfitz2.proxmox_backup.proxmox_task_wait).
+            type: dict
+        bandwidth_limit:
+            description: I/O bandwidth limit (in KiB/s) the restore was submitted with.
+            type: int
+        status:
+            description: Final task status, once the restore has finished.
+            type: dict
+        progress:
+            description: Progress parsed from the restore task log once it has finished, see RV(progress).
+            type: dict
+        error:
+            description: Why the guest could not be stopped, or the restore could not be submitted or failed.
+            type: str
+        stop:
+            description: How the existing guest was stopped, V(null) if it did not exist.
+            type: dict
+            contains:
+                vmid:
+                    description: VMID of the guest.
+                    type: int
+                node:
+                    description: Node of the guest.
+                    type: str
+                stopped:
+                    description: Whether the guest was confirmed stopped.
+                    type: bool
+                method:
+                    description: Last operation sent to the guest, V(shutdown) or V(stop).
+                    type: str
+                escalated:
+                    description: Whether a stop was sent because the shutdown failed or timed out.
+                    type: bool
+                duration:
+                    description: Seconds until the guest was stopped or given up on.
+                    type: float
+                error:
+                    description: Why the guest could not be stopped.
+                    type: str
+        queued:
+            description: Seconds from the start of the module until the restore was submitted.
+            type: float
+        duration:
+            description: Seconds from submitting the restore until it finished.
+            type: float
+restore_tests:
+    description: One entry per item of O(restore_tests).
+    type: list
+    elements: dict
+    returned: when O(restore_tests) is given
+    contains:
+        backup:
+            description: Backup tested.
+            type: str
+        node:
+            description: Node of the scratch guest.
+            type: str
+        storage:
+            description: Destination datastore, V(null) for the original one.
+            type: str
+        vmid:
+            description: VMID of the scratch guest, V(null) if none was allocated.
+            type: int
+        resource_type:
+            description: Type of the guest, V(qemu) or V(lxc).
+            type: str
+        upid:
+            description: UPID of the restore task, or V(null) if it could not be submitted.
+            type: str
+        queued:
+            description: Seconds from the start of the module until the restore was submitted.
+            type: float
+        restore_duration:
+            description: Seconds from submitting the restore until it finished.
+            type: float
+        time_to_boot:
+            description: Seconds from starting the scratch guest until it was up.
+            type: float
+        rto:
+            description: Seconds from submitting the restore until the scratch guest was up.
+            type: float
+        boot_check:
+            description:
+            - How the guest was found up, V(agent) when its guest agent answered a ping, V(status) when its status
+              was running, for containers and VMs without the guest agent enabled.
+            type: str
+        network_unplugged:
+            description: Network interfaces set to C(link_down=1) before starting the guest.
+            type: list
+            elements: str
+        booted:
+            description: Whether the scratch guest came up.
+            type: bool
+        torn_down:
+            description: Whether the scratch guest was stopped and destroyed.
+            type: bool
+        error:
+            description: Why the test failed.
+            type: str
+        teardown_error:
+            description: Why the scratch guest could not be destroyed.
+            type: str
+        progress:
+            description: Progress parsed from the restore task log, see RV(progress).
+            type: dict
+rto_summary:
+    description: RTO of the O(restore_tests) whose guest came up, in seconds, with the nearest-rank percentiles.
+    type: dict
+    returned: when O(restore_tests) is given
+    sample: {"count": 40, "p50": 182.4, "p90": 240.1, "p95": 251.9, "p99": 310.2, "max": 310.2}
+rto:
+    description:
+    - Seconds from the start of the module until the last restore of O(restores) finished.
+    - V(null) while restores are still running, which is the case with O(wait=false).
+    type: float
+    returned: when O(restores) is given
+metrics:
+    description: API requests and time spent per phase of the module.
+    returned: when O(collect_metrics=true)
+    type: dict
+    contains:
+        requests:
+            description: Number of API requests.
+            type: int
+        bytes_received:
+            description: Bytes of API responses received.
+            type: int
+        retries:
+            description: Number of API requests sent again, for example after renewing an expired ticket.
+            type: int
+        endpoints:
+            description:
+            - Requests keyed by method and endpoint, e.g. C(GET nodes/{node}/storage/{storage}/content), with
+              their C(count), C(errors), C(bytes), C(total_seconds), C(max_seconds), C(p50_seconds),
+              C(p90_seconds) and C(p99_seconds).
+            type: dict
+        phases:
+            description: Seconds spent in each phase of the module, e.g. C(auth), C(discovery), C(submit) and C(wait).
+            type: dict
+        wall_time:
+            description: Seconds from the start of the module until it returned.
+            type: float
 '''
 
-from ansible.module_utils.basic import missing_required_lib  # noqa: E402
-import traceback  # noqa: E402
+import time  # noqa: E402
 from ansible.module_utils.basic import AnsibleModule  # noqa: E402
-PROXMOXER_IMP_ERR = None
-try:
-    from proxmoxer import ProxmoxAPI
-    from proxmoxer import ResourceException
-    HAS_PROXMOXER = True
-except ImportError:
-    HAS_PROXMOXER = False
-    PROXMOXER_IMP_ERR = traceback.format_exc()
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.proxmox import (  # noqa: E402
+    PROXMOX_AUTH_REQUIRED_ONE_OF,
+    PROXMOX_AUTH_REQUIRED_TOGETHER,
+    ResourceException,
+    connect,
+    default_cache_dir,
+    proxmox_auth_argument_spec,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.guests import (  # noqa: E402
+    GuestCache,
+    backup_guest_type,
+    find_guest,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.tasks import (  # noqa: E402
+    ProxmoxTaskError,
+    ProxmoxTaskTimeout,
+    task_handle,
+    task_poller,
+    task_wait_argument_spec,
+    task_watcher,
+    wait_for_task,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.vzdump import (  # noqa: E402
+    progress_argument_spec,
+    progress_tracker,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.power import stop_engine  # noqa: E402
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.restore_test import (  # noqa: E402
+    RestoreTest,
+    allocate_vmid,
+    rto_summary,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.scheduler import (  # noqa: E402
+    BandwidthBudget,
+    max_active_jobs,
+    run_jobs,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.metrics import (  # noqa: E402
+    metrics_argument_spec,
+    module_metrics,
+)
 
 
-def stop_resource(proxmox, module, resource_type):
-    node = module.params['node']
-    vmid = module.params['vmid']
+def stop_guests(proxmox, module, guests):
+    """Stop ``guests`` (vmid, node, type tuples) in parallel and return one stop result per guest."""
+    engine = stop_engine(proxmox, module.params)
+    for vmid, node, resource_type in guests:
+        engine.add(vmid, node, resource_type)
+    return engine.run()
+
+
+def resolve_target(module, proxmox, cache, vmid, backup, node):
+    """Return the type and node to restore ``vmid`` on, and whether the guest already exists.
+
+    Raises ValueError when the target cannot be determined.
+    """
+    guest = find_guest(proxmox, vmid, cache)
+    if guest is not None:
+        if node and node != guest['node']:
+            module.warn(f"VMID {vmid} is on node {guest['node']}, restoring it there instead of on {node}")
+        return guest['type'], guest['node'], True
+    resource_type = backup_guest_type(backup)
+    if resource_type is None:
+        raise ValueError(f"Unable to determine resource type: VMID {vmid} does not exist "
+                         f"and the type of backup {backup} is unknown")
+    if not node:
+        raise ValueError(f"VMID {vmid} does not exist, node is required to restore it")
+    return resource_type, node, False
+
+
+def post_restore(proxmox, module, resource_type, node, vmid, backup, storage=None, bwlimit=None, scratch=False):
+    """Submit the restore of ``backup`` to ``vmid``, over an existing guest unless ``scratch``.
+
+    Scratch guests for restore tests get unique MAC addresses and are not started.
+    """
+    options = dict(vmid=vmid, node=node)
+    if not scratch:
+        options.update(force='1', start='1' if module.params['start_after_restore'] else '0')
+    if storage:
+        options['storage'] = storage
+    if module.params['unique'] or scratch:
+        options['unique'] = '1'
+    if bwlimit:
+        options['bwlimit'] = bwlimit
     if resource_type == 'lxc':
-        if module.params['hard_stop']:
-            upid_stop = proxmox.nodes(node).lxc(vmid).status.stop.post(vmid=vmid, node=node)
-        else:
-            try:
-                upid_stop = proxmox.nodes(node).lxc(vmid).status.shutdown.post(vmid=vmid, node=node)
-                poll_task(proxmox, node, upid_stop)
-            except ResourceException:
-                if module.params['try_hard_stop']:
-                    upid_stop = proxmox.nodes(node).lxc(vmid).status.stop.post(vmid=vmid, node=node)
-                    poll_task(proxmox, node, upid_stop)
-    elif resource_type == 'qemu':
-        if module.params['hard_stop']:
-            upid_stop = proxmox.nodes(node).qemu(vmid).status.stop.post(vmid=vmid, node=node)
+        return proxmox.nodes(node).lxc.post(ostemplate=backup, restore='1', **options)
+    return proxmox.nodes(node).qemu.post(archive=backup, **options)
+
+
+def plan_restores(module, proxmox, cache):
+    """Return one restore job per entry of the restores option."""
+    jobs = []
+    for spec in module.params['restores']:
+        job = dict(vmid=spec['vmid'], backup=spec['backup'], storage=spec['storage'] or module.params['storage'],
+                   node=spec['node'], resource_type=None, exists=False)
+        jobs.append(job)
+        try:
+            job['resource_type'], job['node'], job['exists'] = resolve_target(
+                module, proxmox, cache, job['vmid'], job['backup'], job['node'])
+        except ValueError as e:
+            job['error'] = str(e)
+            continue
+        job['slots'] = restore_slots(job)
+    return jobs
+
+
+def plan_restore_tests(module):
+    """Return one restore job to a scratch guest per entry of the restore_tests option."""
+    jobs = []
+    for spec in module.params['restore_tests']:
+        job = dict(vmid=None, backup=spec['backup'], storage=spec['storage'] or module.params['storage'],
+                   node=spec['node'] or module.params['node'], resource_type=backup_guest_type(spec['backup']))
+        jobs.append(job)
+        if job['resource_type'] is None:
+            job['error'] = f"Unable to determine resource type: the type of backup {job['backup']} is unknown"
+        elif not job['node']:
+            job['error'] = f"node is required to test backup {job['backup']}"
         else:
-            try:
-                upid_stop = proxmox.nodes(node).qemu(vmid).status.shutdown.post(vmid=vmid,
-                                                                                node=node)
-                poll_task(proxmox, node, upid_stop)
-            except ResourceException:
-                if module.params['try_hard_stop']:
-                    upid_stop = proxmox.nodes(node).qemu(vmid).status.stop.post(vmid=vmid,
-                                                                                node=node)
-                    poll_task(proxmox, node, upid_stop)
-
-
-def poll_task(proxmox, node, upid):
-    status = proxmox.nodes(node).tasks(upid).status.get()
-    while status['status'] == 'running':
-        status = proxmox.nodes(node).tasks(upid).status.get()
-    if status['exitstatus'] != 'OK':
-        raise ResourceException(status_code=500,
-                                status_message="Task failed",
-                                content=f"{status['exitstatus']}")
-    else:
-        return status
+            job['slots'] = restore_slots(job)
+    return jobs
 
 
-def main():
-    module = AnsibleModule(
+def restore_slots(job):
+    """Return the concurrency slots of a restore: the node, and both the backup and the destination storage."""
+    storages = set([job['backup'].split(':', 1)[0]] + ([job['storage']] if job['storage'] else []))
+    return [('restores', 'all'), ('node', job['node'])] + [('storage', s) for s in sorted(storages)]
+
+
+def submit_restore(proxmox, module, job, jobs, budget, reserved=None):
+    """Submit the restore of ``job``; with ``reserved``, to a new scratch VMID as a RestoreTest."""
+    job['submitted'] = time.monotonic()
+    bwlimit = module.params['bandwidth_limit']
+    if budget is not None:
+        waiting = sum(1 for j in jobs if 'slots' in j and 'submitted' not in j) + 1
+        bwlimit = min(bwlimit or budget.total, budget.share(waiting))
+    if reserved is not None:
+        job['vmid'] = allocate_vmid(proxmox, reserved)
+    upid = post_restore(proxmox, module, job['resource_type'], job['node'], job['vmid'], job['backup'],
+                        job['storage'], bwlimit, scratch=reserved is not None)
+    job['bandwidth_limit'] = bwlimit
+    if budget is not None:
+        budget.acquire(upid, bwlimit)
+    watcher = task_watcher(proxmox, job['node'], upid, module.params, progress=progress_tracker(module.params))
+    if reserved is None:
+        return watcher
+    return RestoreTest(proxmox, job['node'], job['resource_type'], job['vmid'], watcher,
+                       lambda node, task: task_watcher(proxmox, node, task, module.params),
+                       boot_timeout=module.params['boot_timeout'], keep_failed=module.params['keep_failed'],
+                       boot_poll_interval=module.params['poll_interval'])
+
+
+def restore_results(jobs, started):
+    results = []
+    for job in jobs:
+        watcher = job.get('watcher')
+        result = dict(vmid=job['vmid'], backup=job['backup'], node=job['node'], storage=job['storage'],
+                      resource_type=job['resource_type'], upid=watcher and watcher.upid,
+                      handle=watcher and task_handle(job['node'], watcher.upid),
+                      bandwidth_limit=job.get('bandwidth_limit'), error=job.get('error'), status=None,
+                      stop=job.get('stop'), queued=None, duration=None, progress=None)
+        if 'submitted' in job:
+            result['queued'] = round(job['submitted'] - started, 3)
+        if watcher is not None and watcher.finished is not None:
+            result.update(status=watcher.status, duration=round(watcher.finished - job['submitted'], 3),
+                          progress=watcher.progress_result())
+            if not watcher.succeeded():
+                result['error'] = f"Task failed: {watcher.status.get('exitstatus')}"
+        results.append(result)
+    return results
+
+
+def restore_test_results(jobs, started):
+    results = []
+    for job in jobs:
+        watcher = job.get('watcher')
+        result = dict(backup=job['backup'], node=job['node'], storage=job['storage'], vmid=job['vmid'],
+                      resource_type=job['resource_type'], upid=None, queued=None, restore_duration=None,
+                      time_to_boot=None, rto=None, boot_check=None, network_unplugged=[], booted=False,
+                      torn_down=False, error=job.get('error'), teardown_error=None, progress=None)
+        if 'submitted' in job:
+            result['queued'] = round(job['submitted'] - started, 3)
+        if watcher is not None:
+            result.update(watcher.result())
+        results.append(result)
+    return results
+
+
+def rto(jobs, started):
+    """Return the seconds from the start until the last restore finished, or None if any is still running."""
+    finished = [job['watcher'].finished for job in jobs if 'watcher' in job]
+    if not finished or None in finished:
+        return None
+    return round(max(finished) - started, 3)
+
+
+def run_bulk(module, proxmox, cache, metrics):
+    started = time.monotonic()
+    with metrics.phase('discovery'):
+        jobs = plan_restores(module, proxmox, cache)
+    existing = [job for job in jobs if 'slots' in job and job['exists']]
+    with metrics.phase('stop'):
+        stops = stop_guests(proxmox, module, [(job['vmid'], job['node'], job['resource_type']) for job in existing])
+    for job, stop in zip(existing, stops):
+        job['stop'] = stop
+        if not stop['stopped']:
+            job['error'] = stop['error']
+            del job['slots']
+    runnable = [job for job in jobs if 'slots' in job]
+    try:
+        schedule_restores(module, proxmox, metrics, runnable)
+    except ProxmoxTaskTimeout as e:
+        module.fail_json(msg=str(e), restores=restore_results(jobs, started), rto=None)
+
+    results = restore_results(jobs, started)
+    result = dict(changed=any(r['upid'] for r in results), restores=results, rto=rto(runnable, started))
+    errors = [r for r in results if r['error']]
+    if errors:
+        module.fail_json(msg=f"Restore failed for {len(errors)} of {len(results)} guest(s)", **result)
+    module.exit_json(**result)
+
+
+def schedule_restores(module, proxmox, metrics, runnable, reserved=None):
+    """Submit ``runnable`` under the concurrency limits and bandwidth budget, and wait with O(wait).
+
+    With ``reserved`` (the VMIDs already handed out), the jobs are restore
+    tests to scratch guests and are always waited for.
+    """
+    limits = dict(restores=module.params['max_concurrent_restores'],
+                  node=module.params['max_concurrent_per_node'],
+                  storage=module.params['max_concurrent_per_storage'])
+    budget = None
+    if module.params['bandwidth_budget']:
+        budget = BandwidthBudget(module.params['bandwidth_budget'], max_active_jobs(runnable, limits))
+    poller = task_poller(module.params)
+
+    def submit(job):
+        with metrics.phase('submit'):
+            return submit_restore(proxmox, module, job, runnable, budget, reserved)
+
+    with metrics.phase('wait'):
+        run_jobs(runnable, submit, poller, limits, wait=module.params['wait'] or reserved is not None,
+                 on_finish=lambda job: budget and budget.release(job['watcher'].upid))
+
+
+def run_restore_tests(module, proxmox, metrics):
+    started = time.monotonic()
+    jobs = plan_restore_tests(module)
+    runnable = [job for job in jobs if 'slots' in job]
+    try:
+        schedule_restores(module, proxmox, metrics, runnable, reserved=set())
+    except ProxmoxTaskTimeout as e:
+        results = restore_test_results(jobs, started)
+        left = [r['vmid'] for r in results if r['upid'] and not r['torn_down']]
+        module.fail_json(msg=f"{str(e)}; scratch guests possibly left behind: {', '.join(str(v) for v in left)}",
+                         restore_tests=results, rto_summary=rto_summary(r['rto'] for r in results if r['booted']))
+
+    results = restore_test_results(jobs, started)
+    result = dict(changed=any(r['upid'] for r in results), restore_tests=results,
+                  rto_summary=rto_summary(r['rto'] for r in results if r['booted']))
+    errors = [r for r in results if r['error'] or r['teardown_error']]
+    if errors:
+        module.fail_json(msg=f"Restore test failed for {len(errors)} of {len(results)} backup(s)", **result)
+    module.exit_json(**result)
+
+
+def module_args():
+    return dict(
         argument_spec=dict(
-            api_host=dict(type='str', required=True),
-            api_user=dict(type='str', required=True),
-            api_password=dict(type='str', required=True, no_log=True),
-            api_port=dict(type='int', required=False, default=8006),
-            node=dict(type='str', required=True),
-            backup=dict(type='str', required=True),
-            verify_ssl=dict(type='bool', default=True),
-            vmid=dict(type='int', required=True),
+            **proxmox_auth_argument_spec(),
+            **metrics_argument_spec(),
+            node=dict(type='str', required=False),
+            backup=dict(type='str', required=False),
+            vmid=dict(type='int', required=False),
+            restores=dict(type='list', elements='dict', required=False, options=dict(
+                vmid=dict(type='int', required=True),
+                backup=dict(type='str', required=True),
+                node=dict(type='str', required=False),
+                storage=dict(type='str', required=False))
+            ),
+            restore_tests=dict(type='list', elements='dict', required=False, options=dict(
+                backup=dict(type='str', required=True),
+                node=dict(type='str', required=False),
+                storage=dict(type='str', required=False))
+            ),
+            boot_timeout=dict(type='int', default=300, required=False),
+            keep_failed=dict(type='bool', default=False, required=False),
             bandwidth_limit=dict(type='int', default=None, required=False),
+            bandwidth_budget=dict(type='int', default=None, required=False),
+            max_concurrent_restores=dict(type='int', default=0, required=False),
+            max_concurrent_per_node=dict(type='int', default=0, required=False),
+            max_concurrent_per_storage=dict(type='int', default=0, required=False),
             storage=dict(type='str', default=None, required=False),
             unique=dict(type='bool', default=False, required=False),
             start_after_restore=dict(type='bool', default=False),
             wait=dict(type='bool', default=False, required=False),
             hard_stop=dict(type='bool', default=False, required=False),
             try_hard_stop=dict(type='bool', default=False, required=False),
+            shutdown_timeout=dict(type='int', default=180, required=False),
+            resource_cache_ttl=dict(type='int', default=30, required=False),
+            resource_cache_dir=dict(type='path', default=None, required=False),
             override=dict(type="dict", options=dict(
                 unprivileged=dict(type='bool', default=None),
                 hostname=dict(type='str', default=None),
                 memory=dict(type='int', default=None),
                 cores=dict(type='int', default=None))
-            )
+            ),
+            **progress_argument_spec(),
+            **task_wait_argument_spec()
         ),
+        required_one_of=PROXMOX_AUTH_REQUIRED_ONE_OF + [('vmid', 'restores', 'restore_tests')],
+        required_together=PROXMOX_AUTH_REQUIRED_TOGETHER + [('vmid', 'backup')],
+        mutually_exclusive=[('vmid', 'restores', 'restore_tests'), ('backup', 'restores', 'restore_tests')],
         supports_check_mode=True
     )
-    if not HAS_PROXMOXER:
-        module.fail_json(msg=missing_required_lib(
-            'proxmoxer'), exception=PROXMOXER_IMP_ERR)
 
+
+def run_module(module):
     result = dict(
         changed=False,
         original_message='',
@@ -223,46 +852,56 @@ def main():
     node = module.params['node']
     vmid = module.params['vmid']
     wait = module.params['wait']
-    start_after_restore = '1' if module.params['start_after_restore'] else '0'
-    proxmox = ProxmoxAPI(module.params['api_host'],
-                         user=module.params['api_user'],
-                         password=module.params['api_password'],
-                         verify_ssl=module.params['verify_ssl'])
+    metrics = module_metrics(module, 'proxmox_backup_restore')
+    with metrics.phase('auth'):
+        proxmox = connect(module)
+    metrics.attach(proxmox)
 
     try:
-        resource_type = None
+        if module.params['restore_tests']:
+            run_restore_tests(module, proxmox, metrics)
+        cache = GuestCache(module.params['resource_cache_dir'] or default_cache_dir(), module.params['api_host'],
+                           module.params['api_port'], module.params['api_user'], module.params['resource_cache_ttl'])
+        if module.params['restores']:
+            run_bulk(module, proxmox, cache, metrics)
         try:
-            proxmox.nodes(node).lxc(vmid).get()
-            resource_type = 'lxc'
-        except ResourceException:
-            try:
-                proxmox.nodes(node).qemu(vmid).get()
-                resource_type = 'qemu'
-            except ResourceException as e:
-                module.fail_json(msg=f"Unable to determine resource type: {str(e)}")
-        stop_resource(proxmox, module, resource_type)
-        if resource_type == 'lxc':
-            upid = proxmox.nodes(node).lxc.post(vmid=vmid,
-                                                ostemplate=backup,
-                                                node=node,
-                                                restore='1',
-                                                force='1',
-                                                start=start_after_restore)
-        elif resource_type == 'qemu':
-            upid = proxmox.nodes(node).qemu.post(vmid=vmid,
-                                                 archive=backup,
-                                                 node=node,
-                                                 force='1',
-                                                 start=start_after_restore)
+            with metrics.phase('discovery'):
+                resource_type, node, exists = resolve_target(module, proxmox, cache, vmid, backup, node)
+        except ValueError as e:
+            module.fail_json(msg=str(e))
+        stop = None
+        if exists:
+            with metrics.phase('stop'):
+                stop = stop_guests(proxmox, module, [(vmid, node, resource_type)])[0]
+            if not stop['stopped']:
+                module.fail_json(msg=stop['error'], node=node, resource_type=resource_type, stop=stop)
+        with metrics.phase('submit'):
+            upid = post_restore(proxmox, module, resource_type, node, vmid, backup, module.params['storage'],
+                                module.params['bandwidth_limit'])
         status = None
+        task_log = None
+        task_stats = None
+        progress = None
         if wait:
-            poll_task(proxmox, node, upid)
-        module.exit_json(changed=True, task_id=upid, status=status)
+            with metrics.phase('wait'):
+                task = wait_for_task(proxmox, node, upid, module.params, progress=progress_tracker(module.params))
+            status, task_log, task_stats, progress = task['status'], task['log'], task['stats'], task['progress']
+        module.exit_json(changed=True, node=node, resource_type=resource_type,
+                         task_id=upid, handle=task_handle(node, upid), status=status,
+                         task_log=task_log, task_stats=task_stats, progress=progress, stop=stop)
 
+    except ProxmoxTaskError as e:
+        module.fail_json(msg=str(e), task_id=e.upid, status=e.status, task_log=e.log)
+    except ProxmoxTaskTimeout as e:
+        module.fail_json(msg=str(e), task_id=e.upid, task_log=e.log)
     except ResourceException as e:
         module.fail_json(msg=f"A Proxmox error occurred: {str(e)}")
     module.exit_json(changed=False)
 
 
+def main():
+    run_module(AnsibleModule(**module_args()))
+
+
 if __name__ == '__main__':
     main()
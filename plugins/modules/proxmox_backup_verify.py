@@ -0,0 +1,377 @@
+#!/usr/bin/python
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: proxmox_backup_verify
+
+short_description: Check that Proxmox backups are readable without restoring them
+
+version_added: "0.1.0"
+
+description:
+    - Check a set of backups, or a sample of the backups of every guest, without restoring them.
+    - The archive header of every backup is read by extracting the guest configuration from it with
+      C(/nodes/{node}/vzdump/extractconfig). For VMA archives this checks the header checksum; for Proxmox
+      Backup Server snapshots it reads the index and the configuration blob.
+    - For Proxmox Backup Server storages, the result of the verify jobs of the backup server is checked as well,
+      and snapshots those jobs found corrupt fail. Verify jobs themselves are scheduled on the backup server.
+    - Backups that were verified successfully are remembered on the controller by volume ID and creation time,
+      so later runs only read new backups.
+    - The module never changes anything and always returns C(changed=false).
+
+options:
+    node:
+        description:
+        - Proxmox node(s) whose storages are read.
+        - If omitted, every online node of the cluster is used.
+        required: false
+        type: list
+        elements: str
+    storage:
+        description: Storage identifier e.g. "local" or "all"
+        required: false
+        default: 'all'
+        type: str
+    volids:
+        description:
+        - Volume IDs of the backups to check, e.g. the C(volid) of the backups returned by
+          M(mcfitz2.proxmox_backup.proxmox_backup_info).
+        - If omitted, a sample of the backups on O(storage) is checked, see O(latest) and O(older).
+        required: false
+        type: list
+        elements: str
+    vmid:
+        description: Only sample the backups of these VMIDs.
+        required: false
+        type: list
+        elements: int
+    latest:
+        description: Number of newest backups of every guest to check when sampling.
+        required: false
+        default: 1
+        type: int
+    older:
+        description: Number of older backups of every guest, picked at random, to check when sampling.
+        required: false
+        default: 0
+        type: int
+    seed:
+        description: Seed of the random pick of O(older), to check the same backups on every run.
+        required: false
+        type: int
+    require_server_verification:
+        description:
+        - Report Proxmox Backup Server snapshots that no verify job of the backup server checked yet
+          as V(unverified), failing the module, instead of V(ok).
+        required: false
+        default: false
+        type: bool
+    max_workers:
+        description: Maximum number of storage listings and backup reads that run in parallel.
+        required: false
+        default: 4
+        type: int
+    cache:
+        description: Skip the backups verified successfully by an earlier run.
+        required: false
+        default: true
+        type: bool
+    cache_dir:
+        description:
+        - Directory of the cache of verified backups on the controller.
+        - Defaults to C(mcfitz2.proxmox_backup) in C($XDG_CACHE_HOME) or C(~/.cache).
+        required: false
+        type: path
+    cache_max_age:
+        description: Seconds after which a backup is verified again. If not specified, it never is.
+        required: false
+        type: int
+    progress_file:
+        description:
+        - Append one JSON line to this file as each backup is done, with the outcome as returned in RV(backups)
+          and the C(done) and C(total) counts, to follow a long run with C(tail -f).
+        required: false
+        type: path
+    timeout:
+        description: Timeout in seconds of every API request.
+        required: false
+        default: 30
+        type: int
+
+extends_documentation_fragment:
+    - mcfitz2.proxmox_backup.proxmox
+    - mcfitz2.proxmox_backup.proxmox.metrics
+
+requirements: [ "proxmoxer >= 2.0, < 3.0" ]
+
+author:
+    - Micah Fitzgerald (@mcfitz2)
+'''
+
+EXAMPLES = r'''
+---
+- name: Check the newest backup of every guest and two older ones picked at random
+  mcfitz2.proxmox_backup.proxmox_backup_verify:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    storage: pbs
+    latest: 1
+    older: 2
+    progress_file: /var/log/proxmox_backup_verify.jsonl
+
+- name: Find the two newest backups of every guest
+  mcfitz2.proxmox_backup.proxmox_backup_info:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    limit: 2
+  register: info
+
+- name: Check them
+  mcfitz2.proxmox_backup.proxmox_backup_verify:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    volids: "{{ info.backups | map(attribute='volid') | list }}"
+    max_workers: 8
+'''
+
+RETURN = r'''
+backups:
+    description: Outcome of every backup checked.
+    returned: success
+    type: list
+    elements: dict
+    contains:
+        volid:
+            description: Volume ID of the backup.
+            type: str
+        vmid:
+            description: VMID of the guest.
+            type: int
+        node:
+            description: Node the backup was read through.
+            type: str
+        storage:
+            description: Storage of the backup.
+            type: str
+        ctime:
+            description: Creation time of the backup.
+            type: int
+        method:
+            description: V(header) for archives on file storages, V(pbs) for Proxmox Backup Server snapshots.
+            type: str
+        server_verification:
+            description: State of the last verify job of the backup server, V(ok), V(failed) or V(null) if none ran.
+            type: str
+        state:
+            description: V(ok), V(failed), or V(unverified) with O(require_server_verification=true).
+            type: str
+        cached:
+            description: Whether the backup was verified by an earlier run and not read again.
+            type: bool
+        error:
+            description: Why the backup failed.
+            type: str
+        duration:
+            description: Seconds the check took.
+            type: float
+summary:
+    description: Number of backups per RV(backups[].state), and of those not read again, under C(cached).
+    returned: success
+    type: dict
+    sample: {"ok": 40, "failed": 1, "unverified": 0, "cached": 35}
+missing:
+    description: Volume IDs of O(volids) not found on any storage.
+    returned: success
+    type: list
+    elements: str
+errors:
+    description: Storages that could not be listed, keyed by C(node/storage).
+    returned: success
+    type: dict
+metrics:
+    description: API requests and time spent per phase of the module.
+    returned: when O(collect_metrics=true)
+    type: dict
+    contains:
+        requests:
+            description: Number of API requests.
+            type: int
+        bytes_received:
+            description: Bytes of API responses received.
+            type: int
+        retries:
+            description: Number of API requests sent again, for example after renewing an expired ticket.
+            type: int
+        endpoints:
+            description:
+            - Requests keyed by method and endpoint, e.g. C(GET nodes/{node}/storage/{storage}/content), with
+              their C(count), C(errors), C(bytes), C(total_seconds), C(max_seconds), C(p50_seconds),
+              C(p90_seconds) and C(p99_seconds).
+            type: dict
+        phases:
+            description: Seconds spent in each phase of the module, e.g. C(auth), C(listing) and C(verify).
+            type: dict
+        wall_time:
+            description: Seconds from the start of the module until it returned.
+            type: float
+'''
+
+import json  # noqa: E402
+import re  # noqa: E402
+from ansible.module_utils.basic import AnsibleModule  # noqa: E402
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.proxmox import (  # noqa: E402
+    PROXMOX_AUTH_REQUIRED_ONE_OF,
+    PROXMOX_AUTH_REQUIRED_TOGETHER,
+    ResourceException,
+    connect,
+    default_cache_dir,
+    proxmox_auth_argument_spec,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.listing import (  # noqa: E402
+    FILTERED_LOOKUP_LIMIT,
+    discover_cluster_storages,
+    list_backups,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.verify import (  # noqa: E402
+    VerifiedCache,
+    sample_backups,
+    verify_backups,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.metrics import (  # noqa: E402
+    metrics_argument_spec,
+    module_metrics,
+)
+
+# VMID in the volume ID of a vzdump archive or of a Proxmox Backup Server snapshot
+VOLID_VMID_RE = re.compile(r':backup/(?:vzdump-(?:qemu|lxc|openvz)-|(?:vm|ct)/)(\d+)[-/]')
+
+
+def find_volids(proxmox, targets, volids, max_workers):
+    """Return the backups of ``volids`` found on ``targets``, the volids not found and the listing errors.
+
+    When the volids name a few guests, their backups are listed with a
+    server-side VMID filter; otherwise every storage is listed once.
+    """
+    targets = [t for t in targets if t.storage in set(v.split(':', 1)[0] for v in volids)]
+    matches = [VOLID_VMID_RE.search(volid) for volid in volids]
+    vmids = sorted(set(int(m.group(1)) for m in matches if m))
+    if None in matches or len(vmids) > FILTERED_LOOKUP_LIMIT:
+        vmids = [None]
+    wanted = set(volids)
+    found = {}
+    errors = {}
+    for vmid in vmids:
+        backups, list_errors = list_backups(proxmox, targets, vmid=vmid, max_workers=max_workers)
+        errors.update(list_errors)
+        for backup in backups:
+            if backup['volid'] in wanted:
+                found.setdefault(backup['volid'], backup)
+    return [found[v] for v in volids if v in found], [v for v in volids if v not in found], errors
+
+
+def write_progress(path, result, done, total):
+    with open(path, 'a') as f:
+        f.write(json.dumps(dict(result, done=done, total=total), sort_keys=True) + '\n')
+
+
+def module_args():
+    return dict(
+        argument_spec=dict(
+            **proxmox_auth_argument_spec(),
+            **metrics_argument_spec(),
+            node=dict(type='list', elements='str', required=False),
+            storage=dict(type='str', required=False, default='all'),
+            volids=dict(type='list', elements='str', required=False),
+            vmid=dict(type='list', elements='int', required=False),
+            latest=dict(type='int', default=1, required=False),
+            older=dict(type='int', default=0, required=False),
+            seed=dict(type='int', required=False),
+            require_server_verification=dict(type='bool', default=False, required=False),
+            max_workers=dict(type='int', default=4, required=False),
+            cache=dict(type='bool', default=True, required=False),
+            cache_dir=dict(type='path', required=False),
+            cache_max_age=dict(type='int', required=False),
+            progress_file=dict(type='path', required=False),
+            timeout=dict(type='int', default=30, required=False)
+        ),
+        required_one_of=PROXMOX_AUTH_REQUIRED_ONE_OF,
+        required_together=PROXMOX_AUTH_REQUIRED_TOGETHER,
+        mutually_exclusive=[('volids', 'vmid')],
+        supports_check_mode=True
+    )
+
+
+def run_module(module):
+    params = module.params
+    if params['latest'] < 0 or params['older'] < 0:
+        module.fail_json(msg="latest and older must not be negative")
+    max_workers = params['max_workers']
+    metrics = module_metrics(module, 'proxmox_backup_verify')
+    with metrics.phase('auth'):
+        proxmox = connect(module, timeout=params['timeout'])
+    metrics.attach(proxmox)
+
+    try:
+        with metrics.phase('discovery'):
+            resources = proxmox.cluster.resources.get()
+            targets, errors = discover_cluster_storages(proxmox, params['node'], params['storage'], resources)
+            pbs_storages = set(r['storage'] for r in resources
+                               if r.get('type') == 'storage' and r.get('plugintype') == 'pbs')
+        missing = []
+        with metrics.phase('listing'):
+            if params['volids']:
+                backups, missing, list_errors = find_volids(proxmox, targets, params['volids'], max_workers)
+            else:
+                vmid = params['vmid'][0] if params['vmid'] and len(params['vmid']) == 1 else None
+                backups, list_errors = list_backups(proxmox, targets, vmid=vmid, max_workers=max_workers)
+                if params['vmid']:
+                    backups = [b for b in backups if b.get('vmid') in params['vmid']]
+                backups = sample_backups(backups, params['latest'], params['older'], params['seed'])
+        errors.update(list_errors)
+        if list_errors and len(list_errors) == len(targets):
+            module.fail_json(msg="Unable to list any storage", errors=errors)
+
+        cache = None
+        if params['cache']:
+            cache = VerifiedCache(params['cache_dir'] or default_cache_dir(), params['api_host'],
+                                  params['api_port'], params['api_user'], params['cache_max_age'])
+        done = []
+
+        def on_result(result):
+            done.append(result)
+            if params['progress_file']:
+                try:
+                    write_progress(params['progress_file'], result, len(done), len(backups))
+                except (IOError, OSError) as e:
+                    module.warn(f"Unable to write progress to {params['progress_file']}: {str(e)}")
+                    params['progress_file'] = None
+
+        with metrics.phase('verify'):
+            results = verify_backups(proxmox, backups, pbs_storages, cache, max_workers,
+                                     params['require_server_verification'], on_result)
+    except ResourceException as e:
+        module.fail_json(msg=f"A Proxmox error occurred: {str(e)}")
+
+    summary = dict((state, sum(1 for r in results if r['state'] == state)) for state in ('ok', 'failed', 'unverified'))
+    summary['cached'] = sum(1 for r in results if r['cached'])
+    result = dict(changed=False, backups=results, summary=summary, missing=missing, errors=errors)
+    if missing or summary['failed'] or summary['unverified']:
+        module.fail_json(msg=f"{summary['failed']} backup(s) failed, {summary['unverified']} unverified and "
+                             f"{len(missing)} not found", **result)
+    module.exit_json(**result)
+
+
+def main():
+    run_module(AnsibleModule(**module_args()))
+
+
+if __name__ == '__main__':
+    main()
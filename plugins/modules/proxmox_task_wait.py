@@ -0,0 +1,279 @@
+#!/usr/bin/python
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: proxmox_task_wait
+
+short_description: Wait for Proxmox tasks to finish
+
+version_added: "0.1.0"
+
+description:
+    - Wait for one or more Proxmox tasks, such as the ones started by M(mcfitz2.proxmox_backup.proxmox_backup)
+      or M(mcfitz2.proxmox_backup.proxmox_backup_restore) with O(mcfitz2.proxmox_backup.proxmox_backup#module:wait=false).
+    - All tasks are watched from a single polling loop, so one task can wait on a whole fleet of backups.
+
+options:
+    tasks:
+        description:
+        - Task handles to wait on, as returned in RV(mcfitz2.proxmox_backup.proxmox_backup#module:handle).
+        required: true
+        type: list
+        elements: dict
+        suboptions:
+            upid:
+                description: UPID of the task.
+                required: true
+                type: str
+            node:
+                description: Node the task runs on. Defaults to the node in the UPID.
+                required: false
+                type: str
+            starttime:
+                description: Start time of the task. Defaults to the start time in the UPID.
+                required: false
+                type: int
+    fail_on_error:
+        description:
+        - If V(true), fail when any task finished with an exit status other than C(OK).
+        - Tasks ending with C(WARNINGS), like vzdump jobs whose guest file system freeze timed out, succeeded;
+          they are counted in RV(warning_tasks) and do not fail the module.
+        required: false
+        default: true
+        type: bool
+
+extends_documentation_fragment:
+    - mcfitz2.proxmox_backup.proxmox
+    - mcfitz2.proxmox_backup.proxmox.metrics
+    - mcfitz2.proxmox_backup.proxmox.task_wait
+
+requirements: [ "proxmoxer >= 2.0, < 3.0" ]
+
+author:
+    - Micah Fitzgerald (@mcfitz2)
+'''
+
+EXAMPLES = r'''
+---
+- name: Start backups without holding a fork for each of them
+  mcfitz2.proxmox_backup.proxmox_backup:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    storage: pbs
+    vmid: "{{ item }}"
+  loop: "{{ guests }}"
+  register: backups
+
+- name: Wait for all of them at once
+  mcfitz2.proxmox_backup.proxmox_task_wait:
+    api_user: root@pam
+    api_password: 1q2w3e
+    api_host: node1
+    tasks: "{{ backups.results | map(attribute='handle') | list }}"
+    wait_timeout: 14400
+'''
+
+RETURN = r'''
+tasks:
+    description: Finished tasks, in the order they finished.
+    type: list
+    elements: dict
+    returned: always
+    contains:
+        upid:
+            description: UPID of the task.
+            type: str
+        node:
+            description: Node the task ran on.
+            type: str
+        status:
+            description: C(stopped) once finished, C(running) for tasks still running when the wait timed out.
+            type: str
+        exitstatus:
+            description:
+            - Exit status of the task, C(OK) on success.
+            - C(WARNINGS) followed by the number of warnings when it succeeded with warnings.
+            type: str
+        starttime:
+            description: Start time of the task (seconds since the epoch).
+            type: int
+        endtime:
+            description: End time of the task (seconds since the epoch), if known.
+            type: int
+        duration:
+            description: Seconds the task ran, if known.
+            type: int
+        task_log:
+            description: Last lines of the task log.
+            type: list
+            elements: str
+failed_tasks:
+    description: Number of tasks that finished with an exit status other than C(OK) or C(WARNINGS).
+    type: int
+    returned: always
+warning_tasks:
+    description: Number of tasks that succeeded with C(WARNINGS).
+    type: int
+    returned: always
+poll_rounds:
+    description: Number of polling rounds needed to wait on all tasks.
+    type: int
+    returned: always
+metrics:
+    description: API requests and time spent per phase of the module.
+    returned: when O(collect_metrics=true)
+    type: dict
+    contains:
+        requests:
+            description: Number of API requests.
+            type: int
+        bytes_received:
+            description: Bytes of API responses received.
+            type: int
+        retries:
+            description: Number of API requests sent again, for example after renewing an expired ticket.
+            type: int
+        endpoints:
+            description:
+            - Requests keyed by method and endpoint, e.g. C(GET nodes/{node}/storage/{storage}/content), with
+              their C(count), C(errors), C(bytes), C(total_seconds), C(max_seconds), C(p50_seconds),
+              C(p90_seconds) and C(p99_seconds).
+            type: dict
+        phases:
+            description: Seconds spent in each phase of the module, e.g. C(auth), C(discovery), C(submit) and C(wait).
+            type: dict
+        wall_time:
+            description: Seconds from the start of the module until it returned.
+            type: float
+'''
+
+from ansible.module_utils.basic import AnsibleModule  # noqa: E402
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.proxmox import (  # noqa: E402
+    PROXMOX_AUTH_REQUIRED_ONE_OF,
+    PROXMOX_AUTH_REQUIRED_TOGETHER,
+    ResourceException,
+    connect,
+    proxmox_auth_argument_spec,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.tasks import (  # noqa: E402
+    ProxmoxTaskTimeout,
+    parse_upid,
+    task_poller,
+    task_succeeded,
+    task_wait_argument_spec,
+    task_watcher,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.metrics import (  # noqa: E402
+    metrics_argument_spec,
+    module_metrics,
+)
+
+
+def module_args():
+    return dict(
+        argument_spec=dict(
+            **proxmox_auth_argument_spec(),
+            **metrics_argument_spec(),
+            tasks=dict(type='list', elements='dict', required=True, options=dict(
+                upid=dict(type='str', required=True),
+                node=dict(type='str', required=False),
+                starttime=dict(type='int', required=False))
+            ),
+            fail_on_error=dict(type='bool', default=True, required=False),
+            **task_wait_argument_spec()
+        ),
+        required_one_of=PROXMOX_AUTH_REQUIRED_ONE_OF,
+        required_together=PROXMOX_AUTH_REQUIRED_TOGETHER,
+        supports_check_mode=True
+    )
+
+
+def task_result(watcher, starttime):
+    result = dict(upid=watcher.upid, node=watcher.node, starttime=starttime, endtime=None, duration=None,
+                  status=watcher.status and watcher.status.get('status'),
+                  exitstatus=watcher.status and watcher.status.get('exitstatus'),
+                  task_log=list(watcher.log))
+    # a task already stopped at the first poll ended at an unknown time
+    if watcher.finished_at is not None and watcher.polls > 1:
+        result['endtime'] = int(watcher.finished_at)
+        result['duration'] = max(0, result['endtime'] - starttime)
+    return result
+
+
+def fill_end_times(proxmox, results):
+    """Look up the end time of tasks that had already stopped, with one task list call per node."""
+    missing = {}
+    for result in results:
+        if result['status'] == 'stopped' and result['endtime'] is None:
+            missing.setdefault(result['node'], []).append(result)
+    for node, node_results in missing.items():
+        since = min(r['starttime'] for r in node_results)
+        listed = dict((t['upid'], t) for t in proxmox.nodes(node).tasks.get(source='all', since=since,
+                                                                            limit=10000))
+        for result in node_results:
+            endtime = listed.get(result['upid'], {}).get('endtime')
+            if endtime is not None:
+                result.update(endtime=endtime, duration=max(0, endtime - result['starttime']))
+
+
+def outcome_counts(results):
+    """Return the number of stopped tasks that failed, and of those that succeeded with warnings."""
+    stopped = [r['exitstatus'] for r in results if r['status'] == 'stopped']
+    return (sum(1 for e in stopped if not task_succeeded(e)),
+            sum(1 for e in stopped if e != 'OK' and task_succeeded(e)))
+
+
+def run_module(module):
+    if module.check_mode:
+        module.exit_json(changed=False, tasks=[], failed_tasks=0, warning_tasks=0, poll_rounds=0)
+
+    metrics = module_metrics(module, 'proxmox_task_wait')
+    with metrics.phase('auth'):
+        proxmox = connect(module)
+    metrics.attach(proxmox)
+    poller = task_poller(module.params)
+    starttimes = {}
+    try:
+        for handle in module.params['tasks']:
+            fields = parse_upid(handle['upid'])
+            watcher = task_watcher(proxmox, handle['node'] or fields['node'], handle['upid'], module.params)
+            starttimes[watcher.upid] = handle['starttime'] or fields['starttime']
+            poller.add(watcher)
+    except ValueError as e:
+        module.fail_json(msg=str(e))
+
+    results = []
+    try:
+        with metrics.phase('wait'):
+            for watcher in poller.wait_all():
+                results.append(task_result(watcher, starttimes[watcher.upid]))
+        with metrics.phase('end_times'):
+            fill_end_times(proxmox, results)
+    except ProxmoxTaskTimeout as e:
+        results.extend(task_result(watcher, starttimes[watcher.upid]) for watcher in poller.running)
+        failed, warnings = outcome_counts(results)
+        module.fail_json(msg=str(e), tasks=results, poll_rounds=poller.rounds, failed_tasks=failed,
+                         warning_tasks=warnings)
+    except ResourceException as e:
+        module.fail_json(msg=f"A Proxmox error occurred: {str(e)}", tasks=results)
+
+    failed, warnings = outcome_counts(results)
+    result = dict(changed=False, tasks=results, failed_tasks=failed, warning_tasks=warnings,
+                  poll_rounds=poller.rounds)
+    if failed and module.params['fail_on_error']:
+        module.fail_json(msg=f"{failed} of {len(results)} task(s) failed", **result)
+    module.exit_json(**result)
+
+
+def main():
+    run_module(AnsibleModule(**module_args()))
+
+
+if __name__ == '__main__':
+    main()
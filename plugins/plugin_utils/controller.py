@@ -0,0 +1,91 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import warnings
+
+from ansible.module_utils.common.arg_spec import ArgumentSpecValidator
+from ansible.module_utils.common.parameters import remove_values
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.plugins.action import ActionBase
+from ansible.utils.vars import merge_hash
+
+
+class ModuleExit(Exception):
+    def __init__(self, result):
+        self.result = result
+        super(ModuleExit, self).__init__(result.get('msg', ''))
+
+
+class ControllerModule:
+    """The subset of AnsibleModule used by this collection's modules.
+
+    ``exit_json`` and ``fail_json`` raise ModuleExit with the result instead of
+    printing it and exiting the process.
+    """
+
+    def __init__(self, params, check_mode=False):
+        self.params = params
+        self.check_mode = check_mode
+        self.warnings = []
+
+    def warn(self, warning):
+        self.warnings.append(warning)
+
+    def exit_json(self, **kwargs):
+        if self.warnings:
+            kwargs['warnings'] = self.warnings
+        raise ModuleExit(kwargs)
+
+    def fail_json(self, msg, **kwargs):
+        kwargs.update(failed=True, msg=msg)
+        self.exit_json(**kwargs)
+
+
+def run_on_controller(module, args, check_mode=False):
+    """Run one of the collection's modules in this process and return its result.
+
+    ``module`` is the imported module, which provides ``module_args()`` and
+    ``run_module(module)``.
+    """
+    spec = module.module_args()
+    supports_check_mode = spec.pop('supports_check_mode', False)
+    validation = ArgumentSpecValidator(**spec).validate(args)
+    if validation.error_messages:
+        return dict(failed=True, msg=', '.join(validation.error_messages))
+    if check_mode and not supports_check_mode:
+        return dict(skipped=True, msg='remote module does not support check mode')
+    try:
+        with warnings.catch_warnings():
+            # a module process would print this on stderr where it goes unseen,
+            # in the worker process it would clutter the play output
+            warnings.filterwarnings('ignore', message='Unverified HTTPS request')
+            module.run_module(ControllerModule(validation.validated_parameters, check_mode))
+        result = dict(changed=False)
+    except ModuleExit as e:
+        result = e.result
+    return remove_values(result, validation._no_log_values)
+
+
+class ProxmoxActionBase(ActionBase):
+    """Run the module on the target like the normal action, or in-process with O(run_on_controller=true)."""
+
+    TRANSFERS_FILES = False
+    MODULE = None
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(ProxmoxActionBase, self).run(tmp, task_vars)
+        del tmp
+
+        if not boolean(self._task.args.get('run_on_controller', False), strict=False):
+            wrap_async = self._task.async_val and not self._connection.has_native_async
+            result = merge_hash(result, self._execute_module(task_vars=task_vars, wrap_async=wrap_async))
+            if not wrap_async:
+                self._remove_tmp_path(self._connection._shell.tmpdir)
+            return result
+
+        result.update(run_on_controller(self.MODULE, dict(self._task.args),
+                                        check_mode=self._task.check_mode))
+        return result
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Compare the per-task overhead of running a module as its own process with
+running it on the controller through the action plugin code path.
+
+Both variants call proxmox_backup_info against the local mock API server.  The
+"module" variant starts a new Python interpreter per task, the way a module
+runs on a target host; the "controller" variant calls run_on_controller() in
+this process, reusing the pooled API client.  Run it from a checkout placed at
+``.../ansible_collections/mcfitz2/proxmox_backup``::
+
+    python tests/benchmarks/bench_task_overhead.py --tasks 20 --latency 0.005
+"""
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+COLLECTION_ROOT = os.path.dirname(os.path.dirname(HERE))
+COLLECTIONS_PATH = os.path.dirname(os.path.dirname(os.path.dirname(COLLECTION_ROOT)))
+sys.path.insert(0, HERE)
+sys.path.insert(0, COLLECTIONS_PATH)
+
+from mock_pve import MockCluster, MockPVEServer  # noqa: E402
+
+MODULE = 'ansible_collections.mcfitz2.proxmox_backup.plugins.modules.proxmox_backup_info'
+
+
+def run_module_process(args):
+    env = dict(os.environ, PYTHONPATH=COLLECTIONS_PATH)
+    proc = subprocess.run([sys.executable, '-m', MODULE], input=json.dumps(dict(ANSIBLE_MODULE_ARGS=args)),
+                          env=env, capture_output=True, text=True, check=False)
+    result = json.loads(proc.stdout)
+    if result.get('failed'):
+        raise RuntimeError(result['msg'])
+
+
+def run_controller(args):
+    from ansible_collections.mcfitz2.proxmox_backup.plugins.modules import proxmox_backup_info
+    from ansible_collections.mcfitz2.proxmox_backup.plugins.plugin_utils.controller import run_on_controller
+    result = run_on_controller(proxmox_backup_info, args)
+    if result.get('failed'):
+        raise RuntimeError(result['msg'])
+
+
+def measure(name, runner, server, args, tasks):
+    server.cluster.reset_counters()
+    start = time.perf_counter()
+    for dummy in range(tasks):
+        runner(args)
+    elapsed = time.perf_counter() - start
+    cluster = server.cluster
+    return dict(variant=name, tasks=tasks, per_task_ms=round(elapsed / tasks * 1000, 1),
+                logins=cluster.logins, connections=cluster.connections, requests=cluster.total_requests())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every API request')
+    parser.add_argument('--backups', type=int, default=100, help='backups per storage')
+    options = parser.parse_args()
+
+    if os.path.basename(os.path.dirname(os.path.dirname(COLLECTION_ROOT))) != 'ansible_collections':
+        sys.exit('Run this from a checkout at .../ansible_collections/mcfitz2/proxmox_backup')
+
+    cluster = MockCluster(backups_per_storage=options.backups, latency=options.latency)
+    with MockPVEServer(cluster) as server:
+        args = server.module_args(node=['pve1'], vmid=100)
+        rows = [measure('module', run_module_process, server, args, options.tasks),
+                measure('controller', run_controller, server, args, options.tasks)]
+    columns = ('variant', 'tasks', 'per_task_ms', 'logins', 'connections', 'requests')
+    print(' '.join(f"{c:>12}" for c in columns))
+    for row in rows:
+        print(' '.join(f"{row[c]:>12}" for c in columns))
+
+
+if __name__ == '__main__':
+    main()
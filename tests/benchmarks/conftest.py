@@ -0,0 +1,205 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Fixtures for the benchmark suite.
+
+The modules are imported as ``ansible_collections.mcfitz2.proxmox_backup``.
+When the checkout is not already placed at ``.../ansible_collections/mcfitz2/
+proxmox_backup``, a temporary collections tree linking to it is put on
+``sys.path``.
+"""
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+COLLECTION_ROOT = os.path.dirname(os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+try:
+    import pytest_benchmark  # noqa: F401 pylint: disable=unused-import
+except ImportError:
+    collect_ignore_glob = ['test_*.py']
+
+from mock_pve import MockCluster, MockPVEServer  # noqa: E402
+
+# Run a module in a child process and report its peak resident set size on
+# stderr once it exits.  The module name is passed in the environment
+# because AnsibleModule reads its arguments from a file named in sys.argv[1].
+MEMORY_PROBE = '''
+import atexit, os, resource, runpy, sys
+atexit.register(lambda: sys.stderr.write("\\nPEAK %d" % (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)))
+runpy.run_module(os.environ["PROBE_MODULE"], run_name="__main__")
+'''
+# Import a module in a new interpreter and report the import time, the peak
+# resident set size and which of the modules named after it got loaded.
+IMPORT_PROBE = '''
+import json, resource, sys, time
+started = time.perf_counter()
+__import__(sys.argv[1])
+seconds = time.perf_counter() - started
+print(json.dumps(dict(seconds=seconds, peak_memory=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                      loaded=[m for m in sys.argv[2:] if m in sys.modules])))
+'''
+
+
+def collections_path():
+    parent = os.path.dirname(os.path.dirname(COLLECTION_ROOT))
+    if os.path.basename(parent) == 'ansible_collections':
+        return os.path.dirname(parent), None
+    tmpdir = tempfile.mkdtemp()
+    namespace = os.path.join(tmpdir, 'ansible_collections', 'mcfitz2')
+    os.makedirs(namespace)
+    os.symlink(COLLECTION_ROOT, os.path.join(namespace, 'proxmox_backup'))
+    return tmpdir, tmpdir
+
+
+COLLECTIONS_PATH, _TMP_COLLECTIONS = collections_path()
+sys.path.insert(0, COLLECTIONS_PATH)
+
+
+def init_collection_loader():
+    """Install Ansible's collection loader before any test module imports the collection.
+
+    Importing ``ansible_collections`` from ``sys.path`` first leaves the
+    collection without metadata, and its plugins cannot be loaded afterwards.
+    """
+    from ansible.plugins.loader import init_plugin_loader
+
+    init_plugin_loader([COLLECTIONS_PATH])
+
+
+init_collection_loader()
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('pve', 'mock Proxmox VE API')
+    group.addoption('--pve-latency', type=float, default=0.0,
+                    help='seconds added to every mock API request (default: 0)')
+    group.addoption('--pve-backups', default='10000,100000',
+                    help='comma separated numbers of backups to list (default: 10000,100000)')
+
+
+def pytest_configure(config):
+    # the mock serves a self-signed certificate
+    config.addinivalue_line('filterwarnings', 'ignore:Unverified HTTPS request')
+
+
+def pytest_generate_tests(metafunc):
+    if 'backup_count' in metafunc.fixturenames:
+        counts = [int(c) for c in metafunc.config.getoption('--pve-backups').split(',') if c]
+        metafunc.parametrize('backup_count', counts, ids=[f"{c}-backups" for c in counts])
+
+
+def pytest_unconfigure(config):
+    if _TMP_COLLECTIONS:
+        shutil.rmtree(_TMP_COLLECTIONS, ignore_errors=True)
+
+
+@pytest.fixture
+def pve(request):
+    """Return a factory starting a MockPVEServer for a MockCluster built from its arguments.
+
+    The ``--pve-latency`` option is applied unless ``latency`` is given.
+    """
+    servers = []
+
+    def start(**kwargs):
+        kwargs.setdefault('latency', request.config.getoption('--pve-latency'))
+        server = MockPVEServer(MockCluster(**kwargs))
+        server.start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def run_module():
+    """Run one of the collection's modules in-process and fail the test if the module failed."""
+    from ansible_collections.mcfitz2.proxmox_backup.plugins.plugin_utils.controller import run_on_controller
+
+    def run(module, args):
+        result = run_on_controller(module, args)
+        assert not result.get('failed'), result.get('msg')
+        return result
+
+    return run
+
+
+@pytest.fixture
+def peak_memory():
+    """Return a function running a module as its own process and returning its peak RSS in bytes."""
+    return module_peak_memory
+
+
+def module_peak_memory(name, args):
+    module = f"ansible_collections.mcfitz2.proxmox_backup.plugins.modules.{name}"
+    env = dict(os.environ, PYTHONPATH=COLLECTIONS_PATH, PYTHONWARNINGS='ignore', PROBE_MODULE=module)
+    proc = subprocess.run([sys.executable, '-c', MEMORY_PROBE],
+                          input=json.dumps(dict(ANSIBLE_MODULE_ARGS=args)),
+                          env=env, capture_output=True, text=True, check=False)
+    result = json.loads(proc.stdout)
+    assert not result.get('failed'), result.get('msg')
+    return int(proc.stderr.rsplit('PEAK ', 1)[1])
+
+
+@pytest.fixture
+def import_cost():
+    """Return a function importing a module in a new interpreter.
+
+    It takes the module name and the names of modules to look for, and returns
+    the import time in seconds, the peak RSS in bytes and which of the modules
+    looked for got loaded.
+    """
+    return module_import_cost
+
+
+def module_import_cost(name, watched=()):
+    module = f"ansible_collections.mcfitz2.proxmox_backup.plugins.modules.{name}"
+    env = dict(os.environ, PYTHONPATH=COLLECTIONS_PATH, PYTHONWARNINGS='ignore')
+    proc = subprocess.run([sys.executable, '-c', IMPORT_PROBE, module] + list(watched),
+                          env=env, capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout)
+
+
+@pytest.fixture
+def api_usage(benchmark):
+    """Return a function storing the mock API usage per round in the benchmark's extra info.
+
+    It returns the requests per round, keyed by ``METHOD route``.  With
+    ``--benchmark-disable`` the benchmarked body runs once whatever ``rounds``
+    it was given, and the requests are counted for that single run.
+    """
+    def record(server, rounds):
+        if benchmark.disabled:
+            rounds = 1
+        cluster = server.cluster
+        requests = dict((route, count // rounds) for route, count in sorted(cluster.requests.items()))
+        benchmark.extra_info.update(requests=requests, total_requests=sum(requests.values()),
+                                    logins=cluster.logins, connections=cluster.connections)
+        return requests
+
+    return record
+
+
+@pytest.fixture
+def api_client():
+    """Return a function building a proxmoxer client logged in to a MockPVEServer."""
+    from proxmoxer import ProxmoxAPI
+
+    def client(server):
+        return ProxmoxAPI(server.host, port=server.port, user='root@pam', password=server.cluster.password,
+                          verify_ssl=False)
+
+    return client
@@ -0,0 +1,666 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""In-process mock of the parts of the Proxmox VE REST API used by this collection.
+
+The mock serves HTTPS on 127.0.0.1 with a throw-away self-signed certificate,
+supports HTTP/1.1 keep-alive and counts logins, connections and requests per
+endpoint so benchmarks can assert on API usage.  Dataset sizes and latency are
+configurable through MockCluster.
+"""
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import datetime
+import json
+import os
+import re
+import shutil
+import ssl
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+BASE_CTIME = 1700000000
+
+
+def write_self_signed_cert(directory):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name)
+            .public_key(key.public_key()).serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(minutes=5))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+    cert_file = os.path.join(directory, 'cert.pem')
+    key_file = os.path.join(directory, 'key.pem')
+    with open(cert_file, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_file, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return cert_file, key_file
+
+
+class MockError(Exception):
+    def __init__(self, status, message):
+        self.status = status
+        self.message = message
+        super(MockError, self).__init__(message)
+
+
+class MockCluster:
+    """State of a fake Proxmox VE cluster.
+
+    ``storages`` maps a storage id to a dict with ``shared`` (bool), ``nodes``
+    (defaults to every node) and optionally ``latency`` (extra seconds per
+    content listing) and ``total`` (bytes).  ``backups_per_storage`` backups are
+    generated on every storage (per node for storages that are not shared),
+    spread round-robin over the guests one hour apart.  Tasks stay running for
+    ``task_polls`` status requests; shutdown tasks of the guests in
+    ``ignore_shutdown`` keep running until they are stopped.  vzdump jobs
+    reaching a guest in ``stalled_vzdump`` stop making progress there and
+    keep running, logging the same progress line at every status request.
+    The configuration of the backups in ``corrupt_backups`` (volids) cannot be
+    extracted.  The guest agent of a started VM answers its ``boot_pings``th
+    ping.
+    """
+
+    def __init__(self, nodes=('pve1',), guests=10, storages=None, backups_per_storage=10,
+                 latency=0.0, task_polls=2, password='secret', ignore_shutdown=(), stalled_vzdump=(),
+                 corrupt_backups=(), name='mock', boot_pings=1):
+        self.lock = threading.RLock()
+        self.nodes = list(nodes)
+        self.storages = storages or {'local': dict(shared=False), 'pbs': dict(shared=True)}
+        for storage in self.storages.values():
+            storage.setdefault('nodes', list(self.nodes))
+            storage.setdefault('latency', 0.0)
+            storage.setdefault('total', 10 * 1024 ** 4)
+        self.guests = {}
+        for i in range(guests):
+            vmid = 100 + i
+            self.guests[vmid] = dict(vmid=vmid, type='qemu' if i % 2 == 0 else 'lxc',
+                                     node=self.nodes[i % len(self.nodes)], status='running',
+                                     name=f"guest{vmid}", pool='pool%d' % (i % 3),
+                                     tags='prod' if i % 4 == 0 else '', template=0)
+        self.backups = {}
+        for stor, conf in self.storages.items():
+            for node in ([None] if conf['shared'] else conf['nodes']):
+                self.backups[(stor, node)] = self.generate_backups(stor, backups_per_storage)
+        self.latency = latency
+        self.task_polls = task_polls
+        self.ignore_shutdown = set(ignore_shutdown)
+        self.stalled_vzdump = set(stalled_vzdump)
+        self.corrupt_backups = set(corrupt_backups)
+        self.name = name
+        self.boot_pings = boot_pings
+        self.password = password
+        self.tickets = set()
+        self.tasks = {}
+        self.task_seq = 0
+        self.logins = 0
+        self.connections = 0
+        self.requests = Counter()
+        self.fail = {}
+        # route name -> [status, message, count]: the next ``count`` requests to the route fail
+        self.flaky = {}
+        # every restore submitted, with the restores already running at that time
+        self.restores = []
+        # every guest start, with the network interfaces of the guest at that time
+        self.boots = []
+
+    def generate_backups(self, storage, count):
+        vmids = sorted(self.guests) or [100]
+        backups = []
+        for i in range(count):
+            vmid = vmids[i % len(vmids)]
+            ctime = BASE_CTIME + i * 3600
+            stamp = time.strftime('%Y_%m_%d-%H_%M_%S', time.gmtime(ctime))
+            kind = self.guests.get(vmid, {}).get('type', 'qemu')
+            backups.append(dict(volid=f"{storage}:backup/vzdump-{kind}-{vmid}-{stamp}.vma.zst",
+                                vmid=vmid, ctime=ctime, size=1024 ** 3 + i, format='vma.zst',
+                                subtype=kind, content='backup'))
+        return backups
+
+    def storage_backups(self, storage, node):
+        conf = self.storages[storage]
+        return self.backups.setdefault((storage, None if conf['shared'] else node), [])
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = Counter()
+            self.logins = 0
+            self.connections = 0
+
+    def total_requests(self):
+        return sum(self.requests.values())
+
+    # tasks
+
+    def new_task(self, node, kind, target, lines, exitstatus='OK', on_finish=None, polls=None):
+        with self.lock:
+            self.task_seq += 1
+            starttime = int(time.time())
+            upid = f"UPID:{node}:{self.task_seq:08X}:00000000:{starttime:08X}:{kind}:{target}:root@pam:"
+            self.tasks[upid] = dict(upid=upid, node=node, type=kind, id=str(target), user='root@pam',
+                                    starttime=starttime, status='running',
+                                    polls=self.task_polls if polls is None else polls,
+                                    lines=list(lines), exitstatus=exitstatus, on_finish=on_finish)
+            if self.tasks[upid]['polls'] <= 0:
+                self.finish_task(self.tasks[upid])
+            return upid
+
+    def finish_task(self, task):
+        task['status'] = 'stopped'
+        task['endtime'] = int(time.time())
+        if task['exitstatus'] == 'OK' or task['exitstatus'].startswith('WARNINGS'):
+            task['lines'].append(f"TASK {task['exitstatus']}")
+        else:
+            task['lines'].append(f"TASK ERROR: {task['exitstatus']}")
+        if task['on_finish'] is not None:
+            task['on_finish']()
+
+    def task_status(self, upid):
+        task = self.tasks.get(upid)
+        if task is None:
+            raise MockError(500, 'no such task')
+        with self.lock:
+            if task['status'] == 'running':
+                task['polls'] -= 1
+                if task.get('stalled_line'):
+                    task['lines'].append(task['stalled_line'])
+                if task['polls'] <= 0:
+                    self.finish_task(task)
+        status = dict((k, task[k]) for k in ('upid', 'node', 'type', 'id', 'user', 'starttime', 'status'))
+        if task['status'] == 'stopped':
+            status['exitstatus'] = task['exitstatus']
+        return status
+
+    def vzdump(self, node, params):
+        storage = params.get('storage', 'local')
+        vmids = [int(v) for v in str(params.get('vmid', '')).split(',') if v]
+        lines = [f"INFO: starting new backup job: vzdump {' '.join(str(v) for v in vmids)} --storage {storage}"]
+        created = []
+        for vmid in vmids:
+            guest = self.guests.get(vmid)
+            lines.append(f"INFO: Starting Backup of VM {vmid} ({guest['type'] if guest else 'qemu'})")
+            if guest is None:
+                lines.append(f"ERROR: Backup of VM {vmid} failed - unable to find VM {vmid}")
+                continue
+            ctime = int(time.time())
+            stamp = time.strftime('%Y_%m_%d-%H_%M_%S', time.gmtime(ctime))
+            volid = f"{storage}:backup/vzdump-{guest['type']}-{vmid}-{stamp}.vma.zst"
+            lines.append(f"INFO: creating vzdump archive '/mnt/{storage}/dump/{volid.split('/')[-1]}'")
+            if vmid in self.stalled_vzdump:
+                stalled = 'INFO:   1% (82.0 MiB of 8.0 GiB) in 1s, read: 82.0 MiB/s, write: 82.0 MiB/s'
+                lines.append(stalled)
+                upid = self.new_task(node, 'vzdump', vmids[0] if len(vmids) == 1 else '', lines, 'OK',
+                                     polls=10 ** 9)
+                self.tasks[upid]['stalled_line'] = stalled
+                return upid
+            lines.append('INFO:  50% (4.0 GiB of 8.0 GiB) in 5s, read: 819.2 MiB/s, write: 400.0 MiB/s')
+            lines.append('INFO: 100% (8.0 GiB of 8.0 GiB) in 10s, read: 819.2 MiB/s, write: 400.0 MiB/s')
+            lines.append(f"INFO: Finished Backup of VM {vmid} (00:00:10)")
+            created.append(dict(volid=volid, vmid=vmid, ctime=ctime, size=1024 ** 3, format='vma.zst',
+                                subtype=guest['type'], content='backup'))
+        failed = len(created) != len(vmids)
+        lines.append('INFO: Backup job finished with errors' if failed else 'INFO: Backup job finished successfully')
+
+        def on_finish():
+            self.storage_backups(storage, node).extend(created)
+
+        target = vmids[0] if len(vmids) == 1 else ''
+        return self.new_task(node, 'vzdump', target, lines, 'job errors' if failed else 'OK', on_finish)
+
+    def restore(self, node, kind, params):
+        vmid = int(params['vmid'])
+        archive = params.get('archive') or params.get('ostemplate')
+        guest = self.guests.get(vmid)
+        if guest is not None and guest['status'] == 'running':
+            raise MockError(500, f"unable to restore VM {vmid} - VM is running")
+        if guest is not None and not params.get('force'):
+            raise MockError(500, f"unable to restore VM {vmid} - VM {vmid} already exists")
+        lines = [f"restore vma archive: {archive}",
+                 'progress 50% (read 4294967296 bytes, duration 5 sec)',
+                 'progress 100% (read 8589934592 bytes, duration 10 sec)',
+                 'rescan volumes...']
+
+        def on_finish():
+            self.guests[vmid] = dict(vmid=vmid, type=kind, node=node,
+                                     status='running' if str(params.get('start')) == '1' else 'stopped',
+                                     name=f"guest{vmid}", pool='', tags='', template=0)
+            if str(params.get('unique')) == '1':
+                self.guests[vmid]['config'] = self.guest_config(self.guests[vmid], unique=True)
+
+        with self.lock:
+            running = [t for t in self.tasks.values()
+                       if t['type'] in ('qmrestore', 'vzrestore') and t['status'] == 'running']
+            self.restores.append(dict(vmid=vmid, node=node, bwlimit=int(params.get('bwlimit') or 0),
+                                      storage=params.get('storage'), force=str(params.get('force')) == '1',
+                                      unique=str(params.get('unique')) == '1', running=len(running),
+                                      running_on_node=sum(1 for t in running if t['node'] == node),
+                                      running_bwlimit=sum(t['bwlimit'] for t in running)))
+            upid = self.new_task(node, 'qmrestore' if kind == 'qemu' else 'vzrestore', vmid, lines, 'OK',
+                                 on_finish)
+            self.tasks[upid]['bwlimit'] = int(params.get('bwlimit') or 0)
+            return upid
+
+    def guest_action(self, node, kind, vmid, action):
+        guest = self.guests.get(vmid)
+        if guest is None or guest['node'] != node or guest['type'] != kind:
+            raise MockError(500, f"Configuration file 'nodes/{node}/{kind}/{vmid}.conf' does not exist")
+        state = dict(start='running', stop='stopped', shutdown='stopped')[action]
+        exitstatus = 'OK'
+        if action == 'shutdown' and guest['status'] != 'running':
+            exitstatus = f"VM {vmid} not running"
+
+        def on_finish():
+            if exitstatus == 'OK':
+                guest['status'] = state
+                if action == 'start':
+                    guest['pings'] = 0
+                    config = self.guest_config(guest)
+                    self.boots.append(dict(vmid=vmid, net=dict((k, v) for k, v in config.items()
+                                                               if k.startswith('net'))))
+
+        polls = 10 ** 9 if action == 'shutdown' and vmid in self.ignore_shutdown else None
+        return self.new_task(node, f"{'qm' if kind == 'qemu' else 'vz'}{action}", vmid,
+                             [f"{action} {vmid}"], exitstatus, on_finish, polls)
+
+    def stop_task(self, upid):
+        task = self.tasks.get(upid)
+        if task is None:
+            raise MockError(500, 'no such task')
+        with self.lock:
+            if task['status'] == 'running':
+                task.update(exitstatus='interrupted by signal', on_finish=None)
+                self.finish_task(task)
+
+    def delete_volume(self, node, storage, volid):
+        backups = self.storage_backups(storage, node)
+        for i, backup in enumerate(backups):
+            if backup['volid'] == volid:
+                del backups[i]
+                return self.new_task(node, 'imgdel', '', [f"removed {volid}"], 'OK', polls=0)
+        raise MockError(500, f"volume '{volid}' does not exist")
+
+    def resources(self, kind=None):
+        resources = []
+        if kind in (None, 'node'):
+            resources.extend(dict(id=f"node/{n}", type='node', node=n, status='online') for n in self.nodes)
+        if kind in (None, 'storage'):
+            for stor, conf in sorted(self.storages.items()):
+                resources.extend(dict(id=f"storage/{n}/{stor}", type='storage', node=n, storage=stor,
+                                      shared=int(conf['shared']), content='backup', status='available',
+                                      plugintype='pbs' if conf['shared'] else 'dir',
+                                      maxdisk=conf['total'], disk=self.storage_used(stor, n))
+                                 for n in conf['nodes'])
+        if kind in (None, 'vm'):
+            resources.extend(dict(id=f"{g['type']}/{g['vmid']}", type=g['type'], vmid=g['vmid'], node=g['node'],
+                                  status=g['status'], name=g['name'], pool=g['pool'], tags=g['tags'],
+                                  template=g['template'])
+                             for g in sorted(self.guests.values(), key=lambda g: g['vmid']))
+        return resources
+
+    def storage_used(self, storage, node):
+        return sum(b['size'] for b in self.storage_backups(storage, node))
+
+    # routing
+
+    def handle(self, method, path, params):
+        for route_method, pattern, name in ROUTES:
+            match = pattern.match(path)
+            if match and route_method == method:
+                with self.lock:
+                    self.requests[f"{method} {name}"] += 1
+                    flaky = self.flaky.get(name)
+                    if flaky and flaky[2] > 0:
+                        flaky[2] -= 1
+                        raise MockError(flaky[0], flaky[1])
+                fail = self.fail.get(name)
+                if fail:
+                    raise MockError(*fail)
+                return getattr(self, 'route_' + name.replace('/', '_').replace('{', '').replace('}', ''))(
+                    params, *(unquote(g) for g in match.groups()))
+        raise MockError(501, f"Method '{method} /{path}' not implemented")
+
+    def route_cluster_resources(self, params):
+        return self.resources(params.get('type'))
+
+    def route_cluster_status(self, params):
+        return [dict(type='cluster', id='cluster', name=self.name, nodes=len(self.nodes), quorate=1)] + [
+            dict(type='node', id=f"node/{n}", name=n, online=1, local=int(i == 0)) for i, n in enumerate(self.nodes)]
+
+    def guest_config(self, guest, unique=False):
+        """Return the configuration of ``guest``, with new MAC addresses when ``unique``."""
+        if 'config' not in guest or unique:
+            mac = 'BC:24:11:%02X:%02X:%02X' % ((guest['vmid'] >> 8) & 0xff, guest['vmid'] & 0xff,
+                                               0x80 if unique else 0)
+            guest['config'] = dict(name=guest['name'])
+            if guest['type'] == 'qemu':
+                guest['config'].update(agent='1', net0=f"virtio={mac},bridge=vmbr0,firewall=1",
+                                       net1=f"virtio={mac[:-2]}01,bridge=vmbr1")
+            else:
+                guest['config'].update(net0=f"name=eth0,bridge=vmbr0,hwaddr={mac},ip=dhcp,type=veth")
+        return guest['config']
+
+    def get_guest(self, node, kind, vmid):
+        guest = self.guests.get(int(vmid))
+        if guest is None or guest['node'] != node or guest['type'] != kind:
+            raise MockError(500, f"Configuration file 'nodes/{node}/{kind}/{vmid}.conf' does not exist")
+        return guest
+
+    def route_cluster_nextid(self, params):
+        with self.lock:
+            taken = set(self.guests) | set(int(t['id']) for t in self.tasks.values()
+                                           if t['type'] in ('qmrestore', 'vzrestore') and t['status'] == 'running')
+        if params.get('vmid'):
+            vmid = int(params['vmid'])
+            if vmid in taken:
+                raise MockError(400, f"VM {vmid} already exists")
+            return str(vmid)
+        vmid = 100
+        while vmid in taken:
+            vmid += 1
+        return str(vmid)
+
+    def route_nodes_node_storage(self, params, node):
+        return [dict(storage=stor, shared=int(conf['shared']), content='backup', active=1,
+                     total=conf['total'], used=self.storage_used(stor, node))
+                for stor, conf in sorted(self.storages.items()) if node in conf['nodes']]
+
+    def route_nodes_node_storage_storage_status(self, params, node, storage):
+        conf = self.storages[storage]
+        used = self.storage_used(storage, node)
+        return dict(total=conf['total'], used=used, avail=conf['total'] - used, active=1,
+                    shared=int(conf['shared']), content='backup')
+
+    def route_nodes_node_storage_storage_content(self, params, node, storage):
+        if storage not in self.storages:
+            raise MockError(500, f"storage '{storage}' does not exist")
+        time.sleep(self.storages[storage]['latency'])
+        backups = self.storage_backups(storage, node)
+        if params.get('vmid'):
+            vmid = int(params['vmid'])
+            return [b for b in backups if b['vmid'] == vmid]
+        return backups
+
+    def route_nodes_node_storage_storage_content_volume(self, params, node, storage, volid):
+        return self.delete_volume(node, storage, volid)
+
+    def route_nodes_node_vzdump(self, params, node):
+        return self.vzdump(node, params)
+
+    def route_nodes_node_vzdump_extractconfig(self, params, node):
+        volid = params.get('volume', '')
+        storage = volid.split(':', 1)[0]
+        if storage not in self.storages or not any(b['volid'] == volid for b in self.storage_backups(storage, node)):
+            raise MockError(500, f"volume '{volid}' does not exist")
+        if volid in self.corrupt_backups:
+            raise MockError(500, 'command \'vma config\' failed: wrong vma extent header chechsum')
+        return 'cores: 2\nmemory: 2048\n'
+
+    def route_nodes_node_tasks(self, params, node):
+        tasks = [t for t in self.tasks.values() if t['node'] == node]
+        if params.get('source') == 'active':
+            tasks = [t for t in tasks if t['status'] == 'running']
+        if params.get('typefilter'):
+            tasks = [t for t in tasks if t['type'] == params['typefilter']]
+        if params.get('since'):
+            tasks = [t for t in tasks if t['starttime'] >= int(params['since'])]
+        tasks.sort(key=lambda t: t['starttime'], reverse=True)
+        start = int(params.get('start', 0))
+        tasks = tasks[start:start + int(params.get('limit', 50))]
+        result = []
+        for task in tasks:
+            entry = dict((k, task[k]) for k in ('upid', 'node', 'type', 'id', 'user', 'starttime'))
+            if task['status'] == 'stopped':
+                entry.update(endtime=task['endtime'], status=task['exitstatus'])
+            result.append(entry)
+        return result
+
+    def route_nodes_node_tasks_upid_status(self, params, node, upid):
+        return self.task_status(upid)
+
+    def route_nodes_node_tasks_upid_delete(self, params, node, upid):
+        return self.stop_task(upid)
+
+    def route_nodes_node_tasks_upid_log(self, params, node, upid):
+        task = self.tasks.get(upid)
+        if task is None:
+            raise MockError(500, 'no such task')
+        start = int(params.get('start', 0))
+        limit = int(params.get('limit', 50))
+        lines = [dict(n=i + 1, t=line) for i, line in enumerate(task['lines'][start:start + limit], start)]
+        # like Proxmox, a page without lines holds a placeholder numbered as the first line
+        return lines or [dict(n=1, t='no content')]
+
+    def list_guests(self, node, kind):
+        return [dict(vmid=g['vmid'], name=g['name'], status=g['status'])
+                for g in self.guests.values() if g['node'] == node and g['type'] == kind]
+
+    def route_nodes_node_qemu(self, params, node):
+        return self.list_guests(node, 'qemu')
+
+    def route_nodes_node_lxc(self, params, node):
+        return self.list_guests(node, 'lxc')
+
+    def route_nodes_node_qemu_create(self, params, node):
+        return self.restore(node, 'qemu', params)
+
+    def route_nodes_node_lxc_create(self, params, node):
+        return self.restore(node, 'lxc', params)
+
+    def route_nodes_node_kind_vmid(self, params, node, kind, vmid):
+        guest = self.guests.get(int(vmid))
+        if guest is None or guest['node'] != node or guest['type'] != kind:
+            raise MockError(500, f"Configuration file 'nodes/{node}/{kind}/{vmid}.conf' does not exist")
+        return [dict(subdir='config'), dict(subdir='status')]
+
+    def route_nodes_node_kind_vmid_config(self, params, node, kind, vmid):
+        return dict(self.guest_config(self.get_guest(node, kind, vmid)), digest='0' * 40)
+
+    def route_nodes_node_kind_vmid_config_put(self, params, node, kind, vmid):
+        self.guest_config(self.get_guest(node, kind, vmid)).update(params)
+        return None
+
+    def route_nodes_node_kind_vmid_status_current(self, params, node, kind, vmid):
+        guest = self.guests.get(int(vmid))
+        if guest is None or guest['node'] != node or guest['type'] != kind:
+            raise MockError(500, f"Configuration file 'nodes/{node}/{kind}/{vmid}.conf' does not exist")
+        return dict(vmid=guest['vmid'], status=guest['status'], name=guest['name'])
+
+    def route_nodes_node_kind_vmid_status_action(self, params, node, kind, vmid, action):
+        return self.guest_action(node, kind, int(vmid), action)
+
+    def route_nodes_node_kind_vmid_delete(self, params, node, kind, vmid):
+        guest = self.guests.pop(int(vmid), None)
+        if guest is None:
+            raise MockError(500, 'no such guest')
+        return self.new_task(node, 'qmdestroy', vmid, ['destroyed'], 'OK', polls=0)
+
+    def route_nodes_node_kind_vmid_agent_ping(self, params, node, kind, vmid):
+        guest = self.guests.get(int(vmid))
+        if guest is None or guest['status'] != 'running':
+            raise MockError(500, f"VM {vmid} is not running")
+        with self.lock:
+            guest['pings'] = guest.get('pings', self.boot_pings - 1) + 1
+            if guest['pings'] < self.boot_pings:
+                raise MockError(500, 'QEMU guest agent is not running')
+        return {}
+
+    def route_version(self, params):
+        return dict(version='8.2.2', release='8.2', repoid='mock')
+
+
+def _route(method, template, name=None):
+    patterns = dict(kind='(qemu|lxc)', volume='(.+)')
+    regex = re.sub(r'\{(\w+)\}', lambda m: patterns.get(m.group(1), '([^/]+)'), template)
+    return method, re.compile('^' + regex + '$'), name or template
+
+
+ROUTES = [
+    _route('GET', 'cluster/resources'),
+    _route('GET', 'cluster/nextid'),
+    _route('GET', 'cluster/status'),
+    _route('GET', 'nodes/{node}/storage'),
+    _route('GET', 'nodes/{node}/storage/{storage}/status'),
+    _route('GET', 'nodes/{node}/storage/{storage}/content'),
+    _route('DELETE', 'nodes/{node}/storage/{storage}/content/{volume}'),
+    _route('POST', 'nodes/{node}/vzdump'),
+    _route('GET', 'nodes/{node}/vzdump/extractconfig'),
+    _route('GET', 'nodes/{node}/tasks'),
+    _route('GET', 'nodes/{node}/tasks/{upid}/status'),
+    _route('GET', 'nodes/{node}/tasks/{upid}/log'),
+    _route('DELETE', 'nodes/{node}/tasks/{upid}', 'nodes/{node}/tasks/{upid}/delete'),
+    _route('GET', 'nodes/{node}/qemu'),
+    _route('GET', 'nodes/{node}/lxc'),
+    _route('POST', 'nodes/{node}/qemu', 'nodes/{node}/qemu/create'),
+    _route('POST', 'nodes/{node}/lxc', 'nodes/{node}/lxc/create'),
+    _route('GET', 'nodes/{node}/{kind}/{vmid}'),
+    _route('DELETE', 'nodes/{node}/{kind}/{vmid}', 'nodes/{node}/{kind}/{vmid}/delete'),
+    _route('GET', 'nodes/{node}/{kind}/{vmid}/config'),
+    _route('PUT', 'nodes/{node}/{kind}/{vmid}/config', 'nodes/{node}/{kind}/{vmid}/config/put'),
+    _route('GET', 'nodes/{node}/{kind}/{vmid}/status/current'),
+    _route('POST', 'nodes/{node}/{kind}/{vmid}/status/{action}'),
+    _route('POST', 'nodes/{node}/{kind}/{vmid}/agent/ping'),
+    _route('GET', 'version'),
+]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.cluster.lock:
+            self.server.cluster.connections += 1
+
+    def send(self, status, data):
+        body = json.dumps(dict(data=data)).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authenticated(self, cluster):
+        if self.headers.get('Authorization', '').startswith('PVEAPIToken='):
+            return True
+        cookies = self.headers.get('Cookie', '')
+        return any(f"PVEAuthCookie={ticket}" in cookies for ticket in cluster.tickets)
+
+    def login(self, cluster, params):
+        password = params.get('password')
+        if password != cluster.password and password not in cluster.tickets:
+            return self.send(401, None)
+        with cluster.lock:
+            cluster.logins += 1
+            ticket = f"PVE:{params['username']}:{cluster.logins:08X}::mock"
+            cluster.tickets.add(ticket)
+        return self.send(200, dict(ticket=ticket, CSRFPreventionToken='mock-csrf', username=params['username']))
+
+    def dispatch(self, method):
+        cluster = self.server.cluster
+        url = urlsplit(self.path)
+        params = dict((k, v[-1]) for k, v in parse_qs(url.query).items())
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            params.update((k, v[-1]) for k, v in parse_qs(self.rfile.read(length).decode('utf-8')).items())
+        path = url.path
+        if not path.startswith('/api2/json/'):
+            return self.send(404, None)
+        path = path[len('/api2/json/'):]
+        if cluster.latency:
+            time.sleep(cluster.latency)
+        if path == 'access/ticket' and method == 'POST':
+            return self.login(cluster, params)
+        if not self.authenticated(cluster):
+            return self.send(401, None)
+        try:
+            data = cluster.handle(method, path, params)
+        except Exception as e:
+            error = e if isinstance(e, MockError) else MockError(500, str(e))
+            self.send_response(error.status, error.message)
+            body = json.dumps(dict(data=None, message=error.message)).encode('utf-8')
+            self.send_header('Content-Type', 'application/json;charset=UTF-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send(200, data)
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+
+class MockPVEServer:
+    """Serve a MockCluster over HTTPS from a background thread.
+
+    Use as a context manager; ``host``, ``port`` and ``module_args()`` give the
+    connection options for the modules.
+    """
+
+    def __init__(self, cluster=None):
+        self.cluster = cluster or MockCluster()
+        self.server = None
+        self.tmpdir = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.tmpdir = tempfile.mkdtemp()
+        cert_file, key_file = write_self_signed_cert(self.tmpdir)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_file, key_file)
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), MockHandler)
+        self.server.daemon_threads = True
+        self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        self.server.cluster = self.cluster
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    @property
+    def host(self):
+        return self.server.server_address[0]
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def module_args(self, **kwargs):
+        args = dict(api_host=self.host, api_port=self.port, api_user='root@pam',
+                    api_password=self.cluster.password, verify_ssl=False)
+        args.update(kwargs)
+        return args
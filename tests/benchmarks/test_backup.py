@@ -0,0 +1,100 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Benchmarks of proxmox_backup submitting vzdump jobs for many guests and waiting for them."""
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import time
+
+import pytest
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.locks import GuestLocks
+from ansible_collections.mcfitz2.proxmox_backup.plugins.modules import proxmox_backup
+from ansible_collections.mcfitz2.proxmox_backup.plugins.plugin_utils.controller import run_on_controller
+
+ROUNDS = 3
+NODES = ('pve1', 'pve2', 'pve3', 'pve4')
+
+
+@pytest.mark.parametrize('guests', [20, 400])
+def test_backup_pool(benchmark, pve, run_module, api_usage, guests):
+    server = pve(nodes=NODES, guests=guests, backups_per_storage=0, task_polls=3)
+    args = server.module_args(storage='pbs', pool='pool0', wait=True, poll_interval=0.001,
+                              max_poll_interval=0.001)
+    run_module(proxmox_backup, args)
+    server.cluster.reset_counters()
+    result = benchmark.pedantic(run_module, args=(proxmox_backup, args), rounds=ROUNDS, iterations=1)
+    requests = api_usage(server, ROUNDS)
+    assert len(result['guests']) == len([v for v in range(guests) if v % 3 == 0])
+    # one guest lookup and one vzdump job per node, whatever the number of guests
+    assert requests['GET cluster/resources'] == 1
+    assert requests['POST nodes/{node}/vzdump'] == len(NODES)
+    assert requests['GET nodes/{node}/tasks/{upid}/status'] == 3 * len(NODES)
+
+
+@pytest.mark.parametrize('guests', [20, 400])
+def test_backup_max_age(benchmark, pve, run_module, api_usage, guests):
+    server = pve(nodes=NODES, guests=guests, storages={'pbs': dict(shared=True)}, backups_per_storage=guests)
+    args = server.module_args(storage='pbs', pool='pool0', max_age=10 ** 10)
+    run_module(proxmox_backup, args)
+    server.cluster.reset_counters()
+    result = benchmark.pedantic(run_module, args=(proxmox_backup, args), rounds=ROUNDS, iterations=1)
+    requests = api_usage(server, ROUNDS)
+    selected = len([v for v in range(guests) if v % 3 == 0])
+    assert not result['changed']
+    assert len(result['skipped']) == selected
+    assert 'POST nodes/{node}/vzdump' not in requests
+    # a filtered lookup per guest for a few guests, one listing per node for many
+    lookups = selected if guests == 20 else len(NODES)
+    assert requests == {'GET cluster/resources': 1, 'GET nodes/{node}/storage/{storage}/content': lookups}
+
+
+def test_backup_check_mode(pve):
+    server = pve(nodes=NODES, guests=40, storages={'pbs': dict(shared=True)}, backups_per_storage=40, task_polls=3)
+    # guests 100..103 have a backup from today, the others only old ones
+    for backup in server.cluster.storage_backups('pbs', None):
+        if backup['vmid'] < 104:
+            backup['ctime'] = int(time.time()) - 600
+    args = server.module_args(storage='pbs', all_guests=True, node='pve1', max_age=3600)
+    result = run_on_controller(proxmox_backup, args, check_mode=True)
+    assert result['changed']
+    assert [s['vmid'] for s in result['skipped']] == [100]
+    assert [job['vmids'] for job in result['jobs']] == [list(range(104, 140, 4))]
+    assert set(g['status'] for g in result['guests']) == {'planned'}
+    assert server.cluster.requests['POST nodes/{node}/vzdump'] == 0
+
+
+def test_backup_attach_running(pve, run_module, tmp_path):
+    server = pve(nodes=NODES, guests=8, backups_per_storage=0, task_polls=5)
+    args = server.module_args(storage='pbs', vmid=[100, 104], lock_dir=str(tmp_path), poll_interval=0.001,
+                              max_poll_interval=0.001)
+    # another run holding the lock of a guest keeps this one from submitting a job for it
+    held = GuestLocks(str(tmp_path), 'mock')
+    held.acquire([104])
+    result = run_on_controller(proxmox_backup, dict(args, lock_timeout=0))
+    held.release_all()
+    assert result.get('failed') and 'lock of VM 104' in result['msg']
+    first = run_module(proxmox_backup, args)
+    # a second run while the job is still running follows it instead of submitting another one
+    second = run_module(proxmox_backup, dict(args, wait=True))
+    assert server.cluster.requests['POST nodes/{node}/vzdump'] == 1
+    assert not second['changed']
+    assert second['jobs'][0]['attached'] and second['upid'] == first['upid']
+    assert [g['status'] for g in second['guests']] == ['ok', 'ok']
+    assert second['progress']['percent'] == 100
+    assert [s['vmid'] for s in second['progress']['samples']] == [100, 100, 104, 104]
+
+
+def test_backup_stalled(pve):
+    server = pve(nodes=('pve1',), guests=3, backups_per_storage=0, stalled_vzdump={101})
+    args = server.module_args(storage='pbs', vmid=[100, 101, 102], wait=True, min_throughput=1,
+                              throughput_window=1, poll_interval=0.05, max_poll_interval=0.05)
+    result = run_on_controller(proxmox_backup, args)
+    assert result.get('failed') and result['msg'] == '1 of 1 job(s) failed, 2 of 3 guest(s) without a backup'
+    assert 'below 1.0 MiB/s' in result['jobs'][0]['error']
+    assert server.cluster.requests['DELETE nodes/{node}/tasks/{upid}/delete'] == 1
+    assert [g['status'] for g in result['guests']] == ['ok', 'unknown', 'unknown']
+    progress = result['progress']
+    assert progress['samples'][-1]['vmid'] == 101 and progress['samples'][-1]['read_mib_s'] == 82.0
+    assert 1 <= result['task_stats']['wall_time'] < 5
@@ -0,0 +1,32 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Benchmarks of proxmox_backup_compliance checking 5k guests against 10k-100k backups."""
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.modules import proxmox_backup_compliance
+
+ROUNDS = 3
+GUESTS = 5000
+RULES = [
+    dict(tag='prod', min_copies=2, required_storages=['pbs']),
+    dict(pool='pool1', min_copies=10 ** 6, severity='warning'),
+    dict(vmid=[100, 101], min_copies=10 ** 6, severity='info'),
+]
+
+
+def test_compliance(benchmark, pve, backup_count, run_module, api_usage):
+    server = pve(nodes=('pve1', 'pve2', 'pve3'), guests=GUESTS, backups_per_storage=backup_count,
+                 storages={'pbs': dict(shared=True), 'local': dict(shared=False)})
+    args = server.module_args(rpo=10 ** 10, rules=RULES)
+    result = benchmark.pedantic(run_module, args=(proxmox_backup_compliance, args), rounds=ROUNDS, iterations=1)
+    benchmark.extra_info['timing'] = result['timing']
+    assert result['guests'] == GUESTS
+    # VMID rules win over tag rules, which win over pool rules
+    pool1 = [g for g in server.cluster.guests.values()
+             if g['pool'] == 'pool1' and 'prod' not in g['tags'] and g['vmid'] not in (100, 101)]
+    assert result['summary'] == dict(critical=0, warning=len(pool1), info=2)
+    assert [v['vmid'] for v in result['violations']['info']] == [100, 101]
+    # the guests and storages come from one call, and every storage is listed once
+    assert api_usage(server, ROUNDS) == {'GET cluster/resources': 1, 'GET nodes/{node}/storage/{storage}/content': 4}
@@ -0,0 +1,139 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Benchmarks of proxmox_backup_info listing 10k-100k backups."""
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import os
+import stat
+import time
+
+import pytest
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.index import index_path, open_index
+from ansible_collections.mcfitz2.proxmox_backup.plugins.modules import proxmox_backup_info
+
+ROUNDS = 3
+GUESTS = 500
+CONTENT = 'GET nodes/{node}/storage/{storage}/content'
+
+
+@pytest.fixture
+def server(pve, backup_count):
+    return pve(nodes=('pve1', 'pve2', 'pve3'), guests=GUESTS, storages={'pbs': dict(shared=True)},
+               backups_per_storage=backup_count)
+
+
+def bench_info(benchmark, server, run_module, args):
+    run_module(proxmox_backup_info, args)
+    server.cluster.reset_counters()
+    return benchmark.pedantic(run_module, args=(proxmox_backup_info, args), rounds=ROUNDS, iterations=1)
+
+
+def test_list_all(benchmark, server, backup_count, run_module, api_usage):
+    result = bench_info(benchmark, server, run_module, server.module_args())
+    assert len(result['backups']) == backup_count
+    # one discovery call, and the shared storage is listed once rather than once per node
+    assert api_usage(server, ROUNDS) == {'GET cluster/resources': 1, CONTENT: 1}
+
+
+def test_filter_vmid(benchmark, server, backup_count, run_module, api_usage):
+    result = bench_info(benchmark, server, run_module, server.module_args(vmid=100))
+    assert len(result['backups']) == backup_count // GUESTS
+    assert api_usage(server, ROUNDS) == {'GET cluster/resources': 1, CONTENT: 1}
+
+
+def test_limit_per_vmid(benchmark, server, run_module, api_usage):
+    result = bench_info(benchmark, server, run_module, server.module_args(limit=2))
+    assert len(result['backups']) == 2 * GUESTS
+    assert api_usage(server, ROUNDS) == {'GET cluster/resources': 1, CONTENT: 1}
+
+
+def test_index_cache(benchmark, server, run_module, api_usage, tmp_path):
+    result = bench_info(benchmark, server, run_module,
+                        server.module_args(latest_only=True, index_cache=True, index_cache_dir=str(tmp_path)))
+    assert result['latest'] is not None
+    assert result['index'] == dict(path=result['index']['path'], hits=1, refreshed=0)
+    assert api_usage(server, ROUNDS) == {'GET cluster/resources': 1}
+
+
+def test_index_per_user(server, run_module, tmp_path):
+    # listings depend on the ACL of the user or token, so each gets its own index
+    paths = []
+    for user, token in (('root@pam', None), ('backup@pve', None), ('backup@pve', 'ro')):
+        args = server.module_args(latest_only=True, index_cache=True, index_cache_dir=str(tmp_path), api_user=user)
+        if token:
+            args.update(api_password=None, api_token_id=token, api_token_secret='secret')
+        result = run_module(proxmox_backup_info, args)
+        assert result['index']['hits'] == 0
+        paths.append(result['index']['path'])
+    assert len(set(paths)) == 3
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(p) for p in paths)
+
+
+def test_index_permissions(tmp_path):
+    # the WAL files hold backup listings like the database, also when an older run left them readable
+    path = index_path(str(tmp_path), 'node1', 8006, 'root@pam')
+    for name in (path, f"{path}-wal", f"{path}-shm"):
+        open(name, 'wb').close()
+        os.chmod(name, 0o644)
+    os.remove(f"{path}-shm")
+    index = open_index(str(tmp_path), 'node1', 8006, 'root@pam')
+    try:
+        modes = dict((name, stat.S_IMODE(os.stat(tmp_path / name).st_mode)) for name in os.listdir(tmp_path))
+    finally:
+        index.close()
+    assert len(modes) == 3 and set(modes.values()) == {0o600}
+
+
+@pytest.mark.parametrize('latest_only', [False, True], ids=['all', 'latest-only'])
+def test_module_process(benchmark, server, peak_memory, latest_only):
+    """Wall time and peak memory of the module running as its own process, like on a target host."""
+    args = server.module_args(latest_only=latest_only)
+    peak = benchmark.pedantic(peak_memory, args=('proxmox_backup_info', args), rounds=1, iterations=1)
+    benchmark.extra_info['peak_memory'] = peak
+
+
+def test_forecast(benchmark, server, backup_count, run_module, api_usage):
+    result = bench_info(benchmark, server, run_module, server.module_args(forecast=True))
+    forecast = result['forecast']
+    assert result['backups'] == []
+    assert result['latest']['ctime'] == max(b['ctime'] for b in server.cluster.storage_backups('pbs', 'pve1'))
+    assert len(forecast['guests']) == GUESTS
+    assert forecast['storages']['pbs']['backup_count'] == backup_count
+    assert forecast['most_headroom'] == 'pbs'
+    # the listing is aggregated while it is read, and the capacity of the shared storage is read once
+    assert api_usage(server, ROUNDS) == {'GET cluster/resources': 1, CONTENT: 1,
+                                         'GET nodes/{node}/storage/{storage}/status': 1}
+
+
+def test_forecast_growth(pve, run_module):
+    day = 86400
+    growth = 10 * 1024 ** 2
+    server = pve(nodes=('pve1',), guests=4, backups_per_storage=0,
+                 storages={'pbs': dict(shared=True, total=200 * 1024 ** 3), 'local': dict(shared=False)})
+    now = int(time.time())
+    backups = server.cluster.storage_backups('pbs', 'pve1')
+    for vmid in range(100, 104):
+        for d in range(10):
+            ctime = now - (9 - d) * day - 60
+            backups.append(dict(volid=f"pbs:backup/vzdump-qemu-{vmid}-{ctime}.vma.zst", vmid=vmid, ctime=ctime,
+                                size=1024 ** 3 * (vmid - 99) + d * growth, format='vma.zst', subtype='qemu',
+                                content='backup'))
+    forecast = run_module(proxmox_backup_info, server.module_args(forecast=True, forecast_window=10))['forecast']
+    pbs = forecast['storages']['pbs']
+    used = sum(b['size'] for b in backups)
+    assert (pbs['total'], pbs['used'], pbs['backup_bytes']) == (200 * 1024 ** 3, used, used)
+    assert sum(day['count'] for day in pbs['series']) == 40
+    # every guest keeps 10 backups growing by 10 MiB a day
+    assert pbs['growth_rate'] == pytest.approx(4 * 10 * growth, rel=1e-6)
+    assert pbs['days_to_full'] == pytest.approx((200 * 1024 ** 3 - used) / (4 * 10 * growth), abs=0.1)
+    assert pbs['ingest_rate'] == pytest.approx(used / 10, abs=0.1)
+    assert pbs['days_to_full_without_pruning'] == pytest.approx((200 * 1024 ** 3 - used) / (used / 10), abs=0.1)
+    guest = forecast['guests'][101]['storages']['pbs']
+    assert guest['size_growth'] == pytest.approx(growth, rel=1e-6)
+    assert (guest['backup_interval'], guest['latest_size']) == (day, 2 * 1024 ** 3 + 9 * growth)
+    # the empty local storage is not filling up, so it has the most headroom
+    assert forecast['storages']['pve1/local']['days_to_full'] is None
+    assert forecast['most_headroom'] == 'pve1/local'
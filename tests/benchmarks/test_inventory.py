@@ -0,0 +1,69 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Benchmarks of the proxmox_backup inventory plugin scanning 10k-100k backups, with and without its cache."""
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import shutil
+
+import pytest
+
+ROUNDS = 3
+GUESTS = 500
+CONFIG = '''
+plugin: mcfitz2.proxmox_backup.proxmox_backup
+api_host: {host}
+api_port: {port}
+api_user: root@pam
+api_password: {password}
+verify_ssl: false
+cache: true
+cache_plugin: ansible.builtin.jsonfile
+cache_connection: {cache}
+cache_timeout: 600
+groups:
+  backup_missing: proxmox_backup.backup_count == 0
+'''
+
+
+@pytest.fixture(scope='module')
+def inventory_manager():
+    from ansible.inventory.manager import InventoryManager
+    from ansible.parsing.dataloader import DataLoader
+
+    return lambda source: InventoryManager(DataLoader(), sources=[source])
+
+
+@pytest.fixture
+def server(pve, backup_count):
+    return pve(nodes=('pve1', 'pve2', 'pve3'), guests=GUESTS, storages={'pbs': dict(shared=True)},
+               backups_per_storage=backup_count)
+
+
+@pytest.mark.parametrize('cached', [False, True], ids=['scan', 'cached'])
+def test_inventory(benchmark, inventory_manager, server, backup_count, api_usage, tmp_path, cached):
+    cache = tmp_path / 'cache'
+    source = tmp_path / 'proxmox_backup.yml'
+    source.write_text(CONFIG.format(host=server.host, port=server.port, password=server.cluster.password,
+                                    cache=cache))
+    if cached:
+        inventory_manager(str(source))
+        server.cluster.reset_counters()
+
+    def setup():
+        if not cached:
+            shutil.rmtree(cache, ignore_errors=True)
+
+    inventory = benchmark.pedantic(inventory_manager, args=(str(source),), setup=setup, rounds=ROUNDS, iterations=1)
+    requests = api_usage(server, ROUNDS)
+    backup = inventory.get_host('guest100').vars['proxmox_backup']
+    assert len(inventory.hosts) == GUESTS
+    assert backup['backup_count'] == backup_count // GUESTS
+    assert backup['age_seconds'] is not None
+    assert 'backup_missing' not in inventory.groups
+    if cached:
+        assert requests == {}
+    else:
+        # one call for the guests and storages, and the shared storage is listed once
+        assert requests == {'GET cluster/resources': 1, 'GET nodes/{node}/storage/{storage}/content': 1}
@@ -0,0 +1,55 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Benchmarks of the overhead of collect_metrics, checked against the requests counted by the mock."""
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import json
+
+import pytest
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.modules import proxmox_backup, proxmox_backup_info
+
+ROUNDS = 3
+NODES = ('pve1', 'pve2', 'pve3', 'pve4')
+
+
+@pytest.mark.parametrize('collect_metrics', [False, True], ids=['off', 'on'])
+def test_info_metrics(benchmark, pve, run_module, api_usage, collect_metrics):
+    server = pve(nodes=NODES, guests=500, storages={'pbs': dict(shared=True)}, backups_per_storage=10000)
+    args = server.module_args(collect_metrics=collect_metrics)
+    run_module(proxmox_backup_info, args)
+    server.cluster.reset_counters()
+    result = benchmark.pedantic(run_module, args=(proxmox_backup_info, args), rounds=ROUNDS, iterations=1)
+    requests = api_usage(server, ROUNDS)
+    if not collect_metrics:
+        assert 'metrics' not in result
+        return
+    metrics = result['metrics']
+    assert dict((name, e['count']) for name, e in metrics['endpoints'].items()) == requests
+    assert metrics['bytes_received'] > 0
+    assert set(metrics['phases']) == {'auth', 'discovery', 'listing'}
+
+
+def test_backup_metrics_file(pve, run_module, tmp_path):
+    server = pve(nodes=NODES, guests=40, backups_per_storage=0, task_polls=3)
+    json_file = tmp_path / 'metrics.json'
+    prom_file = tmp_path / 'metrics.prom'
+    args = server.module_args(storage='pbs', pool='pool0', wait=True, poll_interval=0.001, max_poll_interval=0.001,
+                              collect_metrics=True)
+    run_module(proxmox_backup, dict(args, metrics_file=str(json_file)))
+    run_module(proxmox_backup, dict(args, metrics_file=str(json_file)))
+    result = run_module(proxmox_backup, dict(args, metrics_file=str(prom_file), metrics_format='openmetrics'))
+
+    lines = [json.loads(line) for line in json_file.read_text().splitlines()]
+    assert len(lines) == 2
+    assert all(line['module'] == 'proxmox_backup' for line in lines)
+    assert lines[0]['endpoints']['POST nodes/{node}/vzdump']['count'] == len(NODES)
+    assert {'auth', 'discovery', 'submit', 'wait'} <= set(result['metrics']['phases'])
+    assert result['metrics']['requests'] == server.cluster.total_requests() // 3
+
+    text = prom_file.read_text()
+    assert text.endswith('# EOF\n')
+    assert (f'proxmox_backup_api_requests_total{{module="proxmox_backup",endpoint="POST nodes/{{node}}/vzdump"}} '
+            f'{len(NODES)}') in text
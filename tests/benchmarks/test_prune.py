@@ -0,0 +1,42 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Benchmarks of proxmox_backup_prune planning over 10k-100k backups and deleting in parallel."""
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import pytest
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.modules import proxmox_backup_prune
+from ansible_collections.mcfitz2.proxmox_backup.plugins.plugin_utils.controller import run_on_controller
+
+ROUNDS = 3
+GUESTS = 500
+POLICY = dict(keep_last=2, keep_daily=7, keep_weekly=4, keep_monthly=6, keep_yearly=1)
+
+
+def test_plan_check_mode(benchmark, pve, backup_count, api_usage):
+    server = pve(nodes=('pve1', 'pve2', 'pve3'), guests=GUESTS, storages={'pbs': dict(shared=True)},
+                 backups_per_storage=backup_count)
+    args = server.module_args(**POLICY)
+    result = benchmark.pedantic(run_on_controller, args=(proxmox_backup_prune, args), kwargs=dict(check_mode=True),
+                                rounds=ROUNDS, iterations=1)
+    assert not result.get('failed'), result.get('msg')
+    assert len(result['pruned']) + result['kept'] == backup_count
+    assert result['bytes_freed'] == sum(b['size'] for b in result['pruned'])
+    assert not any(b['deleted'] for b in result['pruned'])
+    # nothing is deleted in check mode
+    assert api_usage(server, ROUNDS) == {'GET cluster/resources': 1, 'GET nodes/{node}/storage/{storage}/content': 1}
+
+
+@pytest.mark.parametrize('max_workers', [1, 8])
+def test_prune(benchmark, pve, run_module, api_usage, max_workers):
+    server = pve(nodes=('pve1', 'pve2'), guests=20, backups_per_storage=100)
+    args = server.module_args(keep_last=2, max_workers=max_workers, poll_interval=0.001)
+    result = benchmark.pedantic(run_module, args=(proxmox_backup_prune, args), rounds=1, iterations=1)
+    requests = api_usage(server, 1)
+    # the last two backups of every guest on local of pve1, local of pve2 and the shared pbs
+    assert result['kept'] == 20 * 3 * 2
+    assert all(b['deleted'] for b in result['pruned'])
+    assert requests['DELETE nodes/{node}/storage/{storage}/content/{volume}'] == len(result['pruned'])
+    assert run_module(proxmox_backup_prune, args)['changed'] is False
@@ -0,0 +1,65 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Requests made by the modules when pveproxy fails transiently: GET retries, resumed polls and circuit breaking."""
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import pytest
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.modules import proxmox_backup, proxmox_backup_info
+from ansible_collections.mcfitz2.proxmox_backup.plugins.plugin_utils.controller import run_on_controller
+
+CONTENT = 'nodes/{node}/storage/{storage}/content'
+STATUS = 'nodes/{node}/tasks/{upid}/status'
+FAST = dict(api_retry_backoff=0.001, poll_interval=0.001, max_poll_interval=0.001)
+CLIENTS = pytest.mark.parametrize('client', ['proxmoxer', 'direct'])
+
+
+@CLIENTS
+def test_listing_retried(pve, run_module, client):
+    server = pve(nodes=('pve1',), guests=10, storages={'pbs': dict(shared=True)}, backups_per_storage=100)
+    server.cluster.flaky[CONTENT] = [595, 'Connection refused', 2]
+    args = server.module_args(api_client=client, collect_metrics=True, api_retry_backoff=0.001)
+    result = run_module(proxmox_backup_info, args)
+    assert len(result['backups']) == 100
+    assert server.cluster.requests[f"GET {CONTENT}"] == 3
+    assert result['metrics']['retries'] == 2
+    assert result['metrics']['endpoints'][f"GET {CONTENT}"]['errors'] == 2
+
+
+@CLIENTS
+def test_poll_resumed(pve, run_module, client):
+    server = pve(nodes=('pve1',), guests=3, backups_per_storage=0, task_polls=3)
+    server.cluster.flaky[STATUS] = [503, 'Service Unavailable', 4]
+    args = server.module_args(api_client=client, vmid=[100], storage='pbs', wait=True, api_retries=1, **FAST)
+    result = run_module(proxmox_backup, args)
+    # two polls failed even after their retry; waiting went on from the UPID until the task finished
+    assert result['status']['exitstatus'] == 'OK'
+    assert result['task_stats']['poll_errors'] == 2
+    assert server.cluster.requests[f"GET {STATUS}"] == result['task_stats']['polls'] + 2
+
+
+@CLIENTS
+def test_write_not_retried(pve, client):
+    server = pve(nodes=('pve1',), guests=3, backups_per_storage=0)
+    server.cluster.flaky['nodes/{node}/vzdump'] = [503, 'Service Unavailable', 1]
+    result = run_on_controller(proxmox_backup, server.module_args(api_client=client, vmid=[100], storage='pbs', **FAST))
+    assert result.get('failed')
+    assert server.cluster.requests['POST nodes/{node}/vzdump'] == 1
+
+
+@CLIENTS
+def test_circuit_breaker(pve, client):
+    server = pve(nodes=('pve1',), guests=10, storages={'pbs': dict(shared=True)}, backups_per_storage=100)
+    server.cluster.flaky[CONTENT] = [595, 'Connection refused', 100]
+    args = server.module_args(api_client=client, api_retries=5, api_retry_backoff=0.001,
+                              api_circuit_breaker_threshold=3, api_circuit_breaker_reset=60)
+    result = run_on_controller(proxmox_backup_info, args)
+    assert result.get('failed')
+    assert 'Circuit Open' in str(result)
+    assert server.cluster.requests[f"GET {CONTENT}"] == 3
+    # the host stays cut off for the next task in this process
+    result = run_on_controller(proxmox_backup_info, args)
+    assert 'Circuit Open' in str(result)
+    assert server.cluster.requests[f"GET {CONTENT}"] == 3
@@ -0,0 +1,159 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Benchmarks of proxmox_backup_restore stopping a running guest and restoring over it."""
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import pytest
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.resilience import ResourceException
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.restore_test import allocate_vmid
+from ansible_collections.mcfitz2.proxmox_backup.plugins.modules import proxmox_backup_restore
+from ansible_collections.mcfitz2.proxmox_backup.plugins.plugin_utils.controller import run_on_controller
+
+ROUNDS = 5
+
+
+@pytest.mark.parametrize('vmid', [100, 101], ids=['qemu', 'lxc'])
+def test_restore_running_guest(benchmark, pve, run_module, api_usage, tmp_path, vmid):
+    server = pve(nodes=('pve1', 'pve2'), guests=2, backups_per_storage=2, task_polls=3)
+    backup = server.cluster.storage_backups('pbs', None)[vmid - 100]['volid']
+    args = server.module_args(vmid=vmid, backup=backup, wait=True, start_after_restore=True,
+                              poll_interval=0.001, max_poll_interval=0.001, resource_cache_dir=str(tmp_path))
+    run_module(proxmox_backup_restore, args)
+    server.cluster.reset_counters()
+    result = benchmark.pedantic(run_module, args=(proxmox_backup_restore, args), rounds=ROUNDS, iterations=1)
+    requests = api_usage(server, ROUNDS)
+    assert result['status']['exitstatus'] == 'OK'
+    assert result['node'] == server.cluster.guests[vmid]['node']
+    assert result['progress']['samples'][0]['percent'] == 50
+    # the type and node come from the cached guest list, not from probing the guest
+    assert 'GET cluster/resources' not in requests
+    assert 'GET nodes/{node}/{kind}/{vmid}' not in requests
+    assert requests['POST nodes/{node}/{kind}/{vmid}/status/{action}'] == 1
+    assert sum(v for k, v in requests.items() if k.endswith('/create')) == 1
+
+
+@pytest.mark.parametrize('guests', [16, 120])
+def test_bulk_restore(benchmark, pve, run_module, api_usage, tmp_path, guests):
+    server = pve(nodes=('pve1', 'pve2', 'pve3', 'pve4'), guests=guests, backups_per_storage=guests, task_polls=3)
+    restores = [dict(vmid=b['vmid'], backup=b['volid']) for b in server.cluster.storage_backups('pbs', None)]
+    args = server.module_args(restores=restores, wait=True, max_concurrent_per_node=2, bandwidth_budget=100000,
+                              hard_stop=True, poll_interval=0.001, max_poll_interval=0.001,
+                              resource_cache_dir=str(tmp_path))
+    result = benchmark.pedantic(run_module, args=(proxmox_backup_restore, args), rounds=1, iterations=1)
+    api_usage(server, 1)
+    benchmark.extra_info['rto'] = result['rto']
+    assert len(result['restores']) == guests
+    assert all(r['status']['exitstatus'] == 'OK' for r in result['restores'])
+    assert all(r['stop']['stopped'] and r['stop']['method'] == 'stop' for r in result['restores'])
+    assert max(r['running_on_node'] for r in server.cluster.restores) < 2
+    assert max(r['running_bwlimit'] + r['bwlimit'] for r in server.cluster.restores) <= 100000
+
+
+@pytest.mark.parametrize('guests', [16, 120])
+def test_bulk_stop_escalation(benchmark, pve, run_module, api_usage, tmp_path, guests):
+    # every other guest ignores the shutdown request and has to be stopped
+    stubborn = set(range(100, 100 + guests, 2))
+    server = pve(nodes=('pve1', 'pve2', 'pve3', 'pve4'), guests=guests, backups_per_storage=guests, task_polls=3,
+                 ignore_shutdown=stubborn)
+    restores = [dict(vmid=b['vmid'], backup=b['volid']) for b in server.cluster.storage_backups('pbs', None)]
+    args = server.module_args(restores=restores, wait=True, try_hard_stop=True, shutdown_timeout=3,
+                              poll_interval=0.001, max_poll_interval=0.05, resource_cache_dir=str(tmp_path))
+    result = benchmark.pedantic(run_module, args=(proxmox_backup_restore, args), rounds=1, iterations=1)
+    requests = api_usage(server, 1)
+    stops = dict((r['vmid'], r['stop']) for r in result['restores'])
+    assert all(r['status']['exitstatus'] == 'OK' for r in result['restores'])
+    assert set(vmid for vmid, stop in stops.items() if stop['escalated']) == stubborn
+    assert all(stops[vmid]['method'] == 'stop' and stops[vmid]['duration'] >= 3 for vmid in stubborn)
+    # the shutdowns run side by side, so escalating all of them costs one timeout
+    assert max(stop['duration'] for stop in stops.values()) < 9
+    assert requests['DELETE nodes/{node}/tasks/{upid}/delete'] == len(stubborn)
+
+
+@pytest.mark.parametrize('backups', [8, 40])
+def test_restore_tests(benchmark, pve, run_module, api_usage, backups):
+    server = pve(nodes=('pve1', 'pve2'), guests=8, backups_per_storage=backups, task_polls=3, boot_pings=3)
+    tests = [dict(backup=b['volid'], node='pve1') for b in server.cluster.storage_backups('pbs', None)]
+    args = server.module_args(restore_tests=tests, max_concurrent_restores=4, boot_timeout=30,
+                              poll_interval=0.001, max_poll_interval=0.001)
+    result = benchmark.pedantic(run_module, args=(proxmox_backup_restore, args), rounds=1, iterations=1)
+    api_usage(server, 1)
+    benchmark.extra_info['rto'] = result['rto_summary']
+    results = result['restore_tests']
+    assert all(r['booted'] and r['torn_down'] and r['error'] is None for r in results)
+    assert [r['boot_check'] for r in results] == ['agent' if r['resource_type'] == 'qemu' else 'status'
+                                                  for r in results]
+    # every test got its own scratch VMID, the guests being backed up are left alone and the scratch ones are gone
+    assert len(set(r['vmid'] for r in results)) == backups
+    assert not set(r['vmid'] for r in results) & set(range(100, 108))
+    assert sorted(server.cluster.guests) == list(range(100, 108))
+    assert all(r['unique'] and not r['force'] for r in server.cluster.restores)
+    assert max(r['running'] for r in server.cluster.restores) < 4
+    # the guests booted with every network interface unplugged
+    assert len(server.cluster.boots) == backups
+    assert all('link_down=1' in net.split(',') for boot in server.cluster.boots for net in boot['net'].values())
+    summary = result['rto_summary']
+    assert summary['count'] == backups
+    assert summary['p50'] <= summary['p90'] <= summary['p95'] <= summary['p99'] == summary['max']
+
+
+def test_restore_tests_boot_timeout(pve):
+    # the guest agent of the VMs never answers, the containers still count as booted once running
+    server = pve(nodes=('pve1',), guests=2, backups_per_storage=2, task_polls=1, boot_pings=10 ** 9)
+    tests = [dict(backup=b['volid']) for b in server.cluster.storage_backups('pbs', None)]
+    args = server.module_args(restore_tests=tests, node='pve1', boot_timeout=1, keep_failed=True,
+                              poll_interval=0.001, max_poll_interval=0.01)
+    result = run_on_controller(proxmox_backup_restore, args)
+    assert result.get('failed')
+    qemu, lxc = result['restore_tests']
+    assert 'did not boot within 1s' in qemu['error'] and not qemu['booted'] and not qemu['torn_down']
+    assert lxc['booted'] and lxc['torn_down']
+    # the failed scratch guest is kept for investigation
+    assert sorted(server.cluster.guests) == [100, 101, qemu['vmid']]
+    assert result['rto_summary']['count'] == 1
+
+
+def test_restore_tests_boot_polling(pve):
+    # the poll backoff has grown by the time the guests start, they are still checked every 50ms until they boot
+    server = pve(nodes=('pve1',), guests=2, backups_per_storage=2, task_polls=3, boot_pings=3)
+    tests = [dict(backup=b['volid']) for b in server.cluster.storage_backups('pbs', None)]
+    args = server.module_args(restore_tests=tests, node='pve1', poll_interval=0.05, max_poll_interval=1)
+    result = run_on_controller(proxmox_backup_restore, args)
+    assert all(r['booted'] for r in result['restore_tests'])
+    # 1.5s and more when the boot checks follow the backoff
+    assert max(r['time_to_boot'] for r in result['restore_tests']) < 0.6
+
+
+def test_allocate_vmid(pve, api_client):
+    server = pve(nodes=('pve1',), guests=2, backups_per_storage=0)
+    del server.cluster.guests[100]
+    proxmox = api_client(server)
+    # 100 was handed out earlier in the run and 101 is in use, so 102 is the next free VMID
+    reserved = {100}
+    assert allocate_vmid(proxmox, reserved) == 102
+    assert reserved == {100, 102}
+    assert server.cluster.requests['GET cluster/nextid'] == 3
+
+
+class DeniedNextid:
+    """/cluster/nextid of a user who may only ask for the next free VMID."""
+
+    def __init__(self):
+        self.probes = 0
+
+    def get(self, vmid=None):
+        if vmid is None:
+            return '100'
+        self.probes += 1
+        raise ResourceException(403, 'Forbidden', 'Permission check failed')
+
+
+def test_allocate_vmid_error():
+    # only a VMID in use moves on to the next one, other errors are not retried as if it was
+    nextid = DeniedNextid()
+    proxmox = type('Proxmox', (), dict(cluster=type('Cluster', (), dict(nextid=nextid))))
+    with pytest.raises(ResourceException, match='403 Forbidden'):
+        allocate_vmid(proxmox, {100})
+    assert nextid.probes == 1
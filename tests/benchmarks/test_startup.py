@@ -0,0 +1,70 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Start-up cost of the modules run as their own process, and the direct API client that skips requests."""
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import pytest
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils import proxmox
+from ansible_collections.mcfitz2.proxmox_backup.plugins.modules import proxmox_backup_info
+from ansible_collections.mcfitz2.proxmox_backup.plugins.plugin_utils.controller import run_on_controller
+
+ROUNDS = 5
+MODULES = ['proxmox_backup', 'proxmox_backup_compliance', 'proxmox_backup_info', 'proxmox_backup_prune',
+           'proxmox_backup_restore', 'proxmox_backup_verify', 'proxmox_task_wait']
+# Loaded only when a task builds a proxmoxer client.
+DEFERRED = ('requests', 'urllib3', 'proxmoxer.backends.https')
+
+
+@pytest.mark.parametrize('name', MODULES)
+def test_module_import(benchmark, import_cost, name):
+    """Wall time of a new interpreter importing the module, with its import time and peak memory."""
+    probes = []
+    benchmark.pedantic(lambda: probes.append(import_cost(name, DEFERRED)), rounds=ROUNDS, iterations=1)
+    benchmark.extra_info.update(import_seconds=round(min(p['seconds'] for p in probes), 4),
+                                peak_memory=min(p['peak_memory'] for p in probes))
+    assert all(p['loaded'] == [] for p in probes)
+
+
+@pytest.mark.parametrize('client', ['proxmoxer', 'direct'])
+def test_task_startup(benchmark, pve, peak_memory, client):
+    """Wall time and peak memory of a short proxmox_backup_info task run as its own process."""
+    server = pve(nodes=('pve1',), guests=10, storages={'pbs': dict(shared=True)}, backups_per_storage=20)
+    args = server.module_args(api_client=client, vmid=100)
+    peak = benchmark.pedantic(peak_memory, args=('proxmox_backup_info', args), rounds=ROUNDS, iterations=1)
+    benchmark.extra_info['peak_memory'] = peak
+
+
+def test_direct_client(pve, run_module, tmp_path):
+    server = pve(nodes=('pve1', 'pve2'), guests=10, storages={'pbs': dict(shared=True)}, backups_per_storage=50)
+    expected = run_module(proxmox_backup_info, server.module_args(limit=2))
+    requests = dict(server.cluster.requests)
+    server.cluster.reset_counters()
+    result = run_module(proxmox_backup_info, server.module_args(api_client='direct', limit=2, collect_metrics=True))
+    assert result['backups'] == expected['backups']
+    assert dict(server.cluster.requests) == requests
+    assert result['metrics']['requests'] == sum(requests.values())
+    # API tokens do not log in
+    server.cluster.logins = 0
+    args = server.module_args(api_client='direct', limit=2, api_token_id='backup', api_token_secret='secret')
+    assert run_module(proxmox_backup_info, args)['backups'] == result['backups']
+    assert server.cluster.logins == 0
+    # another client reuses the cached ticket, and logs in again once Proxmox rejects it
+    args = server.module_args(api_client='direct', limit=2, ticket_cache=True, ticket_cache_dir=str(tmp_path))
+    for timeout in (30, 31):
+        run_module(proxmox_backup_info, dict(args, timeout=timeout))
+    assert server.cluster.logins == 1
+    server.cluster.tickets.clear()
+    assert run_module(proxmox_backup_info, dict(args, timeout=32))['backups'] == result['backups']
+    assert server.cluster.logins == 2
+
+
+def test_unsupported_proxmoxer(pve, run_module, monkeypatch):
+    # the proxmoxer client relies on internals of proxmoxer 2.x, the direct client does not need it
+    server = pve(nodes=('pve1',), guests=2, backups_per_storage=4)
+    monkeypatch.setattr(proxmox, 'PROXMOXER_VERSION', '3.0.0')
+    result = run_on_controller(proxmox_backup_info, server.module_args(timeout=33))
+    assert result['failed'] and 'proxmoxer 3.0.0 is not supported' in result['msg']
+    assert run_module(proxmox_backup_info, server.module_args(api_client='direct', timeout=33))['backups']
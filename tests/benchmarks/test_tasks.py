@@ -0,0 +1,93 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Benchmarks of the task polling loops against the mock API.
+
+Sleeping between polls is disabled, so wall time is the cost of the polls
+themselves (plus the ``--pve-latency`` of every request).
+"""
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import pytest
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.module_utils.tasks import (
+    LOG_PAGE_SIZE,
+    TaskPoller,
+    TaskWatcher,
+    task_handle,
+)
+from ansible_collections.mcfitz2.proxmox_backup.plugins.modules import proxmox_task_wait
+from ansible_collections.mcfitz2.proxmox_backup.plugins.plugin_utils.controller import run_on_controller
+
+ROUNDS = 5
+STATUS = 'GET nodes/{node}/tasks/{upid}/status'
+LOG = 'GET nodes/{node}/tasks/{upid}/log'
+
+
+def no_sleep(seconds):
+    pass
+
+
+@pytest.mark.parametrize('log_lines', [10, 5000], ids=['short-log', 'long-log'])
+def test_task_watcher(benchmark, pve, api_client, api_usage, log_lines):
+    server = pve(task_polls=20)
+    proxmox = api_client(server)
+    lines = [f"INFO: line {i}" for i in range(log_lines)]
+
+    def start_task():
+        upid = server.cluster.new_task('pve1', 'vzdump', 100, lines)
+        return (TaskWatcher(proxmox, 'pve1', upid, sleep=no_sleep),), {}
+
+    server.cluster.reset_counters()
+    watcher = benchmark.pedantic(lambda w: w.wait() and w, setup=start_task, rounds=ROUNDS, iterations=1)
+    requests = api_usage(server, ROUNDS)
+    assert requests[STATUS] == 20
+    # every log line is transferred once: one request per poll plus one per extra full page
+    assert requests[LOG] == 20 + log_lines // LOG_PAGE_SIZE
+    assert watcher.log_offset == log_lines + 1
+
+
+@pytest.mark.parametrize('tasks', [10, 200])
+def test_task_poller(benchmark, pve, api_client, api_usage, tasks):
+    server = pve(nodes=('pve1', 'pve2', 'pve3', 'pve4'), task_polls=5)
+    proxmox = api_client(server)
+
+    def start_tasks():
+        poller = TaskPoller(sleep=no_sleep)
+        for i in range(tasks):
+            node = server.cluster.nodes[i % 4]
+            poller.add(TaskWatcher(proxmox, node, server.cluster.new_task(node, 'vzdump', 100 + i, ['INFO: ok'])))
+        return (poller,), {}
+
+    server.cluster.reset_counters()
+    poller = benchmark.pedantic(lambda p: list(p.wait_all()) and p, setup=start_tasks, rounds=ROUNDS, iterations=1)
+    requests = api_usage(server, ROUNDS)
+    assert poller.rounds == 5
+    assert requests[STATUS] == 5 * tasks
+
+
+def test_task_watcher_empty_log(pve, api_client):
+    # Proxmox answers a poll of an empty log with a "no content" line 1, which must not move the cursor
+    server = pve(task_polls=3)
+    upid = server.cluster.new_task('pve1', 'vzdump', 100, [])
+    watcher = TaskWatcher(api_client(server), 'pve1', upid, sleep=no_sleep)
+    assert not watcher.poll()
+    assert (watcher.log_offset, list(watcher.log)) == (0, [])
+    server.cluster.tasks[upid]['lines'].append('INFO: starting new backup job: vzdump 100 --storage pbs')
+    watcher.wait()
+    assert list(watcher.log) == ['INFO: starting new backup job: vzdump 100 --storage pbs', 'TASK OK']
+    assert watcher.log_offset == 2
+
+
+def test_task_wait_warnings(pve, run_module):
+    # vzdump ends with warnings when the guest agent fails to freeze the file systems, the backup was still made
+    server = pve(task_polls=2)
+    lines = ['INFO: starting new backup job: vzdump 100 --storage pbs', 'WARN: guest-fsfreeze-freeze timed out']
+    tasks = [server.cluster.new_task('pve1', 'vzdump', 100, lines, 'WARNINGS: 1'),
+             server.cluster.new_task('pve1', 'vzdump', 101, lines[:1])]
+    result = run_module(proxmox_task_wait, server.module_args(tasks=[task_handle('pve1', upid) for upid in tasks]))
+    assert (result['failed_tasks'], result['warning_tasks']) == (0, 1)
+    failing = server.cluster.new_task('pve1', 'vzdump', 102, lines[:1], 'job errors')
+    result = run_on_controller(proxmox_task_wait, server.module_args(tasks=[task_handle('pve1', failing)]))
+    assert result['failed'] and (result['failed_tasks'], result['warning_tasks']) == (1, 0)
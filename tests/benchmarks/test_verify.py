@@ -0,0 +1,58 @@
+# Copyright: (c) 2024, Micah Fitzgerald (@mcfitz2)
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Benchmarks of proxmox_backup_verify reading sampled backups, and of repeat runs answered by its cache."""
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import json
+
+import pytest
+
+from ansible_collections.mcfitz2.proxmox_backup.plugins.modules import proxmox_backup_verify
+from ansible_collections.mcfitz2.proxmox_backup.plugins.plugin_utils.controller import run_on_controller
+
+EXTRACT = 'GET nodes/{node}/vzdump/extractconfig'
+
+
+@pytest.mark.parametrize('guests', [20, 200])
+def test_verify_sample(benchmark, pve, run_module, api_usage, tmp_path, guests):
+    server = pve(nodes=('pve1', 'pve2'), guests=guests, storages={'pbs': dict(shared=True)},
+                 backups_per_storage=guests * 5)
+    args = server.module_args(storage='pbs', latest=1, older=2, seed=1, max_workers=8, cache_dir=str(tmp_path),
+                              progress_file=str(tmp_path / 'progress.jsonl'))
+    first = run_module(proxmox_backup_verify, args)
+    assert first['summary'] == dict(ok=guests * 3, failed=0, unverified=0, cached=0)
+    assert server.cluster.requests[EXTRACT] == guests * 3
+    with open(tmp_path / 'progress.jsonl') as f:
+        progress = [json.loads(line) for line in f]
+    assert [p['done'] for p in progress] == list(range(1, guests * 3 + 1))
+    server.cluster.reset_counters()
+    # the same sample again is answered from the cache, reading only the storage listing
+    result = benchmark.pedantic(run_module, args=(proxmox_backup_verify, args), rounds=3, iterations=1)
+    assert result['summary']['cached'] == guests * 3
+    assert api_usage(server, 3) == {'GET cluster/resources': 1, 'GET nodes/{node}/storage/{storage}/content': 1}
+
+
+def test_verify_failures(pve, tmp_path):
+    server = pve(nodes=('pve1',), guests=4, storages={'pbs': dict(shared=True), 'local': dict(shared=False)},
+                 backups_per_storage=8)
+    pbs = server.cluster.storage_backups('pbs', None)
+    local = server.cluster.storage_backups('local', 'pve1')
+    pbs[0]['verification'] = dict(state='failed', upid='UPID:pbs:verify')
+    pbs[1]['verification'] = dict(state='ok', upid='UPID:pbs:verify')
+    server.cluster.corrupt_backups.add(local[2]['volid'])
+    missing = 'local:backup/vzdump-qemu-999-2024_01_01-00_00_00.vma.zst'
+    volids = [pbs[0]['volid'], pbs[1]['volid'], pbs[2]['volid'], local[2]['volid'], missing]
+    args = server.module_args(volids=volids, require_server_verification=True, cache_dir=str(tmp_path),
+                              api_retries=0)
+    result = run_on_controller(proxmox_backup_verify, args)
+    assert result.get('failed')
+    assert [b['state'] for b in result['backups']] == ['failed', 'ok', 'unverified', 'failed']
+    assert [b['method'] for b in result['backups']] == ['pbs', 'pbs', 'pbs', 'header']
+    assert 'vma extent header' in result['backups'][3]['error']
+    assert result['missing'] == [missing]
+    # the snapshot the backup server found corrupt is not read
+    assert server.cluster.requests[EXTRACT] == 3
+    # the VMIDs of the volids, 100 to 102 and 999, are looked up with filtered listings of both storages
+    assert server.cluster.requests['GET nodes/{node}/storage/{storage}/content'] == 8